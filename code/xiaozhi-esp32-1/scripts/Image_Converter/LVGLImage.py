@@ -1,8 +1,12 @@
 #!/usr/bin/env python3
 import os
+import mmap
+import bisect
+import shutil
 import logging
 import argparse
 import subprocess
+import concurrent.futures
 from os import path
 from enum import Enum
 from typing import List
@@ -18,6 +22,12 @@ try:
 except ImportError:
     raise ImportError("Need lz4 package, do `pip3 install lz4`")
 
+try:
+    import numpy as np
+except ImportError:
+    # numpy is optional, pure python code paths are used without it
+    np = None
+
 
 def uint8_t(val) -> bytes:
     return val.to_bytes(1, byteorder='little')
@@ -96,10 +106,247 @@ class PngQuant:
         return compressed
 
 
+class PaletteQuantizer:
+    """
+    Quantize RGBA image to a palette of at most ncolors in process, replaces
+    `pngquant`. Colors are split by weighted median cut and refined with a few
+    k-means iterations. Optional dithering uses an ordered 8x8 bayer pattern.
+    Result only depends on the input, same image always gets same palette.
+    """
+
+    BAYER8 = [
+        0, 32, 8, 40, 2, 34, 10, 42,
+        48, 16, 56, 24, 50, 18, 58, 26,
+        12, 44, 4, 36, 14, 46, 6, 38,
+        60, 28, 52, 20, 62, 30, 54, 22,
+        3, 35, 11, 43, 1, 33, 9, 41,
+        51, 19, 59, 27, 49, 17, 57, 25,
+        15, 47, 7, 39, 13, 45, 5, 37,
+        63, 31, 55, 23, 61, 29, 53, 21,
+    ]
+
+    def __init__(self, ncolors=256, dither=True, iterations=4) -> None:
+        if np is None:
+            raise ImportError("Need numpy package, do `pip3 install numpy`")
+        if not 2 <= ncolors <= 256:
+            raise ParameterError(f"Invalid palette size: {ncolors}")
+        self.ncolors = ncolors
+        self.dither = dither
+        self.iterations = iterations
+
+    def quantize(self, rgba: "np.ndarray"):
+        """
+        Return palette as list of tuple(R,G,B,A) and a (h, w) uint8 array of
+        palette index for a (h, w, 4) RGBA image.
+        """
+        h, w = rgba.shape[:2]
+        pixels = np.array(rgba, dtype=np.uint8).reshape(-1, 4)
+        pixels[pixels[:, 3] == 0] = 0  # all transparent pixels are the same
+
+        packed = pixels.view(np.uint32).reshape(-1)
+        colors, inverse, counts = np.unique(packed, return_inverse=True,
+                                            return_counts=True)
+        inverse = inverse.reshape(-1)
+        colors = colors.view(np.uint8).reshape(-1, 4)
+        if len(colors) <= self.ncolors:
+            # no loss, use the colors as palette directly
+            palette = [tuple(int(v) for v in c) for c in colors]
+            return palette, inverse.astype(np.uint8).reshape(h, w)
+
+        colors = colors.astype(np.float32)
+        weights = counts.astype(np.float64)
+        palette = self._median_cut(colors, weights)
+        for _ in range(self.iterations):
+            palette = self._refine(colors, weights, palette)
+
+        palette = np.clip(np.rint(palette), 0, 255)
+        if self.dither:
+            dithered = self._dithered(pixels, h, w, palette)
+            index = self._nearest(dithered, palette)
+        else:
+            index = self._nearest(colors, palette)[inverse]
+
+        palette = [tuple(int(v) for v in c) for c in palette]
+        return palette, index.astype(np.uint8).reshape(h, w)
+
+    def _median_cut(self, colors, weights):
+        def box(idx):
+            c = colors[idx]
+            wt = weights[idx]
+            mean = (c * wt[:, None]).sum(axis=0) / wt.sum()
+            var = (wt[:, None] * (c - mean)**2).sum(axis=0)
+            return [idx, mean, var, var.sum()]
+
+        boxes = [box(np.arange(len(colors)))]
+        while len(boxes) < self.ncolors:
+            # split the box with largest error, at weighted median of the
+            # channel with largest variance
+            i = max(range(len(boxes)), key=lambda i: boxes[i][3])
+            idx, _, var, error = boxes[i]
+            if error <= 0:
+                break
+
+            channel = int(np.argmax(var))
+            idx = idx[np.argsort(colors[idx, channel], kind="stable")]
+            cumsum = np.cumsum(weights[idx])
+            cut = int(np.searchsorted(cumsum, cumsum[-1] / 2))
+            cut = min(max(cut, 0), len(idx) - 2) + 1
+            boxes[i:i + 1] = [box(idx[:cut]), box(idx[cut:])]
+
+        return np.array([b[1] for b in boxes], dtype=np.float32)
+
+    def _refine(self, colors, weights, palette):
+        index = self._nearest(colors, palette)
+        total = np.zeros(palette.shape, dtype=np.float64)
+        np.add.at(total, index, colors * weights[:, None])
+        count = np.bincount(index, weights=weights, minlength=len(palette))
+        used = count > 0
+        palette = palette.copy()
+        palette[used] = total[used] / count[used, None]
+        return palette
+
+    def _nearest(self, colors, palette, chunk=16384):
+        palette = palette.astype(np.float32)
+        palette_norm = (palette**2).sum(axis=1)
+        index = np.empty(len(colors), dtype=np.int64)
+        for start in range(0, len(colors), chunk):
+            c = colors[start:start + chunk].astype(np.float32)
+            dist = palette_norm[None, :] - 2 * (c @ palette.T)
+            index[start:start + chunk] = np.argmin(dist, axis=1)
+        return index
+
+    def _dithered(self, pixels, h, w, palette):
+        bayer = np.array(self.BAYER8, dtype=np.float32).reshape(8, 8)
+        bayer = (bayer + 0.5) / 64 - 0.5
+        y, x = np.mgrid[0:h, 0:w]
+
+        # dither amplitude follows the typical distance between palette colors
+        rgb = palette[:, :3].astype(np.float32)
+        dist = ((rgb[:, None, :] - rgb[None, :, :])**2).sum(axis=2)
+        np.fill_diagonal(dist, np.inf)
+        spread = float(np.median(np.sqrt(dist.min(axis=1))))
+        offset = (bayer[y & 7, x & 7] * spread).reshape(-1, 1)
+        colors = pixels.astype(np.float32)
+        visible = colors[:, 3:4] > 0
+        colors[:, :3] += np.where(visible, offset, 0)
+        return colors
+
+
+class ResizeFilter(Enum):
+    NEAREST = "NEAREST"
+    BOX = "BOX"
+    BILINEAR = "BILINEAR"
+    BICUBIC = "BICUBIC"
+    LANCZOS = "LANCZOS"
+
+
+class Resampler:
+    """
+    Resize RGBA image array with a separable filter. Colors are weighted by
+    alpha, so transparent pixels do not bleed into the edges. The filter is
+    widened when down scaling, every source pixel contributes to the output.
+    """
+
+    def __init__(self, filter: ResizeFilter = ResizeFilter.BILINEAR) -> None:
+        if np is None:
+            raise ImportError("Need numpy package, do `pip3 install numpy`")
+        self.filter = filter
+
+    @staticmethod
+    def fit(w: int, h: int, max_w: int, max_h: int):
+        """
+        Return the largest size within max_w x max_h with aspect ratio of
+        w x h, 0 for max_w or max_h means no limit in that direction
+        """
+        scale = min(max_w / w if max_w else float("inf"),
+                    max_h / h if max_h else float("inf"))
+        if scale == float("inf"):
+            return w, h
+        return max(1, round(w * scale)), max(1, round(h * scale))
+
+    def _kernel(self, x: "np.ndarray"):
+        x = np.abs(x)
+        if self.filter == ResizeFilter.BOX:
+            return (x < 0.5).astype(np.float64) + (x == 0.5) * 0.5
+        if self.filter == ResizeFilter.BILINEAR:
+            return np.maximum(1 - x, 0)
+        if self.filter == ResizeFilter.BICUBIC:
+            a = -0.5
+            return np.where(
+                x < 1, ((a + 2) * x - (a + 3)) * x * x + 1,
+                np.where(x < 2, (((x - 5) * x + 8) * x - 4) * a, 0))
+        if self.filter == ResizeFilter.LANCZOS:
+            return np.where(x < 3, np.sinc(x) * np.sinc(x / 3), 0)
+        raise ParameterError(f"Invalid resize filter: {self.filter}")
+
+    def weights(self, src: int, dst: int) -> "np.ndarray":
+        """
+        Return (dst, src) matrix, row i is the weight of each source pixel
+        for output pixel i
+        """
+        scale = src / dst
+        center = (np.arange(dst) + 0.5) * scale
+        if self.filter == ResizeFilter.NEAREST:
+            matrix = np.zeros((dst, src), dtype=np.float32)
+            index = np.minimum(center.astype(np.int64), src - 1)
+            matrix[np.arange(dst), index] = 1
+            return matrix
+
+        support = max(scale, 1.0)
+        x = (np.arange(src) + 0.5)[None, :] - center[:, None]
+        matrix = self._kernel(x / support)
+        total = matrix.sum(axis=1, keepdims=True)
+        matrix /= np.where(total == 0, 1, total)
+        return matrix.astype(np.float32)
+
+    def resize(self, rgba: "np.ndarray", w: int, h: int) -> "np.ndarray":
+        """
+        Return (h, w, 4) uint8 array of RGBA image resized to w x h
+        """
+        if w <= 0 or h <= 0 or w > 0xffff or h > 0xffff:
+            raise ParameterError(f"Invalid image size: {w}x{h}")
+
+        src_h, src_w = rgba.shape[:2]
+        if (src_w, src_h) == (w, h):
+            return rgba
+
+        if self.filter == ResizeFilter.NEAREST:
+            ys = np.minimum(((np.arange(h) + 0.5) * src_h / h).astype(np.int64),
+                            src_h - 1)
+            xs = np.minimum(((np.arange(w) + 0.5) * src_w / w).astype(np.int64),
+                            src_w - 1)
+            return rgba[ys[:, None], xs[None, :]]
+
+        pixels = rgba.astype(np.float32)
+        alpha = pixels[:, :, 3:4] / 255
+        pixels[:, :, :3] *= alpha
+
+        wy = self.weights(src_h, h)
+        wx = self.weights(src_w, w)
+        pixels = (wy @ pixels.reshape(src_h, -1)).reshape(h, src_w, 4)
+        pixels = (pixels.transpose(0, 2, 1) @ wx.T).transpose(0, 2, 1)
+
+        alpha = np.clip(pixels[:, :, 3:4], 0, 255)
+        visible = alpha > 0
+        pixels[:, :, :3] = np.where(
+            visible, pixels[:, :, :3] * 255 / np.where(visible, alpha, 1), 0)
+        pixels[:, :, 3:4] = alpha
+        return np.clip(np.rint(pixels), 0, 255).astype(np.uint8)
+
+
 class CompressMethod(Enum):
     NONE = 0x00
     RLE = 0x01
     LZ4 = 0x02
+    # Not supported by LVGL. LZ4 compressed row bands with an index, so a band
+    # can be decompressed independently.
+    LZ4_BANDED = 0x82
+    # Choose from NONE/RLE/LZ4 with CompressPolicy, never written to file
+    AUTO = 0xFF
+
+
+# default rows per band for CompressMethod.LZ4_BANDED
+LZ4_BAND_ROWS = 16
 
 
 class ColorFormat(Enum):
@@ -209,10 +456,146 @@ def bit_extend(value, bpp):
     return res
 
 
+def bit_extend_np(values, bpp):
+    """
+    Vectorized version of bit_extend, operates on a numpy integer array.
+    """
+    values = values.astype(np.uint16)
+    res = values.copy()
+    bpp_now = bpp
+    while bpp_now < 8:
+        res |= values << (8 - bpp_now)
+        bpp_now += bpp
+
+    return res.astype(np.uint8)
+
+
+def rows_to_array(rows, w: int, h: int, planes: int = 4) -> "np.ndarray":
+    """
+    Join png rows of 8bit values to a numpy array of shape (h, w, planes)
+    """
+    buf = bytearray()
+    for row in rows:
+        buf.extend(row)
+    return np.frombuffer(buf, dtype=np.uint8).reshape(h, w, planes)
+
+
+def read_png_rgba(filename: str) -> "np.ndarray":
+    """
+    Decode png file to (h, w, 4) uint8 RGBA array
+    """
+    if np is None:
+        raise ImportError("Need numpy package, do `pip3 install numpy`")
+    w, h, rows, _ = png.Reader(filename=str(filename)).asRGBA8()
+    return rows_to_array(rows, w, h)
+
+
+def pack_bits_np(values: "np.ndarray", bpp: int) -> "np.ndarray":
+    """
+    Pack 2-D array of bpp values to bytes row by row, MSB first, every row is
+    padded to whole bytes. Same as png.pack_rows.
+    """
+    h, w = values.shape
+    spb = 8 // bpp  # samples per byte
+    padded = np.zeros((h, (w + spb - 1) // spb * spb), dtype=np.uint8)
+    padded[:, :w] = values
+    if bpp == 1:
+        return np.packbits(padded, axis=1)
+
+    padded = padded.reshape(h, -1, spb)
+    packed = np.zeros(padded.shape[:2], dtype=np.uint8)
+    for i in range(spb):
+        packed |= padded[:, :, i] << (8 - bpp * (i + 1))
+    return packed
+
+
+def color_pre_multiply_np(rgb: "np.ndarray", a: "np.ndarray", background):
+    """
+    Vectorized color_pre_multiply, rgb has shape (..., 3), a has shape (...)
+    """
+    bg = np.array([(background >> 16) & 0xff, (background >> 8) & 0xff,
+                   background & 0xff], dtype=np.uint32)
+    a = a[..., None].astype(np.uint32)
+    return ((rgb * a + (255 - a) * bg) >> 8).astype(np.uint8)
+
+
 def unpack_colors(data: bytes, cf: ColorFormat, w) -> List:
     """
     Unpack lvgl 1/2/4/8/16/32 bpp color to png color: alpha map, grey scale,
-    or R,G,B,(A) map
+    or R,G,B,(A) map.
+    Return a flat numpy uint8 array if numpy is available, otherwise a list.
+    """
+    if np is not None:
+        return unpack_colors_np(data, cf, w)
+    return unpack_colors_py(data, cf, w)
+
+
+def unpack_colors_np(data: bytes, cf: ColorFormat, w) -> "np.ndarray":
+    """
+    Same as unpack_colors_py, but unpack the whole buffer with numpy array
+    operations instead of per-pixel python loops.
+    """
+    buf = np.frombuffer(data, dtype=np.uint8)
+    bpp = cf.bpp
+    if bpp == 8:
+        return buf
+    elif bpp < 8:
+        # every row is packed to whole bytes, unused bits at row end are
+        # padding
+        stride = (w * bpp + 7) // 8
+        rows = buf[:len(buf) // stride * stride].reshape(-1, stride)
+        if bpp == 1:
+            values = np.unpackbits(rows, axis=1)
+        else:
+            shifts = np.arange(8 - bpp, -1, -bpp, dtype=np.uint8)
+            values = (rows[:, :, None] >> shifts) & ((1 << bpp) - 1)
+            values = values.reshape(rows.shape[0], -1)
+        values = values[:, :w]
+        if cf.is_alpha_only:
+            # A1/A2/A4 scaled to 0..255: x * 255, x * 85, x * 17
+            values = values * (255 // ((1 << bpp) - 1))
+        return np.ascontiguousarray(values, dtype=np.uint8).reshape(-1)
+
+    if cf == ColorFormat.RGB565A8:
+        alpha_size = len(buf) // 3
+        pixel_alpha = buf[len(buf) - alpha_size:]
+        pixel_data = buf[:2 * alpha_size]
+        pixels = pixel_data[0::2].astype(np.uint16)
+        pixels |= pixel_data[1::2].astype(np.uint16) << 8
+        ret = np.empty((alpha_size, 4), dtype=np.uint8)
+        ret[:, 3] = pixel_alpha
+    elif bpp == 16:
+        #  This is RGB565
+        n = len(buf) // 2
+        pixels = buf[0:2 * n:2].astype(np.uint16)
+        pixels |= buf[1:2 * n:2].astype(np.uint16) << 8
+        ret = np.empty((n, 3), dtype=np.uint8)
+    elif cf == ColorFormat.RGB888:
+        # B,G,R to R,G,B
+        return np.ascontiguousarray(
+            buf[:len(buf) // 3 * 3].reshape(-1, 3)[:, ::-1]).reshape(-1)
+    elif cf == ColorFormat.ARGB8565:
+        pixel = buf[:len(buf) // 3 * 3].reshape(-1, 3)
+        pixels = pixel[:, 0].astype(np.uint16)
+        pixels |= pixel[:, 1].astype(np.uint16) << 8
+        ret = np.empty((len(pixel), 4), dtype=np.uint8)
+        ret[:, 3] = pixel[:, 2]
+    elif bpp == 32:
+        # B,G,R,A to R,G,B,A
+        pixel = buf[:len(buf) // 4 * 4].reshape(-1, 4)
+        return np.ascontiguousarray(pixel[:, [2, 1, 0, 3]]).reshape(-1)
+    else:
+        assert 0
+
+    ret[:, 0] = bit_extend_np((pixels >> 11) & 0x1f, 5)  # R
+    ret[:, 1] = bit_extend_np((pixels >> 5) & 0x3f, 6)  # G
+    ret[:, 2] = bit_extend_np((pixels >> 0) & 0x1f, 5)  # B
+    return ret.reshape(-1)
+
+
+def unpack_colors_py(data: bytes, cf: ColorFormat, w) -> List:
+    """
+    Pure python implementation of unpack_colors, return a list.
     """
     ret = []
     bpp = cf.bpp
@@ -250,7 +633,7 @@ def unpack_colors(data: bytes, cf: ColorFormat, w) -> List:
                 ret.append(values[(p >> (7 - i)) & 0x01])
                 if len(ret) % w == 0:
                     break
-    elif bpp == 16:
+    elif bpp == 16 and cf != ColorFormat.RGB565A8:
         #  This is RGB565
         pixels = [(data[2 * i + 1] << 8) | data[2 * i]
                   for i in range(len(data) // 2)]
@@ -259,7 +642,7 @@ def unpack_colors(data: bytes, cf: ColorFormat, w) -> List:
             ret.append(bit_extend((p >> 11) & 0x1f, 5))  # R
             ret.append(bit_extend((p >> 5) & 0x3f, 6))  # G
             ret.append(bit_extend((p >> 0) & 0x1f, 5))  # B
-    elif bpp == 24:
+    elif bpp == 24 or cf == ColorFormat.RGB565A8:
         if cf == ColorFormat.RGB888:
             B = data[0::3]
             G = data[1::3]
@@ -303,6 +686,64 @@ def unpack_colors(data: bytes, cf: ColorFormat, w) -> List:
     return ret
 
 
+# C array literal of every byte value, with and without starting a new line
+HEX_TABLE = [f"0x{v:02x}," for v in range(256)]
+HEX_TABLE_NEWLINE = [f"\n    0x{v:02x}," for v in range(256)]
+
+
+def image_planes(cf: ColorFormat, h: int, stride: int) -> List:
+    """
+    Return (offset, stride, bpp) of every pixel plane in image data, after
+    the palette. RGB565A8 has a second plane of A8 with half the stride.
+    """
+    offset = cf.ncolors * 4 if cf.is_indexed else 0
+    planes = [(offset, stride, cf.bpp)]
+    if cf is ColorFormat.RGB565A8:
+        planes.append((offset + stride * h, stride // 2, 8))
+    return planes
+
+
+def band_bounds(cf: ColorFormat, h: int, stride: int, data_len: int,
+                band_rows: int = LZ4_BAND_ROWS) -> List[int]:
+    """
+    Return raw data offsets where LZ4_BANDED bands start, followed by the
+    end of data. The palette is a band of its own, every pixel plane is cut
+    in bands of band_rows rows, so each band maps to whole rows of a plane.
+    """
+    if band_rows < 1:
+        raise ParameterError(f"band rows must be at least 1: {band_rows}")
+
+    bounds = [0]
+    for offset, plane_stride, _ in image_planes(cf, h, stride):
+        bounds.extend(offset + row * plane_stride
+                      for row in range(0, h, band_rows))
+    bounds.append(data_len)
+    # drop empty bands, e.g. no palette, or zero sized image
+    return sorted(set(b for b in bounds if b <= data_len))
+
+
+def check_ext(filename: str, ext: str):
+    if not filename.lower().endswith(ext):
+        raise FormatError(f"filename not ended with {ext}")
+
+
+def check_dir(filename: str):
+    """
+    Create parent folder of output filename if it doesn't exist
+    """
+    dir = path.dirname(filename)
+    if dir and not path.exists(dir):
+        logging.info(f"mkdir of {dir} for {filename}")
+        os.makedirs(dir, exist_ok=True)
+
+
+def c_varname(filename: str) -> str:
+    varname = path.basename(filename).split('.')[0]
+    varname = varname.replace("-", "_")
+    varname = varname.replace(".", "_")
+    return varname
+
+
 def write_c_array_file(
         w: int, h: int,
         stride: int,
@@ -310,10 +751,13 @@ def write_c_array_file(
         filename: str,
         premultiplied: bool,
         compress: CompressMethod,
-        data: bytes):
-    varname = path.basename(filename).split('.')[0]
-    varname = varname.replace("-", "_")
-    varname = varname.replace(".", "_")
+        data: bytes,
+        aliases: List[str] = ()):
+    """
+    Write image as C array, aliases are extra image descriptors sharing
+    the same data, e.g. for duplicated images.
+    """
+    varname = c_varname(filename)
 
     flags = "0"
     if compress is not CompressMethod.NONE:
@@ -345,10 +789,15 @@ LV_ATTRIBUTE_MEM_ALIGN LV_ATTRIBUTE_LARGE_CONST {macro}
 uint8_t {varname}_map[] = {{
 '''
 
-    ending = f'''
-}};
-
-const lv_image_dsc_t {varname} = {{
+    ending = '''
+};
+'''
+    for name in (varname, *aliases):
+        if name != varname:
+            ending += f'''
+/* same image as {varname} */'''
+        ending += f'''
+const lv_image_dsc_t {name} = {{
   .header.magic = LV_IMAGE_HEADER_MAGIC,
   .header.cf = LV_COLOR_FORMAT_{cf.name},
   .header.flags = {flags},
@@ -358,15 +807,20 @@ const lv_image_dsc_t {varname} = {{
   .data_size = sizeof({varname}_map),
   .data = {varname}_map,
 }};
-
 '''
+    ending += "\n"
 
     def write_binary(f, data, stride):
         stride = 16 if stride == 0 else stride
-        for i, v in enumerate(data):
-            if i % stride == 0:
-                f.write("\n    ")
-            f.write(f"0x{v:02x},")
+        # format whole rows with the lookup table, write about 64kB a time
+        chunk_size = max(1, (64 << 10) // stride) * stride
+        memview = memoryview(data).cast("B")
+        for start in range(0, len(memview), chunk_size):
+            chunk = memview[start:start + chunk_size]
+            values = list(map(HEX_TABLE.__getitem__, chunk))
+            values[::stride] = map(HEX_TABLE_NEWLINE.__getitem__,
+                                   chunk[::stride])
+            f.write("".join(values))
         f.write("\n")
 
     with open(filename, "w+") as f:
@@ -445,23 +899,164 @@ class LVGLImageHeader:
             self.cf = ColorFormat(data[1] & 0x1f)  # color format
         except ValueError as exc:
             raise FormatError(f"invalid color format: {hex(data[0])}") from exc
+        self.flags = int.from_bytes(data[2:4], 'little')
         self.w = int.from_bytes(data[4:6], 'little')
         self.h = int.from_bytes(data[6:8], 'little')
         self.stride = int.from_bytes(data[8:10], 'little')
         return self
 
 
+class CompressCandidate:
+    """
+    Result of one compress method tried for CompressMethod.AUTO
+    """
+
+    def __init__(self, method: CompressMethod, compressed: bytes,
+                 decode_time: float):
+        self.method = method
+        self.compressed = compressed
+        self.size = len(compressed)
+        self.decode_time = decode_time
+
+    def __repr__(self) -> str:
+        return (f"{self.method.name}: {self.size}Byte, "
+                f"decode {self.decode_time * 1e6:.0f}us")
+
+
+class CompressPolicy:
+    """
+    Rule to choose compress method for CompressMethod.AUTO.
+    SMALLEST: smallest data size, decode time breaks a tie.
+    FASTEST: fastest decode among compressed methods whose size is within
+    max_ratio of raw data size. NONE, which always decodes fastest, is only
+    chosen if no compressed method fits, the smallest is chosen if nothing
+    fits at all.
+    Subclass and override choose() for other rules.
+    """
+    SMALLEST = "SMALLEST"
+    FASTEST = "FASTEST"
+
+    def __init__(self,
+                 goal: str = SMALLEST,
+                 max_ratio: float = 1.0,
+                 methods=(CompressMethod.NONE, CompressMethod.RLE,
+                          CompressMethod.LZ4)):
+        if goal not in (CompressPolicy.SMALLEST, CompressPolicy.FASTEST):
+            raise ParameterError(f"Invalid compress policy: {goal}")
+        self.goal = goal
+        self.max_ratio = max_ratio
+        self.methods = methods
+
+    def choose(self, candidates: List[CompressCandidate],
+               raw_len: int) -> CompressCandidate:
+        smallest = min(candidates, key=lambda c: (c.size, c.decode_time))
+        if self.goal == CompressPolicy.SMALLEST:
+            return smallest
+
+        fits = [c for c in candidates if c.size <= raw_len * self.max_ratio]
+        compressed = [c for c in fits if c.method != CompressMethod.NONE]
+        fits = compressed or fits
+        if not fits:
+            return smallest
+        return min(fits, key=lambda c: (c.decode_time, c.size))
+
+
 class LVGLCompressData:
 
     def __init__(self,
                  cf: ColorFormat,
                  method: CompressMethod,
-                 raw_data: bytes = b''):
+                 raw_data: bytes = b'',
+                 bands: List[int] = None,
+                 jobs: int = 0,
+                 policy: CompressPolicy = None):
+        """
+        bands are the raw data offsets where LZ4_BANDED bands start followed
+        by the end, see band_bounds(), default to a single band. Bands are
+        compressed in up to jobs threads.
+        For method AUTO, every method of policy is tried, the chosen one is
+        set to self.compress and all results are kept in self.candidates.
+        """
+        self.cf = cf
         self.blk_size = (cf.bpp + 7) // 8
         self.compress = method
         self.raw_data = raw_data
         self.raw_data_len = len(raw_data)
-        self.compressed = self._compress(raw_data)
+        self.bands = bands or [0, self.raw_data_len][:2 if raw_data else 1]
+        self.jobs = jobs
+        self.candidates = []
+        if method == CompressMethod.AUTO:
+            self.compressed = self._compress_auto(raw_data, policy or
+                                                  CompressPolicy())
+        else:
+            self.compressed = self._compress(raw_data)
+
+    def _decode_time(self, compressed: bytes, repeat: int = 3) -> float:
+        """
+        Measure time to decompress data produced by self._compress
+        """
+        if self.compress == CompressMethod.NONE:
+            return 0.0
+
+        import time
+        best = float("inf")
+        for _ in range(repeat):
+            start = time.perf_counter()
+            LVGLDecompressData(self.cf, compressed).decompress()
+            best = min(best, time.perf_counter() - start)
+        return best
+
+    def _compress_auto(self, raw_data: bytes,
+                       policy: CompressPolicy) -> bytearray:
+        for method in policy.methods:
+            self.compress = method
+            compressed = self._compress(raw_data)
+            self.candidates.append(
+                CompressCandidate(method, compressed,
+                                  self._decode_time(compressed)))
+
+        chosen = policy.choose(self.candidates, self.raw_data_len)
+        logging.info(f"auto compress: {self.candidates}, "
+                     f"chosen: {chosen.method.name}")
+        self.compress = chosen.method
+        self.compressed_len = chosen.size
+        return chosen.compressed
+
+    def _compress_bands(self, raw_data: bytes) -> bytearray:
+        """
+        Compress raw data in bands, output is: u32 band count, u32 raw data
+        offset of each band and the raw end, u32 offset of each compressed
+        band and the end relative to first band, followed by the lz4
+        compressed bands.
+        """
+        bounds = self.bands
+        if bounds[0] != 0 or bounds[-1] != self.raw_data_len or any(
+                a >= b for a, b in zip(bounds, bounds[1:])):
+            raise ParameterError(f"invalid band bounds: {bounds}")
+        memview = memoryview(raw_data)
+        bands = [memview[a:b] for a, b in zip(bounds, bounds[1:])]
+
+        def compress(band):
+            # lz4 releases GIL, so the bands are compressed in parallel
+            return lz4.block.compress(band, store_size=False)
+
+        if len(bands) > 1:
+            with concurrent.futures.ThreadPoolExecutor(
+                    max_workers=self.jobs or None) as pool:
+                bands = list(pool.map(compress, bands))
+        else:
+            bands = [compress(band) for band in bands]
+
+        index = bytearray()
+        index += uint32_t(len(bands))
+        for bound in bounds:
+            index += uint32_t(bound)
+        offset = 0
+        for band in bands:
+            index += uint32_t(offset)
+            offset += len(band)
+        index += uint32_t(offset)
+        return index + b"".join(bands)
 
     def _compress(self, raw_data: bytes) -> bytearray:
         if self.compress == CompressMethod.NONE:
@@ -475,6 +1070,8 @@ class LVGLCompressData:
             compressed = RLEImage().rle_compress(raw_data + pad, self.blk_size)
         elif self.compress == CompressMethod.LZ4:
             compressed = lz4.block.compress(raw_data, store_size=False)
+        elif self.compress == CompressMethod.LZ4_BANDED:
+            compressed = self._compress_bands(raw_data)
         else:
             raise ParameterError(f"Invalid compress method: {self.compress}")
 
@@ -488,6 +1085,173 @@ class LVGLCompressData:
         return bin
 
 
+class LVGLDecompressData:
+    """
+    Decoder of data written by LVGLCompressData: 12 bytes of compress header
+    (method, compressed length, raw length) followed by compressed data.
+    A range of the raw data can be decoded without decompressing all of it,
+    for RLE by scanning the packet headers, for LZ4_BANDED by decompressing
+    only the bands it overlaps. Plain LZ4 is always decoded as a whole.
+    """
+
+    def __init__(self, cf: ColorFormat, data: bytes):
+        if len(data) < 12:
+            raise FormatError("invalid compress header length")
+
+        memview = memoryview(data)
+        try:
+            self.method = CompressMethod(int.from_bytes(memview[0:4], 'little'))
+        except ValueError as exc:
+            raise FormatError("invalid compress method: "
+                              f"{bytes(memview[0:4]).hex()}") from exc
+        if self.method in (CompressMethod.NONE, CompressMethod.AUTO):
+            raise FormatError(f"invalid compress method: {self.method.name}")
+
+        self.compressed_len = int.from_bytes(memview[4:8], 'little')
+        self.raw_data_len = int.from_bytes(memview[8:12], 'little')
+        self.blk_size = (cf.bpp + 7) // 8
+        if len(memview) - 12 < self.compressed_len:
+            raise FormatError(f"compressed data truncated, got "
+                              f"{len(memview) - 12}, "
+                              f"expect: {self.compressed_len}")
+        self.payload = memview[12:12 + self.compressed_len]
+        self._packets = None  # (raw offsets, payload offsets) of RLE packets
+        self._raw = None
+
+    def decompress(self) -> bytes:
+        """
+        Return the whole raw data
+        """
+        if self._raw is None:
+            self._raw = self.decompress_range(0, self.raw_data_len)
+        return self._raw
+
+    def decompress_range(self, start: int, end: int) -> bytes:
+        """
+        Return raw data[start:end]
+        """
+        start = max(0, start)
+        end = min(end, self.raw_data_len)
+        if start >= end:
+            return b""
+        if self._raw is not None:
+            return self._raw[start:end]
+
+        if self.method == CompressMethod.RLE:
+            return self._rle_range(start, end)
+        if self.method == CompressMethod.LZ4_BANDED:
+            return self._band_range(start, end)
+
+        try:
+            raw = lz4.block.decompress(self.payload,
+                                       uncompressed_size=self.raw_data_len)
+        except lz4.block.LZ4BlockError as exc:
+            raise FormatError(f"invalid lz4 data: {exc}") from exc
+        self._check_len(raw, self.raw_data_len)
+        self._raw = raw
+        return raw[start:end]
+
+    @staticmethod
+    def _check_len(raw: bytes, expect: int):
+        if len(raw) < expect:
+            raise FormatError(f"decompressed data truncated, got {len(raw)}, "
+                              f"expect: {expect}")
+
+    def _rle_packets(self):
+        """
+        Scan packet headers once, return raw and payload offset of every
+        packet, plus the end of both.
+        """
+        if self._packets is not None:
+            return self._packets
+
+        blksize = self.blk_size
+        payload = self.payload
+        payload_len = len(payload)
+        raw_offsets = []
+        offsets = []
+        raw_offset = 0
+        index = 0
+        while index < payload_len:
+            raw_offsets.append(raw_offset)
+            offsets.append(index)
+            ctrl_byte = payload[index]
+            if ctrl_byte & 0x80:
+                size = (ctrl_byte & 0x7f) * blksize
+                raw_offset += size
+                index += 1 + size
+            else:
+                raw_offset += ctrl_byte * blksize
+                index += 1 + blksize
+        raw_offsets.append(raw_offset)
+        offsets.append(index)
+        self._packets = (raw_offsets, offsets)
+        return self._packets
+
+    def _rle_range(self, start: int, end: int) -> bytes:
+        raw_offsets, offsets = self._rle_packets()
+        if raw_offsets[-1] < end:
+            raise FormatError(f"decompressed data truncated, got "
+                              f"{raw_offsets[-1]}, expect: {end}")
+
+        blksize = self.blk_size
+        payload = self.payload
+        first = bisect.bisect_right(raw_offsets, start) - 1
+        output = []
+        for i in range(first, len(offsets) - 1):
+            if raw_offsets[i] >= end:
+                break
+            index = offsets[i]
+            ctrl_byte = payload[index]
+            if ctrl_byte & 0x80:
+                size = (ctrl_byte & 0x7f) * blksize
+                output.append(payload[index + 1:index + 1 + size])
+            else:
+                output.append(
+                    bytes(payload[index + 1:index + 1 + blksize]) * ctrl_byte)
+
+        skip = start - raw_offsets[first]
+        return b"".join(output)[skip:skip + end - start]
+
+    def _band_range(self, start: int, end: int) -> bytes:
+        payload = self.payload
+        if len(payload) < 4:
+            raise FormatError("invalid band header length")
+        count = int.from_bytes(payload[0:4], 'little')
+        bands = 4 + 8 * (count + 1)
+        if len(payload) < bands:
+            raise FormatError("invalid band header")
+
+        def u32(index):
+            return int.from_bytes(payload[index:index + 4], 'little')
+
+        bounds = [u32(4 + 4 * i) for i in range(count + 1)]
+        if bounds[0] != 0 or any(a >= b for a, b in zip(bounds, bounds[1:])):
+            raise FormatError(f"invalid band bounds: {bounds}")
+        if bounds[-1] < end:
+            raise FormatError(f"bands end at {bounds[-1]}, expect: {end}")
+
+        def offset(i):
+            return bands + u32(4 + 4 * (count + 1) + 4 * i)
+
+        first = bisect.bisect_right(bounds, start) - 1
+        last = bisect.bisect_left(bounds, end) - 1
+
+        output = []
+        for i in range(first, last + 1):
+            size = bounds[i + 1] - bounds[i]
+            try:
+                band = lz4.block.decompress(payload[offset(i):offset(i + 1)],
+                                            uncompressed_size=size)
+            except lz4.block.LZ4BlockError as exc:
+                raise FormatError(f"invalid lz4 band {i}: {exc}") from exc
+            self._check_len(band, size)
+            output.append(band)
+
+        skip = start - bounds[first]
+        return b"".join(output)[skip:skip + end - start]
+
+
 class LVGLImage:
 
     def __init__(self,
@@ -539,6 +1303,10 @@ class LVGLImage:
             raise ParameterError(f"Stride is too small:{stride}, "
                                  f"minimal:{current.stride_default}")
 
+        if np is not None:
+            self._adjust_stride_np(current.stride, stride)
+            return
+
         def change_stride(data: bytearray, h, current_stride, new_stride):
             data_in = data
             data_out = []  # stride adjusted new data
@@ -573,6 +1341,81 @@ class LVGLImage:
         self.stride = stride
         self.data = bytearray(b''.join(data_out))
 
+    def _adjust_stride_np(self, current_stride: int, stride: int):
+        """
+        Re-stride image data as whole-array copies, views the pixel data and
+        RGB565A8 alpha map as 2-D arrays of shape (h, stride).
+        """
+        palette_size = self.cf.ncolors * 4
+        a8_size = 0
+        if self.cf == ColorFormat.RGB565A8:
+            logging.warning("handle RGB565A8 alpha map")
+            a8_size = (current_stride // 2) * self.h
+
+        src = np.frombuffer(self.data, dtype=np.uint8)
+        out = bytearray(palette_size + stride * self.h +
+                        (stride // 2 * self.h if a8_size else 0))
+        dst = np.frombuffer(out, dtype=np.uint8)
+        dst[:palette_size] = src[:palette_size]
+
+        def change_stride(src_offset, dst_offset, current_stride, new_stride):
+            rows_in = src[src_offset:src_offset + current_stride *
+                          self.h].reshape(self.h, current_stride)
+            rows_out = dst[dst_offset:dst_offset + new_stride *
+                           self.h].reshape(self.h, new_stride)
+            n = min(current_stride, new_stride)
+            rows_out[:, :n] = rows_in[:, :n]
+
+        change_stride(palette_size, palette_size, current_stride, stride)
+        if a8_size:
+            change_stride(len(src) - a8_size, palette_size + stride * self.h,
+                          current_stride // 2, stride // 2)
+
+        self.stride = stride
+        self.data = out
+
+    def _premultiply_np(self):
+        """
+        Pre-multiply image data in place, all pixels of the image are
+        processed as one array.
+        """
+        if not isinstance(self.data, bytearray):
+            self.data = bytearray(self.data)
+        buf = np.frombuffer(self.data, dtype=np.uint8)
+
+        if self.cf.is_indexed:
+            # process the palette only, B,G,R,A
+            palette = buf[:self.cf.ncolors * 4].reshape(-1, 4)
+            a = palette[:, 3:4].astype(np.uint16)
+            palette[:, :3] = (palette[:, :3] * a) >> 8
+            return
+
+        rows = buf[:self.h * self.stride].reshape(self.h, self.stride)
+        if self.cf is ColorFormat.ARGB8888:
+            pixels = rows[:, :self.w * 4].reshape(self.h, self.w, 4)
+            a = pixels[:, :, 3:4].astype(np.uint16)
+            pixels[:, :, :3] = (pixels[:, :, :3] * a) >> 8
+            return
+
+        if self.cf is ColorFormat.RGB565A8:
+            a8_stride = self.stride // 2
+            pixels = rows[:, :self.w * 2].reshape(self.h, self.w, 2)
+            a = buf[self.h * self.stride:self.h * (self.stride + a8_stride)]
+            a = a.reshape(self.h, a8_stride)[:, :self.w]
+        else:  # ARGB8565
+            pixels = rows[:, :self.w * 3].reshape(self.h, self.w, 3)
+            a = pixels[:, :, 2]
+
+        a = a.astype(np.uint32)
+        color = pixels[:, :, 0].astype(np.uint32)
+        color |= pixels[:, :, 1].astype(np.uint32) << 8
+        r = (((color >> 11) & 0x1f) * a) // 255
+        g = (((color >> 5) & 0x3f) * a) // 255
+        b = (((color >> 0) & 0x1f) * a) // 255
+        color = (r << 11) | (g << 5) | b
+        pixels[:, :, 0] = color & 0xff
+        pixels[:, :, 1] = color >> 8
+
     def premultiply(self):
         """
         Pre-multiply image RGB data with alpha, set corresponding image header flags
@@ -583,9 +1426,16 @@ class LVGLImage:
         if not self.cf.has_alpha:
             raise ParameterError(f"Image has no alpha channel: {self.cf.name}")
 
+        if np is not None and (self.cf.is_indexed or self.cf in (
+                ColorFormat.ARGB8888, ColorFormat.RGB565A8,
+                ColorFormat.ARGB8565)):
+            self._premultiply_np()
+            self.premultiplied = True
+            return
+
         if self.cf.is_indexed:
 
-            def multiply(r, g, b, a):
+            def multiply(b, g, r, a):
                 r, g, b = (r * a) >> 8, (g * a) >> 8, (b * a) >> 8
                 return uint8_t(b) + uint8_t(g) + uint8_t(r) + uint8_t(a)
 
@@ -717,8 +1567,12 @@ class LVGLImage:
 
     def from_data(self, data: bytes):
         header = LVGLImageHeader().from_binary(data)
-        return self.set_data(header.cf, header.w, header.h,
-                             data[len(header.binary):], header.stride)
+        self.premultiplied = bool(header.flags & 0x01)
+        data = data[len(header.binary):]
+        if header.flags & 0x08:
+            data = LVGLDecompressData(header.cf, data).decompress()
+        return self.set_data(header.cf, header.w, header.h, data,
+                             header.stride)
 
     def from_bin(self, filename: str):
         """
@@ -733,24 +1587,35 @@ class LVGLImage:
             return self.from_data(data)
 
     def _check_ext(self, filename: str, ext):
-        if not filename.lower().endswith(ext):
-            raise FormatError(f"filename not ended with {ext}")
+        check_ext(filename, ext)
 
     def _check_dir(self, filename: str):
-        dir = path.dirname(filename)
-        if dir and not path.exists(dir):
-            logging.info(f"mkdir of {dir} for {filename}")
-            os.makedirs(dir)
+        check_dir(filename)
+
+    def band_bounds(self, band_rows: int = LZ4_BAND_ROWS) -> List[int]:
+        """
+        Return LZ4_BANDED band bounds of this image, see band_bounds()
+        """
+        return band_bounds(self.cf, self.h, self.stride, self.data_len,
+                           band_rows)
 
     def to_bin(self,
                filename: str,
-               compress: CompressMethod = CompressMethod.NONE):
+               compress: CompressMethod = CompressMethod.NONE,
+               band_rows: int = LZ4_BAND_ROWS,
+               policy: CompressPolicy = None):
         """
         Write this image to file, filename should be ended with '.bin'
+        band_rows is only used by CompressMethod.LZ4_BANDED, policy by
+        CompressMethod.AUTO
         """
         self._check_ext(filename, ".bin")
         self._check_dir(filename)
 
+        compressed = LVGLCompressData(self.cf, compress, self.data,
+                                      bands=self.band_bounds(band_rows),
+                                      policy=policy)
+        compress = compressed.compress
         with open(filename, "wb+") as f:
             bin = bytearray()
             flags = 0
@@ -763,7 +1628,6 @@ class LVGLImage:
                                      self.stride,
                                      flags=flags)
             bin += header.binary
-            compressed = LVGLCompressData(self.cf, compress, self.data)
             bin += compressed.compressed
 
             f.write(bin)
@@ -772,17 +1636,28 @@ class LVGLImage:
 
     def to_c_array(self,
                    filename: str,
-                   compress: CompressMethod = CompressMethod.NONE):
+                   compress: CompressMethod = CompressMethod.NONE,
+                   band_rows: int = LZ4_BAND_ROWS,
+                   policy: CompressPolicy = None,
+                   aliases: List[str] = ()):
+        """
+        Write this image to C file, aliases are variable names of extra
+        image descriptors using the same data
+        """
         self._check_ext(filename, ".c")
         self._check_dir(filename)
 
         if compress != CompressMethod.NONE:
-            data = LVGLCompressData(self.cf, compress, self.data).compressed
+            compressed = LVGLCompressData(self.cf, compress, self.data,
+                                          bands=self.band_bounds(band_rows),
+                                          policy=policy)
+            compress = compressed.compress
+            data = compressed.compressed
         else:
             data = self.data
         write_c_array_file(self.w, self.h, self.stride, self.cf, filename,
                            self.premultiplied,
-                           compress, data)
+                           compress, data, aliases)
 
     def to_png(self, filename: str):
         self._check_ext(filename, ".png")
@@ -809,9 +1684,14 @@ class LVGLImage:
         elif self.cf.is_alpha_only:
             # separate packed data to plain data
             transparency = unpack_colors(self.data, self.cf, self.w)
-            data = []
-            for a in transparency:
-                data += [0, 0, 0, a]
+            if np is not None:
+                data = np.zeros((len(transparency), 4), dtype=np.uint8)
+                data[:, 3] = transparency
+                data = data.reshape(-1)
+            else:
+                data = []
+                for a in transparency:
+                    data += [0, 0, 0, a]
             encoder = png.Writer(self.w, self.h, greyscale=False, alpha=True)
         elif self.cf == ColorFormat.L8:
             # to grayscale
@@ -840,10 +1720,14 @@ class LVGLImage:
                  filename: str,
                  cf: ColorFormat = None,
                  background: int = 0x00_00_00,
-                 rgb565_dither=False):
+                 rgb565_dither=False,
+                 size=None,
+                 resize_filter: ResizeFilter = ResizeFilter.BILINEAR,
+                 fit: bool = True):
         """
         Create lvgl image from png file.
         If cf is none, used I1/2/4/8 based on palette size
+        If size (w, h) is given, resize the image to it, see from_resized
         """
 
         self.background = background
@@ -858,6 +1742,11 @@ class LVGLImage:
                     cf = ColorFormat[c]
                     break
 
+        if size is not None:
+            return self.from_resized(read_png_rgba(filename), cf, size,
+                                     resize_filter, fit, background,
+                                     rgb565_dither)
+
         if cf is None or cf.is_indexed:  # palette mode
             self._png_to_indexed(cf, filename)
         elif cf.is_alpha_only:
@@ -872,6 +1761,89 @@ class LVGLImage:
         logging.info(f"from png: {filename}, cf: {self.cf.name}")
         return self
 
+    def from_array(self,
+                   array: "np.ndarray",
+                   cf: ColorFormat,
+                   background: int = 0x00_00_00,
+                   rgb565_dither=False):
+        """
+        Create lvgl image from an in-memory uint8 image array of shape
+        (h, w, 4) RGBA, (h, w, 3) RGB or (h, w) grey scale.
+        """
+        if np is None:
+            raise ImportError("Need numpy package, do `pip3 install numpy`")
+
+        self.background = background
+        self.rgb565_dither = rgb565_dither
+
+        array = np.asarray(array)
+        if array.dtype != np.uint8:
+            raise ParameterError(f"Invalid array type: {array.dtype}")
+
+        if array.ndim == 2:
+            array = array[:, :, None]
+        if array.ndim != 3 or array.shape[2] not in (1, 3, 4):
+            raise ParameterError(f"Invalid array shape: {array.shape}")
+
+        has_alpha = array.shape[2] == 4
+        rgba = np.full(array.shape[:2] + (4, ), 0xff, dtype=np.uint8)
+        rgba[:, :, :3] = array[:, :, :3]
+        if has_alpha:
+            rgba[:, :, 3] = array[:, :, 3]
+
+        if cf is None or cf.is_indexed:
+            quantizer = PaletteQuantizer(256 if cf is None else cf.ncolors)
+            palette, index = quantizer.quantize(rgba)
+            self._set_indexed_data(cf, rgba.shape[1], rgba.shape[0], palette,
+                                   index, "array")
+        elif cf.is_alpha_only:
+            if not has_alpha:
+                raise FormatError("image has no alpha channel")
+            self._rgba_to_alpha_only(cf, rgba)
+        elif cf.is_luma_only:
+            self._rgba_to_luma_only(rgba)
+        elif cf.is_colormap:
+            self._rgba_to_colormap(cf, rgba)
+        else:
+            logging.warning(f"missing logic: {cf.name}")
+
+        logging.info(f"from array: {array.shape}, cf: {self.cf.name}")
+        return self
+
+    def from_resized(self,
+                     rgba: "np.ndarray",
+                     cf: ColorFormat,
+                     size,
+                     resize_filter: ResizeFilter = ResizeFilter.BILINEAR,
+                     fit: bool = True,
+                     background: int = 0x00_00_00,
+                     rgb565_dither=False):
+        """
+        Create lvgl image from (h, w, 4) RGBA array resized to size (w, h).
+        If fit, keep aspect ratio and make the image as large as possible
+        within size. Decode the source once to make several sizes of it.
+        """
+        w, h = size
+        if fit:
+            w, h = Resampler.fit(rgba.shape[1], rgba.shape[0], w, h)
+        rgba = Resampler(resize_filter).resize(rgba, w, h)
+        return self.from_array(rgba, cf, background, rgb565_dither)
+
+    def from_pil(self,
+                 image,
+                 cf: ColorFormat,
+                 background: int = 0x00_00_00,
+                 rgb565_dither=False):
+        """
+        Create lvgl image from a Pillow image, without encoding it to png
+        """
+        if image.mode not in ("RGBA", "RGB", "L"):
+            has_alpha = image.mode in ("LA", "PA") or "transparency" in image.info
+            image = image.convert("RGBA" if has_alpha else "RGB")
+
+        return self.from_array(np.asarray(image), cf, background,
+                               rgb565_dither)
+
     def _png_to_indexed(self, cf: ColorFormat, filename: str):
         # convert to palette mode
         auto_cf = cf is None
@@ -883,13 +1855,34 @@ class LVGLImage:
         # to preserve original palette data only convert the image if needed. For this
         # check if image has a palette and the requested palette size equals the existing one 
         if not 'palette' in metadata or not auto_cf and len(metadata['palette']) !=  2 ** cf.bpp:
+            if np is not None:
+                # quantize in process
+                reader = png.Reader(filename=filename)
+                w, h, rows, _ = reader.asRGBA8()
+                quantizer = PaletteQuantizer(256 if auto_cf else cf.ncolors)
+                palette, index = quantizer.quantize(rows_to_array(rows, w, h))
+                return self._set_indexed_data(cf, w, h, palette, index,
+                                              path.basename(filename))
+
             # reread and convert file
             reader = png.Reader(
                 bytes=PngQuant(256 if auto_cf else cf.ncolors).convert(filename))
             w, h, rows, _ = reader.read()
 
         palette = reader.palette(alpha="force")  # always return alpha
+        if np is not None:
+            rows = rows_to_array(rows, w, h, planes=1).reshape(h, w)
+        self._set_indexed_data(cf, w, h, palette, rows,
+                               path.basename(filename))
 
+    def _set_indexed_data(self, cf: ColorFormat, w: int, h: int,
+                          palette: List, rows, name: str):
+        """
+        Set indexed image from palette, list of tuple(R,G,B,A), and rows of
+        palette index, or a (h, w) index array if numpy is available.
+        If cf is None, use I1/2/4/8 based on palette size.
+        """
+        auto_cf = cf is None
         palette_len = len(palette)
         if auto_cf:
             if palette_len <= 2:
@@ -904,7 +1897,7 @@ class LVGLImage:
         if palette_len != cf.ncolors:
             if not auto_cf:
                 logging.warning(
-                    f"{path.basename(filename)} palette: {palette_len}, "
+                    f"{name} palette: {palette_len}, "
                     f"extended to: {cf.ncolors}")
             palette += [(255, 255, 255, 0)] * (cf.ncolors - palette_len)
 
@@ -916,7 +1909,12 @@ class LVGLImage:
             rawdata += uint32_t((a << 24) | (r << 16) | (g << 8) | (b << 0))
 
         # pack data if not in I8 format
-        if cf == ColorFormat.I8:
+        if np is not None:
+            index = rows.astype(np.uint8)
+            if cf != ColorFormat.I8:
+                index = pack_bits_np(index, cf.bpp)
+            rawdata += index.tobytes()
+        elif cf == ColorFormat.I8:
             for e in rows:
                 rawdata += e
         else:
@@ -931,6 +1929,9 @@ class LVGLImage:
         if not info['alpha']:
             raise FormatError(f"{filename} has no alpha channel")
 
+        if np is not None:
+            return self._rgba_to_alpha_only(cf, rows_to_array(rows, w, h))
+
         rawdata = bytearray()
         if cf == ColorFormat.A8:
             for row in rows:
@@ -946,6 +1947,14 @@ class LVGLImage:
 
         self.set_data(cf, w, h, rawdata)
 
+    def _rgba_to_alpha_only(self, cf: ColorFormat, rgba: "np.ndarray"):
+        h, w = rgba.shape[:2]
+        alpha = rgba[:, :, 3]
+        if cf != ColorFormat.A8:
+            alpha = pack_bits_np(alpha >> (8 - cf.bpp), cf.bpp)
+
+        self.set_data(cf, w, h, bytearray(alpha.tobytes()))
+
     def sRGB_to_linear(self, x):
         if x < 0.04045:
             return x / 12.92
@@ -959,6 +1968,9 @@ class LVGLImage:
     def _png_to_luma_only(self, cf: ColorFormat, filename: str):
         reader = png.Reader(str(filename))
         w, h, rows, info = reader.asRGBA8()
+        if np is not None:
+            return self._rgba_to_luma_only(rows_to_array(rows, w, h))
+
         rawdata = bytearray()
         for row in rows:
             R = row[0::4]
@@ -975,6 +1987,74 @@ class LVGLImage:
 
         self.set_data(ColorFormat.L8, w, h, rawdata)
 
+    def _rgba_to_luma_only(self, rgba: "np.ndarray"):
+        h, w = rgba.shape[:2]
+        rgb = color_pre_multiply_np(rgba[:, :, :3], rgba[:, :, 3],
+                                    self.background)
+
+        # sRGB to linear of every 8bit value, same math as sRGB_to_linear
+        linear = np.array([self.sRGB_to_linear(x / 255.0) for x in range(256)])
+        luma = (0.2126 * linear[rgb[:, :, 0]] + 0.7152 * linear[rgb[:, :, 1]] +
+                0.0722 * linear[rgb[:, :, 2]])
+
+        # convert back only the distinct luma values
+        values, index = np.unique(luma, return_inverse=True)
+        values = np.array([int(self.linear_to_sRGB(y) * 255) for y in values],
+                          dtype=np.uint8)
+        luma = values[index.reshape(-1)]
+
+        self.set_data(ColorFormat.L8, w, h, bytearray(luma.tobytes()))
+
+    def _rgba_to_colormap(self, cf: ColorFormat, rgba: "np.ndarray"):
+        h, w = rgba.shape[:2]
+        rgb = rgba[:, :, :3]
+        a = rgba[:, :, 3]
+
+        if self.rgb565_dither and cf in (ColorFormat.RGB565,
+                                         ColorFormat.RGB565A8,
+                                         ColorFormat.ARGB8565):
+            y, x = np.mgrid[0:h, 0:w]
+            treshold_id = ((y & 7) << 3) + (x & 7)
+            thresh = np.stack([
+                np.array(red_thresh)[treshold_id],
+                np.array(green_thresh)[treshold_id],
+                np.array(blue_thresh)[treshold_id]
+            ], axis=-1)
+            mask = np.array([0xF8, 0xFC, 0xF8])
+            rgb = (np.minimum(rgb + thresh, 0xFF) & mask).astype(np.uint8)
+
+        if cf in (ColorFormat.XRGB8888, ColorFormat.RGB888,
+                  ColorFormat.RGB565):
+            rgb = color_pre_multiply_np(rgb, a, self.background)
+
+        if cf in (ColorFormat.ARGB8888, ColorFormat.XRGB8888):
+            # B,G,R,A
+            out = np.empty((h, w, 4), dtype=np.uint8)
+            out[:, :, :3] = rgb[:, :, ::-1]
+            out[:, :, 3] = a if cf == ColorFormat.ARGB8888 else 0xff
+            rawdata = out.tobytes()
+        elif cf == ColorFormat.RGB888:
+            rawdata = np.ascontiguousarray(rgb[:, :, ::-1]).tobytes()
+        elif cf in (ColorFormat.RGB565, ColorFormat.RGB565A8,
+                    ColorFormat.ARGB8565):
+            rgb = rgb.astype(np.uint16)
+            color = ((rgb[:, :, 0] >> 3) << 11) | (
+                (rgb[:, :, 1] >> 2) << 5) | (rgb[:, :, 2] >> 3)
+            if cf == ColorFormat.ARGB8565:
+                out = np.empty((h, w, 3), dtype=np.uint8)
+                out[:, :, 0] = color & 0xff
+                out[:, :, 1] = color >> 8
+                out[:, :, 2] = a
+                rawdata = out.tobytes()
+            else:
+                rawdata = color.astype("<u2").tobytes()
+                if cf == ColorFormat.RGB565A8:
+                    rawdata += a.tobytes()
+        else:
+            raise FormatError(f"Invalid color format: {cf.name}")
+
+        self.set_data(cf, w, h, bytearray(rawdata))
+
     def _png_to_colormap(self, cf, filename: str):
 
         if cf == ColorFormat.ARGB8888:
@@ -1019,6 +2099,9 @@ class LVGLImage:
 
         reader = png.Reader(str(filename))
         w, h, rows, _ = reader.asRGBA8()
+        if np is not None:
+            return self._rgba_to_colormap(cf, rows_to_array(rows, w, h))
+
         rawdata = bytearray()
         alpha = bytearray()
         for y, row in enumerate(rows):
@@ -1082,6 +2165,211 @@ blue_thresh = [
 ]
 
 
+class LVGLBinFile:
+    """
+    Memory mapped LVGL bin image file. Only the image header is parsed when
+    opened, palette, pixel rows and alpha map are returned as memoryview
+    slices of the mapped file, no data is read or copied until accessed.
+    Views should be released before close(), otherwise the mapping is only
+    closed when the last view is garbage collected.
+    """
+
+    def __init__(self, filename: str):
+        if not str(filename).endswith(".bin"):
+            raise FormatError("filename not ended with '.bin'")
+
+        self.filename = filename
+        self.file_size = os.path.getsize(filename)
+        if self.file_size < 12:
+            raise FormatError(f"invalid header length: {filename}")
+
+        with open(filename, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._mmap)
+        self.header = LVGLImageHeader().from_binary(self._view[:12])
+        self._decoder = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __repr__(self) -> str:
+        return (f"'LVGL bin {self.filename} {self.w}x{self.h}, "
+                f"{self.cf.name}, stride: {self.stride}, "
+                f"{'compressed, ' if self.compressed else ''}"
+                f"{self.file_size}Byte'")
+
+    def close(self):
+        self._decoder = None
+        self._view.release()
+        try:
+            self._mmap.close()
+        except BufferError:
+            # views still in use, mmap is closed when they are released
+            pass
+
+    @property
+    def cf(self) -> ColorFormat:
+        return self.header.cf
+
+    @property
+    def w(self) -> int:
+        return self.header.w
+
+    @property
+    def h(self) -> int:
+        return self.header.h
+
+    @property
+    def stride(self) -> int:
+        return self.header.stride
+
+    @property
+    def compressed(self) -> bool:
+        return bool(self.header.flags & 0x08)
+
+    @property
+    def premultiplied(self) -> bool:
+        return bool(self.header.flags & 0x01)
+
+    @property
+    def data(self) -> memoryview:
+        """
+        Image data after header, compressed data if image is compressed
+        """
+        return self._view[12:]
+
+    @property
+    def data_len(self) -> int:
+        """
+        Uncompressed data length in byte expected from image header
+        """
+        p = self.cf.ncolors * 4 if self.w * self.h else 0
+        p += self.stride * self.h
+        if self.cf is ColorFormat.RGB565A8:
+            p += self.stride // 2 * self.h
+        return p
+
+    def _check_uncompressed(self):
+        if self.compressed:
+            raise FormatError(f"compressed image: {self.filename}")
+        if len(self.data) < self.data_len:
+            raise FormatError(f"data truncated: {self.filename}, got "
+                              f"{len(self.data)}, expect: {self.data_len}")
+
+    @property
+    def palette(self) -> memoryview:
+        """
+        Palette of indexed image in B,G,R,A format, empty for other formats
+        """
+        self._check_uncompressed()
+        return self.data[:self.cf.ncolors * 4]
+
+    @property
+    def pixels(self) -> memoryview:
+        """
+        Pixel data of all rows, including stride padding
+        """
+        self._check_uncompressed()
+        offset = self.cf.ncolors * 4
+        return self.data[offset:offset + self.stride * self.h]
+
+    def row(self, y: int) -> memoryview:
+        """
+        Pixel data of row y, excluding stride padding
+        """
+        if not 0 <= y < self.h:
+            raise ParameterError(f"row out of range: {y}")
+        offset = y * self.stride
+        return self.pixels[offset:offset + self.header.stride_default]
+
+    @property
+    def alpha_map(self) -> memoryview:
+        """
+        Alpha map of RGB565A8 image, empty for other formats
+        """
+        if self.cf is not ColorFormat.RGB565A8:
+            return self.data[:0]
+        self._check_uncompressed()
+        offset = self.stride * self.h
+        return self.data[offset:offset + self.stride // 2 * self.h]
+
+    def alpha_row(self, y: int) -> memoryview:
+        """
+        Alpha map of row y for RGB565A8 image
+        """
+        if not 0 <= y < self.h:
+            raise ParameterError(f"row out of range: {y}")
+        a8_stride = self.stride // 2
+        return self.alpha_map[y * a8_stride:y * a8_stride + self.w]
+
+    @property
+    def decoder(self) -> LVGLDecompressData:
+        """
+        Decoder of compressed image data
+        """
+        if not self.compressed:
+            raise FormatError(f"image not compressed: {self.filename}")
+        if self._decoder is None:
+            self._decoder = LVGLDecompressData(self.cf, self.data)
+            if self._decoder.raw_data_len < self.data_len:
+                raise FormatError(
+                    f"data truncated: {self.filename}, got "
+                    f"{self._decoder.raw_data_len}, expect: {self.data_len}")
+        return self._decoder
+
+    def _read(self, start: int, end: int):
+        if self.compressed:
+            return self.decoder.decompress_range(start, end)
+        self._check_uncompressed()
+        return self.data[start:end]
+
+    def _check_rows(self, start: int, end: int):
+        if not 0 <= start <= end <= self.h:
+            raise ParameterError(f"rows out of range: {start}-{end}")
+
+    def read_rows(self, start: int, end: int):
+        """
+        Pixel data of rows [start, end) including stride padding. Compressed
+        image is only decoded as far as needed for these rows.
+        """
+        self._check_rows(start, end)
+        offset = self.cf.ncolors * 4
+        return self._read(offset + start * self.stride,
+                          offset + end * self.stride)
+
+    def read_alpha_rows(self, start: int, end: int):
+        """
+        Alpha map of rows [start, end) of RGB565A8 image
+        """
+        self._check_rows(start, end)
+        if self.cf is not ColorFormat.RGB565A8:
+            return b""
+        offset = self.stride * self.h
+        a8_stride = self.stride // 2
+        return self._read(offset + start * a8_stride,
+                          offset + end * a8_stride)
+
+    def to_image(self, start: int = 0, end: int = None) -> "LVGLImage":
+        """
+        Copy rows [start, end) of the image to a LVGLImage, decompress
+        the data if needed
+        """
+        end = self.h if end is None else end
+        self._check_rows(start, end)
+        # image without pixel has no palette either
+        data = bytearray(self._read(0, self.cf.ncolors * 4)
+                         if end > start else b"")
+        data += self.read_rows(start, end)
+        data += self.read_alpha_rows(start, end)
+        img = LVGLImage().set_data(self.cf, self.w, end - start, data,
+                                   self.stride)
+        img.premultiplied = self.premultiplied
+        return img
+
+
 class RLEHeader:
 
     def __init__(self, blksize: int, len: int):
@@ -1127,6 +2415,92 @@ class RLEImage(LVGLImage):
             f.write(compressed)
 
     def rle_compress(self, data: bytearray, blksize: int, threshold=16):
+        """
+        RLE compress data in unit of blksize bytes. Use the numpy run detection
+        if available, it produces the same output as rle_compress_py.
+        """
+        if np is not None:
+            return self.rle_compress_np(data, blksize, threshold)
+        return self.rle_compress_py(data, blksize, threshold)
+
+    def rle_compress_np(self, data: bytearray, blksize: int, threshold=16):
+        """
+        Find all run boundaries of data at once by comparing each block with
+        its previous one, then build the packets by walking the runs instead
+        of the blocks. Output is byte-identical to rle_compress_py.
+        """
+        data_len = len(data)
+        nblocks = data_len // blksize
+        if nblocks == 0:
+            return b""
+
+        memview = memoryview(data)
+        if blksize in (1, 2, 4):
+            # compare whole blocks as one integer
+            blocks = np.frombuffer(data, dtype=f"u{blksize}", count=nblocks)
+            changed = blocks[1:] != blocks[:-1]
+        else:
+            blocks = np.frombuffer(data, dtype=np.uint8,
+                                   count=nblocks * blksize)
+            blocks = blocks.reshape(-1, blksize)
+            changed = np.any(blocks[1:] != blocks[:-1], axis=1)
+        starts = np.concatenate(([0], np.flatnonzero(changed) + 1))
+        run_start = starts.tolist()
+        run_len = np.diff(np.append(starts, nblocks)).tolist()
+
+        # A trailing partial block never equals any other block, the reference
+        # encoder treats it as a run of one that cannot start a packet.
+        partial = data_len % blksize != 0
+        if partial:
+            run_start.append(nblocks)
+            run_len.append(1)
+        nruns = len(run_len)
+
+        # Runs longer than threshold + 1 blocks end a non-repeat packet
+        long_runs = np.flatnonzero(np.asarray(run_len) > threshold + 1).tolist()
+        total = run_start[-1] + run_len[-1]
+
+        compressed_data = []
+        pos = 0  # current block index
+        while pos < total:
+            run = bisect.bisect_right(run_start, pos) - 1
+            if partial and run == nruns - 1:
+                break
+
+            index = pos * blksize
+            remain = run_start[run] + run_len[run] - pos
+            repeat_cnt = min(remain, 127)
+            if repeat_cnt >= threshold:
+                compressed_data.append(uint8_t(repeat_cnt))
+                compressed_data.append(memview[index:index + blksize])
+                pos += repeat_cnt
+                continue
+
+            # Same count as get_nonrepeat_count: it grows with every new run
+            # up to and including the first block of the next long run, and
+            # is capped to 127.
+            if run == nruns - 1:
+                nonrepeat_cnt = remain
+            else:
+                i = bisect.bisect_right(long_runs, run)
+                if i < len(long_runs):
+                    nonrepeat_cnt = min(run_start[long_runs[i]] - pos + 1, 127)
+                elif run_start[-1] - pos + 1 >= 127:
+                    nonrepeat_cnt = 127
+                else:
+                    nonrepeat_cnt = min(total - pos, 127)
+
+            compressed_data.append(uint8_t(nonrepeat_cnt | 0x80))
+            compressed_data.append(memview[index:index +
+                                           nonrepeat_cnt * blksize])
+            pos += nonrepeat_cnt
+
+        return b"".join(compressed_data)
+
+    def rle_compress_py(self, data: bytearray, blksize: int, threshold=16):
+        """
+        Reference RLE encoder, compare the data block by block.
+        """
         index = 0
         data_len = len(data)
         compressed_data = []
@@ -1201,7 +2575,7 @@ class RLEImage(LVGLImage):
 
             index += blksize  # move to next position
             if index >= len(data):  # data end
-                nonrepeat_count += repeat_cnt
+                nonrepeat_count = min(nonrepeat_count + repeat_cnt, 127)
                 break
 
         return nonrepeat_count
@@ -1250,6 +2624,12 @@ class OutputFormat(Enum):
     PNG_FILE = "PNG"  # convert to lvgl image and then to png
 
 
+class OutputFormat(Enum):
+    C_ARRAY = "C"
+    BIN_FILE = "BIN"
+    PNG_FILE = "PNG"  # convert to lvgl image and then to png
+
+
 class PNGConverter:
 
     def __init__(self,
@@ -1262,7 +2642,20 @@ class PNGConverter:
                  premultiply: bool = False,
                  compress: CompressMethod = CompressMethod.NONE,
                  keep_folder=True,
-                 rgb565_dither=False) -> None:
+                 rgb565_dither=False,
+                 jobs: int = 1,
+                 cache: "ConversionCache" = None,
+                 band_rows: int = LZ4_BAND_ROWS,
+                 compress_policy: CompressPolicy = None,
+                 dedup: bool = False,
+                 near_threshold: int = -1,
+                 sizes: List = None,
+                 resize_filter: ResizeFilter = ResizeFilter.BILINEAR,
+                 fit: bool = True) -> None:
+        """
+        sizes is a list of (w, h) to resize every image to, each size is
+        written to its own WxH sub folder if there are more than one.
+        """
         self.files = files
         self.cf = cf
         self.ofmt = ofmt
@@ -1274,43 +2667,215 @@ class PNGConverter:
         self.compress = compress
         self.background = background
         self.rgb565_dither = rgb565_dither
+        self.jobs = jobs if jobs > 0 else (os.cpu_count() or 1)
+        self.cache = cache
+        self.band_rows = band_rows
+        self.compress_policy = compress_policy
+        self.dedup = dedup
+        self.near_threshold = near_threshold
+        self.aliases = {}  # duplicated file to the file actually converted
+        self.near = []  # list of (file, file, distance)
+        self.sizes = sizes or []
+        self.resize_filter = resize_filter
+        self.fit = fit
 
-    def _replace_ext(self, input, ext):
+    @property
+    def _ext(self):
+        return {
+            OutputFormat.BIN_FILE: ".bin",
+            OutputFormat.C_ARRAY: ".c",
+            OutputFormat.PNG_FILE: ".png",
+        }[self.ofmt]
+
+    def _replace_ext(self, input, ext, size=None):
         if self.keep_folder:
             name, _ = path.splitext(input)
         else:
             name, _ = path.splitext(path.basename(input))
         output = name + ext
+        if size is not None and len(self.sizes) > 1:
+            output = path.join(f"{size[0]}x{size[1]}", output)
         output = path.join(self.output, output)
         return output
 
-    def convert(self):
-        output = []
-        for f in self.files:
-            if self.cf in (ColorFormat.RAW, ColorFormat.RAW_ALPHA):
-                # Process RAW image explicitly
-                img = RAWImage().from_file(f, self.cf)
-                img.to_c_array(self._replace_ext(f, ".c"))
-            else:
+    def _convert_file(self, f):
+        """
+        Convert a single file to every size, return list of (f, LVGLImage),
+        empty for RAW image. File is decoded only once for all sizes.
+        """
+        if self.cf in (ColorFormat.RAW, ColorFormat.RAW_ALPHA):
+            # Process RAW image explicitly
+            img = RAWImage().from_file(f, self.cf)
+            img.to_c_array(self._replace_ext(f, ".c"))
+            return []
+
+        source = None
+        if self.cache:
+            with open(f, "rb") as fp:
+                source = fp.read()
+
+        results = []
+        rgba = None
+        for size in self.sizes or [None]:
+            output = self._replace_ext(f, self._ext, size)
+            aliases = [
+                c_varname(self._replace_ext(dup, self._ext, size))
+                for dup, orig in self.aliases.items() if orig == f
+            ] if self.ofmt == OutputFormat.C_ARRAY else []
+
+            if self.cache:
+                # C array variable name comes from the output filename
+                key = self.cache.key(
+                    source, cf=self.cf, ofmt=self.ofmt, align=self.align,
+                    background=self.background, premultiply=self.premultiply,
+                    compress=self.compress, rgb565_dither=self.rgb565_dither,
+                    band_rows=self.band_rows
+                    if self.compress == CompressMethod.LZ4_BANDED else None,
+                    policy=vars(self.compress_policy or CompressPolicy())
+                    if self.compress == CompressMethod.AUTO else None,
+                    name=path.basename(output)
+                    if self.ofmt == OutputFormat.C_ARRAY else None,
+                    aliases=aliases or None,
+                    size=size,
+                    resize=(self.resize_filter, self.fit) if size else None)
+                img = self.cache.get_image(key)
+                if img is not None:
+                    os.makedirs(path.dirname(output) or ".", exist_ok=True)
+                    if self.cache.get(key, output):
+                        results.append((f, img))
+                        continue
+
+            if size is None:
                 img = LVGLImage().from_png(f, self.cf, background=self.background, rgb565_dither=self.rgb565_dither)
-                img.adjust_stride(align=self.align)
-
-                if self.premultiply:
-                    img.premultiply()
-                output.append((f, img))
-                if self.ofmt == OutputFormat.BIN_FILE:
-                    img.to_bin(self._replace_ext(f, ".bin"),
-                               compress=self.compress)
-                elif self.ofmt == OutputFormat.C_ARRAY:
-                    img.to_c_array(self._replace_ext(f, ".c"),
-                                   compress=self.compress)
-                elif self.ofmt == OutputFormat.PNG_FILE:
-                    img.to_png(self._replace_ext(f, ".png"))
+            else:
+                if rgba is None:
+                    rgba = read_png_rgba(f)
+                img = LVGLImage().from_resized(
+                    rgba, self.cf, size, self.resize_filter, self.fit,
+                    background=self.background,
+                    rgb565_dither=self.rgb565_dither)
+            self._write(img, output, aliases)
+
+            if self.cache:
+                self.cache.put(key, output, img)
+            results.append((f, img))
+
+        return results
+
+    def _write(self, img: LVGLImage, output: str, aliases: List[str]):
+        img.adjust_stride(align=self.align)
+
+        if self.premultiply:
+            img.premultiply()
+        if self.ofmt == OutputFormat.BIN_FILE:
+            img.to_bin(output, compress=self.compress,
+                       band_rows=self.band_rows,
+                       policy=self.compress_policy)
+        elif self.ofmt == OutputFormat.C_ARRAY:
+            img.to_c_array(output, compress=self.compress,
+                           band_rows=self.band_rows,
+                           policy=self.compress_policy,
+                           aliases=aliases)
+        elif self.ofmt == OutputFormat.PNG_FILE:
+            img.to_png(output)
+
+    def _find_duplicates(self):
+        from lvgl_cache import DuplicateFinder
+
+        raw = self.cf in (ColorFormat.RAW, ColorFormat.RAW_ALPHA)
+        finder = DuplicateFinder(perceptual=self.near_threshold >= 0,
+                                 threshold=self.near_threshold,
+                                 raw=raw, cache=self.cache)
+        self.aliases, self.near = finder.find(self.files, self.jobs)
+        for dup, orig in self.aliases.items():
+            logging.info(f"duplicate: {dup} is same as {orig}")
+        for a, b, distance in self.near:
+            logging.info(f"near duplicate: {a} and {b}, "
+                         f"distance: {distance}")
+
+    def _emit_duplicates(self, output):
+        """
+        Duplicates in C are aliases in the C file of the converted image,
+        other formats get a copy of its output.
+        """
+        converted = {}
+        for f, img in output:
+            converted.setdefault(f, []).append(img)
+        for dup, orig in self.aliases.items():
+            if orig not in converted:
+                continue
+            if self.ofmt != OutputFormat.C_ARRAY:
+                for size in self.sizes or [None]:
+                    target = self._replace_ext(dup, self._ext, size)
+                    os.makedirs(path.dirname(target) or ".", exist_ok=True)
+                    shutil.copyfile(self._replace_ext(orig, self._ext, size),
+                                    target)
+            converted[dup] = converted[orig]
+
+        return [(f, img) for f in self.files for img in converted.get(f, [])]
 
-        return output
+    def convert(self):
+        """
+        Convert all files, in a process pool if jobs > 1.
+        Return list of (filename, LVGLImage) in the same order as files,
+        one for each size.
+        """
+        files = self.files
+        if self.dedup or self.near_threshold >= 0:
+            self._find_duplicates()
+        if self.dedup and self.cf not in (ColorFormat.RAW,
+                                          ColorFormat.RAW_ALPHA):
+            files = [f for f in files if f not in self.aliases]
+        else:
+            # RAW C arrays can not share data, duplicates are only reported
+            self.aliases = {}
+
+        if self.jobs <= 1 or len(files) <= 1:
+            results = [r for f in files for r in self._convert_file(f)]
+            if self.cache:
+                self.cache.evict()
+            return self._emit_duplicates(results)
+
+        output = []
+        with concurrent.futures.ProcessPoolExecutor(
+                max_workers=self.jobs,
+                initializer=_init_worker,
+                initargs=(logging.getLogger().level, )) as pool:
+            futures = [pool.submit(self._convert_file, f) for f in files]
+            for f, future in zip(files, futures):
+                try:
+                    result = future.result()
+                except Exception:
+                    logging.error(f"failed to convert: {f}")
+                    pool.shutdown(cancel_futures=True)
+                    raise
+                output.extend(result)
+
+        if self.cache:
+            self.cache.evict()
+        return self._emit_duplicates(output)
+
+
+def _init_worker(level):
+    # worker processes do not inherit logging config on spawn platforms
+    logging.basicConfig(level=level)
+
+
+def parse_size(text: str):
+    try:
+        w, h = (int(v) for v in text.lower().split("x"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid size: {text}, use WxH")
+    return w, h
 
 
 def main():
+    # these modules import this one, so they are not imported at the top
+    from lvgl_atlas import make_atlas
+    from lvgl_glyph import GlyphSheet
+    from lvgl_animation import LVGLAnimation
+    from lvgl_cache import ConversionCache
+
     parser = argparse.ArgumentParser(description='LVGL PNG to bin image tool.')
     parser.add_argument('--ofmt',
                         help="output filename format, C or BIN",
@@ -1336,7 +2901,28 @@ def main():
     parser.add_argument('--compress',
                         help=("Binary data compress method, default to NONE"),
                         default="NONE",
-                        choices=["NONE", "RLE", "LZ4"])
+                        choices=["NONE", "RLE", "LZ4", "LZ4_BANDED", "AUTO"])
+
+    parser.add_argument('--compress-policy',
+                        help="how AUTO compress chooses from NONE/RLE/LZ4: "
+                        "SMALLEST size, or FASTEST decode within --max-ratio",
+                        default=CompressPolicy.SMALLEST,
+                        choices=[CompressPolicy.SMALLEST, CompressPolicy.FASTEST])
+
+    parser.add_argument('--max-ratio',
+                        help="size limit of FASTEST policy, as ratio of "
+                        "uncompressed size, default to 1.0. Uncompressed "
+                        "data is only used if no compressed method fits",
+                        default=1.0,
+                        type=float,
+                        metavar='ratio')
+
+    parser.add_argument('--band-rows',
+                        help="rows per independently compressed band for "
+                        f"LZ4_BANDED, default to {LZ4_BAND_ROWS}",
+                        default=LZ4_BAND_ROWS,
+                        type=int,
+                        metavar='rows')
 
     parser.add_argument('--align',
                         help="stride alignment in bytes for bin image",
@@ -1350,6 +2936,112 @@ def main():
                         type=lambda x: int(x, 0),
                         metavar='color',
                         nargs='?')
+    parser.add_argument('-j',
+                        '--jobs',
+                        help="number of parallel conversion processes, "
+                        "0 to use all CPU cores, default to 1",
+                        default=1,
+                        type=int,
+                        metavar='N')
+    parser.add_argument('--cache',
+                        help="reuse outputs of unchanged files from cache "
+                        f"folder, default to {ConversionCache.default_dir()}",
+                        const=ConversionCache.default_dir(),
+                        default=None,
+                        metavar='dir',
+                        nargs='?')
+    parser.add_argument('--cache-size',
+                        help="cache size limit in MiB, default to 256",
+                        default=256,
+                        type=int,
+                        metavar='MiB')
+    parser.add_argument('--resize',
+                        help="resize images to fit in the size, e.g. the "
+                        "display size; with more sizes, each one is written "
+                        "to its WxH sub folder",
+                        default=None,
+                        type=parse_size,
+                        metavar='WxH',
+                        nargs='+')
+    parser.add_argument('--resize-filter',
+                        help="resampling filter, default to BILINEAR",
+                        default="BILINEAR",
+                        choices=[f.name for f in ResizeFilter])
+    parser.add_argument('--stretch',
+                        action='store_true',
+                        help="resize to exactly WxH, "
+                        "instead of keeping aspect ratio",
+                        default=False)
+    parser.add_argument('--dedup',
+                        action='store_true',
+                        help="convert images with same pixels only once, "
+                        "duplicates are aliases in C or copies otherwise",
+                        default=False)
+    parser.add_argument('--near-dup',
+                        help="report images with perceptual hash within "
+                        "given bits of distance, default to 4",
+                        const=4,
+                        default=-1,
+                        type=int,
+                        metavar='bits',
+                        nargs='?')
+    parser.add_argument('--glyph-cell',
+                        help="slice input glyph sheets to cells of WxH, "
+                        "write trimmed A1/2/4/8 glyphs with an index to one "
+                        "file per sheet",
+                        default=None,
+                        type=parse_size,
+                        metavar='WxH')
+    parser.add_argument('--glyph-spacing',
+                        help="pixels between cells of glyph sheet, "
+                        "default to 0",
+                        default=0,
+                        type=int,
+                        metavar='px')
+    parser.add_argument('--glyph-first',
+                        help="id of the first glyph cell, e.g. 0xe000, "
+                        "default to 0",
+                        default=0,
+                        type=lambda x: int(x, 0),
+                        metavar='id')
+    parser.add_argument('--animation',
+                        help="encode input files in name order as frames of "
+                        "one animation, a keyframe followed by deltas",
+                        default=None,
+                        metavar='name')
+    parser.add_argument('--frame-delay',
+                        help="delay of every animation frame, default to 40",
+                        default=40,
+                        type=int,
+                        metavar='ms')
+    parser.add_argument('--keyframe-interval',
+                        help="write a keyframe every N frames, "
+                        "default to 0 for only the first one",
+                        default=0,
+                        type=int,
+                        metavar='N')
+    parser.add_argument('--delta',
+                        help="how animation frames store changes, "
+                        "default to AUTO for the smaller one",
+                        default=LVGLAnimation.DELTA_AUTO,
+                        choices=[LVGLAnimation.DELTA_AUTO,
+                                 LVGLAnimation.DELTA_RECT,
+                                 LVGLAnimation.DELTA_XOR])
+    parser.add_argument('--atlas',
+                        help="pack all images into one atlas image with "
+                        "an index table of sub-rectangles, named as given",
+                        default=None,
+                        metavar='name')
+    parser.add_argument('--atlas-padding',
+                        help="pixels between images in atlas, default to 0",
+                        default=0,
+                        type=int,
+                        metavar='px')
+    parser.add_argument('--atlas-width',
+                        help="maximum atlas width, default to no limit",
+                        default=0,
+                        type=int,
+                        metavar='px')
     parser.add_argument('-o',
                         '--output',
                         default="./output",
@@ -1380,6 +3072,77 @@ def main():
     ofmt = OutputFormat(args.ofmt) if cf not in (
         ColorFormat.RAW, ColorFormat.RAW_ALPHA) else OutputFormat.C_ARRAY
     compress = CompressMethod[args.compress]
+    resize_filter = ResizeFilter[args.resize_filter]
+    if args.resize and cf in (ColorFormat.RAW, ColorFormat.RAW_ALPHA):
+        parser.error("RAW images can not be resized")
+    if args.resize and args.atlas and len(args.resize) > 1:
+        parser.error("atlas supports only one size")
+
+    if args.band_rows < 1:
+        parser.error(f"--band-rows must be at least 1: {args.band_rows}")
+
+    compress_policy = CompressPolicy(args.compress_policy, args.max_ratio)
+    if args.glyph_cell:
+        if cf is None or not cf.is_alpha_only or ofmt == OutputFormat.PNG_FILE:
+            parser.error("glyph sheet needs --cf A1/A2/A4/A8, C or BIN")
+        for f in files:
+            sheet = GlyphSheet(cf, *args.glyph_cell, args.glyph_spacing,
+                               args.glyph_first).from_png(f)
+            name = path.join(args.output,
+                             path.splitext(path.basename(f))[0])
+            if ofmt == OutputFormat.C_ARRAY:
+                sheet.to_c_array(name + ".c")
+            else:
+                sheet.to_bin(name + ".bin")
+            print(f"{f}: {len(sheet.glyphs)} glyphs, "
+                  f"{len(sheet.binary)} bytes")
+        return
+
+    if args.animation:
+        if cf in (ColorFormat.RAW, ColorFormat.RAW_ALPHA) or \
+                ofmt == OutputFormat.PNG_FILE:
+            parser.error("animation needs an LVGL color format, C or BIN")
+        frames = sorted(files, key=lambda f: str(f))
+        anim = LVGLAnimation(compress, args.delta, args.keyframe_interval,
+                             args.frame_delay)
+        images = []
+        for f in frames:
+            img = LVGLImage().from_png(
+                str(f), cf, background=args.background,
+                rgb565_dither=args.rgb565dither,
+                size=args.resize[0] if args.resize else None,
+                resize_filter=resize_filter, fit=not args.stretch)
+            img.adjust_stride(align=args.align)
+            if args.premultiply:
+                img.premultiply()
+            images.append(img)
+        anim.encode(images)
+
+        output = path.join(args.output, args.animation)
+        if ofmt == OutputFormat.C_ARRAY:
+            anim.to_c_array(output + ".c")
+        else:
+            anim.to_bin(output + ".anim")
+        independent, encoded = anim.size_report()
+        print(f"animation {args.animation}: {len(frames)} frames, "
+              f"{independent} -> {encoded} bytes")
+        return
+
+    if args.atlas:
+        make_atlas(files, cf, ofmt, args.output, args.atlas,
+                   padding=args.atlas_padding,
+                   max_width=args.atlas_width,
+                   background=args.background,
+                   align=args.align,
+                   premultiply=args.premultiply,
+                   compress=compress,
+                   rgb565_dither=args.rgb565dither,
+                   band_rows=args.band_rows,
+                   compress_policy=compress_policy,
+                   size=args.resize[0] if args.resize else None,
+                   resize_filter=resize_filter,
+                   fit=not args.stretch)
+        return
 
     converter = PNGConverter(files,
                              cf,
@@ -1390,11 +3153,26 @@ def main():
                              premultiply=args.premultiply,
                              compress=compress,
                              keep_folder=False,
-                             rgb565_dither=args.rgb565dither)
+                             rgb565_dither=args.rgb565dither,
+                             jobs=args.jobs,
+                             cache=ConversionCache(args.cache,
+                                                   args.cache_size << 20)
+                             if args.cache else None,
+                             band_rows=args.band_rows,
+                             compress_policy=compress_policy,
+                             dedup=args.dedup,
+                             near_threshold=args.near_dup,
+                             sizes=args.resize,
+                             resize_filter=resize_filter,
+                             fit=not args.stretch)
     output = converter.convert()
     for f, img in output:
         logging.info(f"len: {img.data_len} for {path.basename(f)} ")
 
+    if converter.aliases:
+        print(f"{len(converter.aliases)} duplicated files not converted")
+    for a, b, distance in converter.near:
+        print(f"near duplicate: {a} and {b}, distance: {distance}")
     print(f"done {len(files)} files")
 
 
@@ -1423,4 +3201,8 @@ def test_raw():
 if __name__ == "__main__":
     # test()
     # test_raw()
-    main()
+
+    # run main of the module imported as LVGLImage, so it shares the classes
+    # with the modules importing it, instead of this copy in __main__
+    import LVGLImage
+    LVGLImage.main()
@@ -0,0 +1,393 @@
+#!/usr/bin/env python3
+"""
+Benchmark LVGLImage.py conversions on synthetic images.
+
+Every stage (from_png, adjust_stride, premultiply, RLE/LZ4 compress, to_bin,
+to_c_array) is timed for each color format and image size, peak memory of
+the stage is recorded with tracemalloc. Results are written as JSON, and can
+be compared with the results of an earlier run to find regressions:
+
+    python benchmark.py -o new.json --compare old.json
+    python benchmark.py --module /path/to/old/LVGLImage.py -o old.json
+
+Subcommands compare implementations of one step instead:
+
+    python benchmark.py rle          # numpy RLE against the python reference
+    python benchmark.py quantize a.png b.png    # PaletteQuantizer vs pngquant
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import hashlib
+import platform
+import argparse
+import tempfile
+import tracemalloc
+import importlib.util
+from os import path
+
+try:
+    import png
+except ImportError:
+    raise ImportError("Need pypng package, do `pip3 install pypng`")
+
+from LVGLImage import parse_size
+
+COLOR_FORMATS = [
+    "L8", "I1", "I2", "I4", "I8", "A1", "A2", "A4", "A8", "ARGB8888",
+    "XRGB8888", "RGB565", "RGB565A8", "ARGB8565", "RGB888"
+]
+
+STAGES = [
+    "from_png", "adjust_stride", "premultiply", "compress_rle",
+    "compress_lz4", "to_bin", "to_c_array"
+]
+
+
+def load_module(filename: str):
+    spec = importlib.util.spec_from_file_location("LVGLImage", filename)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def synthetic_png(filename: str, w: int, h: int, seed: int = 0):
+    """
+    Write RGBA png mixing flat areas, gradients, noise and an alpha ramp,
+    so both compressors and quantizer have something to work on.
+    """
+    rng = random.Random(seed)
+    rows = []
+    for y in range(h):
+        row = bytearray(w * 4)
+        band = y * 4 // h
+        for x in range(w):
+            if band == 0:  # flat
+                pixel = (40, 120, 200, 255)
+            elif band == 1:  # gradient
+                pixel = (x * 255 // w, y * 255 // h, 128, 255)
+            elif band == 2:  # noise
+                pixel = (rng.getrandbits(8), rng.getrandbits(8),
+                         rng.getrandbits(8), rng.getrandbits(8))
+            else:  # alpha ramp
+                pixel = (255, 64, 0, x * 255 // w)
+            row[x * 4:x * 4 + 4] = bytes(pixel)
+        rows.append(row)
+
+    with open(filename, "wb") as f:
+        png.Writer(w, h, greyscale=False, alpha=True).write(f, rows)
+
+
+def measure(func, repeat: int):
+    """
+    Return (best time in seconds, peak memory in bytes, result) of func,
+    the timed runs are done without tracemalloc, which slows them down.
+    """
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return best, peak, result
+
+
+def benchmark(module, sizes, formats, repeat: int, workdir: str):
+    ColorFormat = module.ColorFormat
+    CompressMethod = module.CompressMethod
+    LVGLImage = module.LVGLImage
+
+    def copy(img):
+        new = LVGLImage().set_data(img.cf, img.w, img.h, bytearray(img.data),
+                                   img.stride)
+        new.premultiplied = img.premultiplied
+        return new
+
+    results = []
+    for w, h in sizes:
+        source = path.join(workdir, f"synthetic_{w}x{h}.png")
+        synthetic_png(source, w, h)
+
+        for name in formats:
+            cf = ColorFormat[name]
+            try:
+                img = LVGLImage().from_png(source, cf)
+            except KeyboardInterrupt:
+                raise
+            except BaseException as e:
+                # older LVGLImage.py raises bare BaseException, e.g. when
+                # pngquant is missing for indexed formats
+                print(f"skip {name} {w}x{h}: {e}", file=sys.stderr)
+                continue
+            output = path.join(workdir, f"out_{name}_{w}x{h}")
+
+            stages = {
+                "from_png": lambda: LVGLImage().from_png(source, cf),
+                "adjust_stride":
+                lambda: copy(img).adjust_stride(align=16),
+                "compress_rle":
+                lambda: module.LVGLCompressData(cf, CompressMethod.RLE,
+                                                img.data).compressed,
+                "compress_lz4":
+                lambda: module.LVGLCompressData(cf, CompressMethod.LZ4,
+                                                img.data).compressed,
+                "to_bin": lambda: img.to_bin(output + ".bin"),
+                "to_c_array": lambda: img.to_c_array(output + ".c"),
+            }
+            if cf.has_alpha:
+                stages["premultiply"] = lambda: copy(img).premultiply()
+
+            for stage in STAGES:
+                if stage not in stages:
+                    continue
+                try:
+                    seconds, peak, result = measure(stages[stage], repeat)
+                except KeyboardInterrupt:
+                    raise
+                except BaseException as e:
+                    print(f"skip {stage} of {name}: {e}", file=sys.stderr)
+                    continue
+
+                record = {
+                    "cf": name,
+                    "w": w,
+                    "h": h,
+                    "stage": stage,
+                    "seconds": seconds,
+                    "peak_bytes": peak,
+                }
+                if isinstance(result, (bytes, bytearray)):
+                    record["output_bytes"] = len(result)
+                results.append(record)
+                print(f"{name:>9} {w}x{h} {stage:<14} "
+                      f"{seconds * 1000:9.2f}ms {peak / 1024:9.0f}KiB",
+                      file=sys.stderr)
+
+    return results
+
+
+def benchmark_rle(module, w: int = 480, h: int = 320, repeat: int = 3):
+    """
+    Compare rle_compress_np against the reference rle_compress_py for every
+    block size used by the color formats, on synthetic image data that
+    mixes flat areas, gradients and noise.
+    """
+    if module.np is None:
+        print("numpy is not available, nothing to compare")
+        return
+
+    rng = random.Random(0)
+    rle = module.RLEImage()
+    blksizes = sorted({(cf.bpp + 7) // 8 for cf in module.ColorFormat
+                       if cf.bpp})
+    for blksize in blksizes:
+        cfs = [cf.name for cf in module.ColorFormat
+               if cf.bpp and (cf.bpp + 7) // 8 == blksize]
+        row = w * blksize
+        data = bytearray()
+        for y in range(h):
+            if y % 3 == 0:  # flat
+                data += bytes([y & 0xff]) * row
+            elif y % 3 == 1:  # gradient
+                data += bytes((x // 4) & 0xff for x in range(row))
+            else:  # noise
+                data += bytes(rng.getrandbits(8) for _ in range(row))
+
+        result = {}
+        for name, func in (("py", rle.rle_compress_py),
+                           ("np", rle.rle_compress_np)):
+            start = time.perf_counter()
+            for _ in range(repeat):
+                compressed = func(data, blksize)
+            result[name] = ((time.perf_counter() - start) / repeat,
+                            compressed)
+
+        assert result["py"][1] == result["np"][1], "output mismatch"
+        print(f"blksize {blksize} ({'/'.join(cfs)}): {len(data)} -> "
+              f"{len(result['np'][1])} bytes, "
+              f"py {result['py'][0] * 1000:.1f}ms, "
+              f"np {result['np'][0] * 1000:.1f}ms, "
+              f"x{result['py'][0] / result['np'][0]:.1f}")
+
+
+def benchmark_quantize(module, files, ncolors: int = 256):
+    """
+    Compare PaletteQuantizer against pngquant in time and PSNR of the
+    visible pixels. pngquant is skipped if it's not installed.
+    """
+    np = module.np
+    if np is None:
+        print("numpy is not available, nothing to compare")
+        return
+
+    def psnr(rgba, palette, index):
+        back = np.array(palette, dtype=np.float64)[index]
+        visible = rgba[..., 3] > 0
+        mse = ((back[visible] - rgba[visible])**2).mean()
+        return 10 * np.log10(255**2 / mse) if mse else float("inf")
+
+    for f in files:
+        rgba = module.read_png_rgba(f)
+
+        start = time.perf_counter()
+        palette, index = module.PaletteQuantizer(ncolors).quantize(rgba)
+        elapsed = time.perf_counter() - start
+        print(f"{f}: quantizer {elapsed * 1000:.1f}ms, "
+              f"{psnr(rgba, palette, index):.2f}dB")
+
+        if shutil.which("pngquant") is None:
+            continue
+
+        start = time.perf_counter()
+        reader = png.Reader(bytes=module.PngQuant(ncolors).convert(f))
+        w, h, rows, _ = reader.read()
+        elapsed = time.perf_counter() - start
+        palette = reader.palette(alpha="force")
+        index = module.rows_to_array(rows, w, h, planes=1).reshape(h, w)
+        print(f"{f}: pngquant {elapsed * 1000:.1f}ms, "
+              f"{psnr(rgba, palette, index):.2f}dB")
+
+
+def metadata(module_file: str, repeat: int):
+    with open(module_file, "rb") as f:
+        digest = hashlib.sha256(f.read()).hexdigest()
+
+    try:
+        import numpy
+        numpy_version = numpy.__version__
+    except ImportError:
+        numpy_version = None
+
+    return {
+        "module": path.abspath(module_file),
+        "module_sha256": digest,
+        "python": platform.python_version(),
+        "numpy": numpy_version,
+        "machine": platform.machine(),
+        "system": platform.system(),
+        "cpu_count": os.cpu_count(),
+        "repeat": repeat,
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+    }
+
+
+def compare(results, baseline, threshold: float) -> int:
+    """
+    Print time ratio of each stage against baseline results, return the
+    number of stages slower than baseline by more than threshold.
+    """
+    old = {(r["cf"], r["w"], r["h"], r["stage"]): r for r in baseline}
+    regressions = 0
+    for r in results:
+        key = (r["cf"], r["w"], r["h"], r["stage"])
+        if key not in old or not old[key]["seconds"]:
+            continue
+        ratio = r["seconds"] / old[key]["seconds"]
+        mark = ""
+        if ratio > 1 + threshold:
+            mark = "  <- regression"
+            regressions += 1
+        print(f"{r['cf']:>9} {r['w']}x{r['h']} {r['stage']:<14} "
+              f"{ratio:6.2f}x{mark}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmark LVGLImage.py conversions.')
+    parser.add_argument('--module',
+                        help="LVGLImage.py to benchmark, default to the one "
+                        "next to this script",
+                        default=path.join(path.dirname(path.abspath(__file__)),
+                                          "LVGLImage.py"))
+    parser.add_argument('--size',
+                        help="image size, can be repeated, default to 64x64 "
+                        "and 320x240",
+                        action='append',
+                        type=parse_size,
+                        metavar='WxH')
+    parser.add_argument('--cf',
+                        help="color format, can be repeated, default to all",
+                        action='append',
+                        choices=COLOR_FORMATS)
+    parser.add_argument('--repeat',
+                        help="runs of each stage, best one is kept, "
+                        "default to 3",
+                        default=3,
+                        type=int)
+    parser.add_argument('-o',
+                        '--output',
+                        help="JSON result file, default to stdout",
+                        default=None)
+    parser.add_argument('--compare',
+                        help="JSON result of an earlier run to compare with",
+                        default=None,
+                        metavar='json')
+    parser.add_argument('--threshold',
+                        help="slowdown ratio reported as regression, "
+                        "default to 0.1",
+                        default=0.1,
+                        type=float)
+    commands = parser.add_subparsers(dest='command')
+    rle = commands.add_parser('rle',
+                              help="compare numpy RLE compression against "
+                              "the python reference")
+    rle.add_argument('--size',
+                     help="image size, default to 480x320",
+                     default=(480, 320),
+                     type=parse_size,
+                     metavar='WxH')
+    quantize = commands.add_parser('quantize',
+                                   help="compare PaletteQuantizer against "
+                                   "pngquant on png files")
+    quantize.add_argument('files', nargs='+', help="png files")
+    quantize.add_argument('--colors',
+                          help="palette size, default to 256",
+                          default=256,
+                          type=int)
+    args = parser.parse_args()
+
+    module = load_module(args.module)
+    if args.command == 'rle':
+        benchmark_rle(module, *args.size, repeat=args.repeat)
+        return
+    if args.command == 'quantize':
+        benchmark_quantize(module, args.files, args.colors)
+        return
+
+    sizes = args.size or [(64, 64), (320, 240)]
+    formats = args.cf or COLOR_FORMATS
+
+    with tempfile.TemporaryDirectory() as workdir:
+        results = benchmark(module, sizes, formats, args.repeat, workdir)
+
+    report = {
+        "metadata": metadata(args.module, args.repeat),
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["results"]
+        if compare(results, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
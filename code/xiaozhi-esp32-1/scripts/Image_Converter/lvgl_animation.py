@@ -0,0 +1,344 @@
+"""
+Encode a sequence of LVGL images as key and delta frames, see LVGLAnimation.
+"""
+from enum import Enum
+from typing import List
+
+try:
+    import numpy as np
+except ImportError:
+    # numpy is optional, pure python code paths are used without it
+    np = None
+
+from LVGLImage import (ColorFormat, CompressMethod, FormatError, HEX_TABLE,
+                       LVGLCompressData, LVGLDecompressData, LVGLImage,
+                       ParameterError, c_varname, check_dir, check_ext,
+                       image_planes, uint16_t, uint32_t, uint8_t)
+
+
+class FrameType(Enum):
+    KEY = 0x00  # whole image data
+    RECT = 0x01  # pixels of the dirty rectangle
+    XOR = 0x02  # pixels of the dirty rectangle XOR previous frame
+
+
+class AnimationFrame:
+
+    def __init__(self, type: FrameType, delay: int, x: int, y: int, w: int,
+                 h: int, payload: bytes, compressed: bool) -> None:
+        self.type = type
+        self.delay = delay
+        self.x = x
+        self.y = y
+        self.w = w
+        self.h = h
+        self.payload = payload
+        self.compressed = compressed
+
+    def __repr__(self) -> str:
+        return (f"'{self.type.name} frame ({self.x}, {self.y}, "
+                f"{self.w}x{self.h}), {len(self.payload)}Byte'")
+
+
+class LVGLAnimation:
+    """
+    Encode a sequence of same sized frames as a keyframe followed by deltas.
+    A delta stores only the dirty rectangle that changed from the previous
+    frame, as plain pixels (RECT) or XOR with the previous frame (XOR),
+    compressed with the same methods as images. A keyframe is written
+    instead when it's smaller, and every keyframe_interval frames if set.
+
+    Binary format, all little endian:
+        u32 magic, u8 cf, u8 flags, u16 frame count,
+        u16 w, u16 h, u16 stride, u16 reserved,
+        frame index, 20 bytes each: u8 type, u8 compressed, u16 delay in ms,
+        u16 x, u16 y, u16 w, u16 h, u32 payload offset from the end of
+        index, u32 payload size,
+        payloads. Compressed payload starts with the compress header of
+        LVGLCompressData. Delta rows are pixels of the rectangle only, the
+        A8 rows of RGB565A8 follow the RGB565 rows.
+    """
+
+    MAGIC = 0x4e41564c  # "LVAN"
+    DELTA_AUTO = "AUTO"
+    DELTA_RECT = "RECT"
+    DELTA_XOR = "XOR"
+
+    def __init__(self,
+                 compress: CompressMethod = CompressMethod.RLE,
+                 delta: str = DELTA_AUTO,
+                 keyframe_interval: int = 0,
+                 delay: int = 40) -> None:
+        if np is None:
+            raise ImportError("Need numpy package, do `pip3 install numpy`")
+        if delta not in (self.DELTA_AUTO, self.DELTA_RECT, self.DELTA_XOR):
+            raise ParameterError(f"Invalid delta mode: {delta}")
+        self.compress = compress
+        self.delta = delta
+        self.keyframe_interval = keyframe_interval
+        self.delay = delay
+        self.frames: List[AnimationFrame] = []
+        self.images: List[LVGLImage] = []
+
+    def from_png(self, files: List, cf: ColorFormat, **kwargs):
+        """
+        Encode png files in order, other arguments are passed to from_png
+        """
+        return self.encode(
+            [LVGLImage().from_png(str(f), cf, **kwargs) for f in files])
+
+    def _payload(self, cf: ColorFormat, data: bytes):
+        compressed = LVGLCompressData(cf, self.compress, data)
+        return (bytes(compressed.compressed),
+                compressed.compress != CompressMethod.NONE)
+
+    def encode(self, images: List["LVGLImage"]):
+        if not images:
+            raise ParameterError("no frame in animation")
+        first = images[0]
+        for img in images[1:]:
+            if (img.cf, img.w, img.h, img.stride) != (first.cf, first.w,
+                                                      first.h, first.stride):
+                raise ParameterError(f"frame {img} differs from {first}")
+            if first.cf.is_indexed and img.data[:first.cf.ncolors * 4] != \
+                    first.data[:first.cf.ncolors * 4]:
+                raise ParameterError("indexed frames need the same palette")
+
+        self.images = images
+        self.frames = []
+        cf, w, h = first.cf, first.w, first.h
+        previous = None
+        for i, img in enumerate(images):
+            key = AnimationFrame(FrameType.KEY, self.delay, 0, 0, w, h,
+                                 *self._payload(cf, img.data))
+            interval = self.keyframe_interval
+            if previous is None or (interval and i % interval == 0):
+                self.frames.append(key)
+                previous = img
+                continue
+
+            frame = self._delta(previous, img)
+            if len(frame.payload) >= len(key.payload):
+                frame = key
+            self.frames.append(frame)
+            previous = img
+
+        return self
+
+    def _delta(self, previous: "LVGLImage",
+               img: "LVGLImage") -> AnimationFrame:
+        cf = img.cf
+        planes = image_planes(cf, img.h, img.stride)
+        old = np.frombuffer(previous.data, dtype=np.uint8)
+        new = np.frombuffer(img.data, dtype=np.uint8)
+
+        # dirty rectangle in pixels, union of all planes
+        x0, y0, x1, y1 = img.w, img.h, 0, 0
+        for offset, stride, bpp in planes:
+            size = stride * img.h
+            diff = (old[offset:offset + size] != new[offset:offset + size])
+            diff = diff.reshape(img.h, stride)
+            rows = np.flatnonzero(diff.any(axis=1))
+            if not len(rows):
+                continue
+            cols = np.flatnonzero(diff.any(axis=0))
+            y0, y1 = min(y0, int(rows[0])), max(y1, int(rows[-1]) + 1)
+            x0 = min(x0, int(cols[0]) * 8 // bpp)
+            x1 = max(x1, -(-(int(cols[-1]) + 1) * 8 // bpp))
+
+        if y0 >= y1:  # same as previous frame
+            return AnimationFrame(FrameType.RECT, self.delay, 0, 0, 0, 0,
+                                  b"", False)
+
+        # rows of sub-byte formats start at byte boundary
+        align = 8 // cf.bpp if cf.bpp < 8 else 1
+        x0 = x0 // align * align
+        x1 = min(img.w, x1)
+
+        def rect(data):
+            rows = []
+            for offset, stride, bpp in planes:
+                plane = data[offset:offset + stride * img.h]
+                plane = plane.reshape(img.h, stride)
+                rows.append(plane[y0:y1, x0 * bpp // 8:(x1 * bpp + 7) // 8])
+            return np.concatenate([r.reshape(-1) for r in rows])
+
+        pixels = rect(new)
+        candidates = []
+        if self.delta in (self.DELTA_AUTO, self.DELTA_RECT):
+            candidates.append((FrameType.RECT, pixels.tobytes()))
+        if self.delta in (self.DELTA_AUTO, self.DELTA_XOR):
+            candidates.append((FrameType.XOR, (pixels ^ rect(old)).tobytes()))
+
+        frames = [
+            AnimationFrame(type, self.delay, x0, y0, x1 - x0, y1 - y0,
+                           *self._payload(cf, data))
+            for type, data in candidates
+        ]
+        return min(frames, key=lambda f: len(f.payload))
+
+    @property
+    def binary(self) -> bytearray:
+        if not self.frames:
+            raise ParameterError("animation not encoded")
+        if len(self.frames) > 0xffff:
+            raise ParameterError(f"too many frames: {len(self.frames)}")
+        first = self.images[0]
+
+        binary = bytearray()
+        binary += uint32_t(self.MAGIC)
+        binary += uint8_t(first.cf.value)
+        binary += uint8_t(0x01 if first.premultiplied else 0)
+        binary += uint16_t(len(self.frames))
+        binary += uint16_t(first.w)
+        binary += uint16_t(first.h)
+        binary += uint16_t(first.stride)
+        binary += uint16_t(0)
+
+        offset = 0
+        for f in self.frames:
+            binary += uint8_t(f.type.value)
+            binary += uint8_t(1 if f.compressed else 0)
+            binary += uint16_t(f.delay)
+            binary += uint16_t(f.x)
+            binary += uint16_t(f.y)
+            binary += uint16_t(f.w)
+            binary += uint16_t(f.h)
+            binary += uint32_t(offset)
+            binary += uint32_t(len(f.payload))
+            offset += len(f.payload)
+
+        for f in self.frames:
+            binary += f.payload
+        return binary
+
+    def size_report(self):
+        """
+        Return (independent, encoded) size in bytes, independent is the
+        total of every frame as a bin image with the same compression
+        """
+        independent = 0
+        for img in self.images:
+            payload, _ = self._payload(img.cf, img.data)
+            independent += len(img.header.binary) + len(payload)
+        return independent, len(self.binary)
+
+    def to_bin(self, filename: str):
+        check_ext(filename, ".anim")
+        check_dir(filename)
+        with open(filename, "wb") as f:
+            f.write(self.binary)
+        return self
+
+    def to_c_array(self, filename: str):
+        check_ext(filename, ".c")
+        check_dir(filename)
+        varname = c_varname(filename)
+        binary = self.binary
+        with open(filename, "w") as f:
+            f.write(f'''
+#include <stdint.h>
+
+/* {len(self.frames)} frames of LV_COLOR_FORMAT_{self.images[0].cf.name}, see
+ * LVGLAnimation in LVGLImage.py for the format */
+const uint8_t {varname}[] = {{''')
+            for i in range(0, len(binary), 16):
+                f.write("\n    " + "".join(map(HEX_TABLE.__getitem__,
+                                               binary[i:i + 16])))
+            f.write(f'''
+}};
+
+const uint32_t {varname}_size = {len(binary)};
+''')
+        return self
+
+
+class AnimationPlayer:
+    """
+    Reference player of LVGLAnimation binary, reconstructs every frame
+    """
+
+    def __init__(self, data: bytes) -> None:
+        if np is None:
+            raise ImportError("Need numpy package, do `pip3 install numpy`")
+        if len(data) < 16 or int.from_bytes(data[0:4],
+                                            'little') != LVGLAnimation.MAGIC:
+            raise FormatError("invalid animation header")
+        try:
+            self.cf = ColorFormat(data[4])
+        except ValueError as exc:
+            raise FormatError(f"invalid color format: {data[4]}") from exc
+        self.premultiplied = bool(data[5] & 0x01)
+        count = int.from_bytes(data[6:8], 'little')
+        self.w = int.from_bytes(data[8:10], 'little')
+        self.h = int.from_bytes(data[10:12], 'little')
+        self.stride = int.from_bytes(data[12:14], 'little')
+
+        start = 16 + 20 * count
+        if len(data) < start:
+            raise FormatError("frame index truncated")
+
+        self.frames: List[AnimationFrame] = []
+        memview = memoryview(data)
+        for i in range(count):
+            entry = memview[16 + 20 * i:36 + 20 * i]
+            try:
+                type = FrameType(entry[0])
+            except ValueError as exc:
+                raise FormatError(f"invalid frame type: {entry[0]}") from exc
+            delay, x, y, w, h = (int.from_bytes(entry[k:k + 2], 'little')
+                                 for k in (2, 4, 6, 8, 10))
+            offset = int.from_bytes(entry[12:16], 'little')
+            size = int.from_bytes(entry[16:20], 'little')
+            payload = memview[start + offset:start + offset + size]
+            if len(payload) < size:
+                raise FormatError(f"frame {i} data truncated")
+            self.frames.append(
+                AnimationFrame(type, delay, x, y, w, h, payload,
+                               bool(entry[1])))
+
+    def _decode(self, frame: AnimationFrame) -> bytes:
+        if frame.compressed:
+            return LVGLDecompressData(self.cf, frame.payload).decompress()
+        return bytes(frame.payload)
+
+    def __iter__(self):
+        """
+        Yield every frame as LVGLImage
+        """
+        planes = image_planes(self.cf, self.h, self.stride)
+        data_len = planes[-1][0] + planes[-1][1] * self.h
+        current = None
+        for i, frame in enumerate(self.frames):
+            raw = self._decode(frame)
+            if frame.type == FrameType.KEY:
+                if len(raw) != data_len:
+                    raise FormatError(f"keyframe {i} length: {len(raw)}, "
+                                      f"expect: {data_len}")
+                current = np.frombuffer(raw, dtype=np.uint8).copy()
+            elif current is None:
+                raise FormatError("animation does not start with keyframe")
+            elif frame.w and frame.h:
+                pixels = np.frombuffer(raw, dtype=np.uint8)
+                pos = 0
+                for offset, stride, bpp in planes:
+                    b0 = frame.x * bpp // 8
+                    b1 = ((frame.x + frame.w) * bpp + 7) // 8
+                    size = (b1 - b0) * frame.h
+                    if pos + size > len(pixels):
+                        raise FormatError(f"frame {i} data truncated")
+                    rect = pixels[pos:pos + size].reshape(frame.h, b1 - b0)
+                    plane = current[offset:offset + stride * self.h]
+                    plane = plane.reshape(self.h, stride)
+                    target = plane[frame.y:frame.y + frame.h, b0:b1]
+                    if frame.type == FrameType.XOR:
+                        target ^= rect
+                    else:
+                        target[:] = rect
+                    pos += size
+
+            img = LVGLImage().set_data(self.cf, self.w, self.h,
+                                       bytearray(current.tobytes()),
+                                       self.stride)
+            img.premultiplied = self.premultiplied
+            yield img
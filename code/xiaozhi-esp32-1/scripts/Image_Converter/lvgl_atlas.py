@@ -0,0 +1,448 @@
+"""
+Pack many small images into one LVGL image with an index table of
+sub-rectangles, see LVGLAtlas.
+"""
+from os import path
+from typing import List
+
+try:
+    import numpy as np
+except ImportError:
+    # numpy is optional, pure python code paths are used without it
+    np = None
+
+from LVGLImage import (ColorFormat, CompressMethod, CompressPolicy,
+                       LVGLCompressData, LVGLImage, LVGLImageHeader,
+                       LZ4_BAND_ROWS, OutputFormat, PaletteQuantizer,
+                       ParameterError, Resampler, ResizeFilter, c_varname,
+                       check_dir, check_ext, image_planes, read_png_rgba)
+
+
+class AtlasRect:
+
+    def __init__(self,
+                 name: str,
+                 img: "LVGLImage" = None,
+                 rgba: "np.ndarray" = None) -> None:
+        self.name = name
+        self.img = img
+        self.rgba = rgba  # source of images quantized after packing
+        self.x = 0
+        self.y = 0
+
+    @property
+    def w(self) -> int:
+        return self.img.w if self.img is not None else self.rgba.shape[1]
+
+    @property
+    def h(self) -> int:
+        return self.img.h if self.img is not None else self.rgba.shape[0]
+
+    def __repr__(self) -> str:
+        return f"'{self.name}': ({self.x}, {self.y}, {self.w}x{self.h})"
+
+
+class LVGLAtlas:
+    """
+    Pack many small images of one color format into a single LVGL image.
+    Position of every image is stored in an index table of sub-rectangles,
+    which is written to C together with the atlas, so the device only looks
+    up one image instead of hundreds of them, each with its own header and
+    stride padding.
+    Indexed images added by add() need the same palette, images added by
+    add_rgba() are quantized to one palette after packing.
+    """
+
+    RECT_TYPE = "xz_image_atlas_rect_t"
+
+    def __init__(self,
+                 cf: ColorFormat,
+                 padding: int = 0,
+                 max_width: int = 0,
+                 align: int = 1) -> None:
+        if cf is None or cf in (ColorFormat.UNKNOWN, ColorFormat.RAW,
+                                ColorFormat.RAW_ALPHA):
+            raise ParameterError(f"Atlas needs a fixed color format: {cf}")
+        if padding < 0:
+            raise ParameterError(f"Invalid atlas padding: {padding}")
+
+        self.cf = cf
+        self.padding = padding
+        self.max_width = max_width
+        self.align = align
+        self.rects: List[AtlasRect] = []
+        self.image: LVGLImage = None
+
+    def add(self, name: str, img: "LVGLImage"):
+        """
+        Add an image to atlas, name is used to find it in index table
+        """
+        if img.cf != self.cf:
+            raise ParameterError(f"{name} color format {img.cf.name} "
+                                 f"is not {self.cf.name}")
+        self._check_name(name, rgba=False)
+        if self.cf.is_indexed and self.rects:
+            ncolors = self.cf.ncolors * 4
+            if img.data[:ncolors] != self.rects[0].img.data[:ncolors]:
+                raise ParameterError(f"{name} palette differs from "
+                                     f"{self.rects[0].name}")
+        self.rects.append(AtlasRect(name, img))
+        self.image = None
+        return self
+
+    def add_rgba(self, name: str, rgba: "np.ndarray"):
+        """
+        Add a (h, w, 4) RGBA image to an atlas of indexed color format. The
+        packed atlas is quantized at once, so all images share its palette.
+        """
+        if not self.cf.is_indexed:
+            raise ParameterError(f"RGBA images need an indexed atlas: "
+                                 f"{self.cf.name}")
+        self._check_name(name, rgba=True)
+        self.rects.append(AtlasRect(name, rgba=rgba))
+        self.image = None
+        return self
+
+    def _check_name(self, name: str, rgba: bool):
+        if any(r.name == name for r in self.rects):
+            raise ParameterError(f"duplicated atlas name: {name}")
+        if self.rects and (self.rects[0].rgba is not None) != rgba:
+            raise ParameterError("can not mix add() and add_rgba() in atlas")
+
+    @property
+    def _pixel_align(self) -> int:
+        # sub images must start at byte boundary
+        return 8 // self.cf.bpp if self.cf.bpp < 8 else 1
+
+    def _size(self, w: int) -> int:
+        return (w + self._pixel_align - 1) // self._pixel_align \
+            * self._pixel_align
+
+    def _skyline(self, width: int, rects: List[AtlasRect]):
+        """
+        Place rects with skyline bottom-left, return atlas height and
+        positions, or None if some rect is wider than the atlas.
+        """
+        skyline = [(0, 0, width)]  # segments of (x, y, w)
+        positions = []
+        height = 0
+        for r in rects:
+            w = self._size(r.w + self.padding)
+            h = r.h + self.padding
+            best = None
+            for i, (x, _, _) in enumerate(skyline):
+                if x + w > width:
+                    break
+                # the rect rests on the highest segment below it
+                y, j, right = 0, i, x + w
+                while j < len(skyline) and skyline[j][0] < right:
+                    y = max(y, skyline[j][1])
+                    j += 1
+                if best is None or (y + h, x) < (best[0] + h, best[1]):
+                    best = (y, x, i)
+            if best is None:
+                return None
+
+            y, x, i = best
+            positions.append((x, y))
+            height = max(height, y + h)
+
+            # replace covered segments with the new one
+            right = x + w
+            new = [(x, y + h, w)]
+            j = i
+            while j < len(skyline) and skyline[j][0] < right:
+                sx, sy, sw = skyline[j]
+                if sx + sw > right:
+                    new.append((right, sy, sx + sw - right))
+                j += 1
+            skyline[i:j] = new
+
+            # merge neighbours at the same height
+            merged = [skyline[0]]
+            for seg in skyline[1:]:
+                px, py, pw = merged[-1]
+                if seg[1] == py:
+                    merged[-1] = (px, py, pw + seg[2])
+                else:
+                    merged.append(seg)
+            skyline = merged
+
+        return height, positions
+
+    def pack(self) -> "LVGLImage":
+        """
+        Place all images and build the atlas image. The placement with the
+        smallest area is chosen from a few atlas widths and image orders.
+        """
+        if not self.rects:
+            raise ParameterError("no image in atlas")
+
+        min_width = max(self._size(r.w + self.padding) for r in self.rects)
+        area = sum(self._size(r.w + self.padding) * (r.h + self.padding)
+                   for r in self.rects)
+        candidates = {min_width}
+        for scale in (1.0, 1.1, 1.2, 1.35, 1.5, 1.75, 2.0):
+            candidates.add(max(min_width, self._size(int(area**0.5 * scale))))
+        if self.max_width:
+            if self.max_width < min_width:
+                raise ParameterError(f"image wider than atlas: {min_width}")
+            candidates = {min(w, self.max_width) for w in candidates}
+
+        orders = (
+            lambda r: (-r.h, -r.w, r.name),
+            lambda r: (-r.w * r.h, r.name),
+            lambda r: (-max(r.w, r.h), -r.w * r.h, r.name),
+        )
+        best = None
+        for order in orders:
+            rects = sorted(self.rects, key=order)
+            for width in sorted(candidates):
+                _, positions = self._skyline(width, rects)
+                # trailing padding is not needed at the edges
+                used_w = self._size(
+                    max(x + r.w for r, (x, _) in zip(rects, positions)))
+                used_h = max(y + r.h for r, (_, y) in zip(rects, positions))
+                if best is None or used_w * used_h < best[0] * best[1]:
+                    best = (used_w, used_h, rects, positions)
+
+        width, height, rects, positions = best
+        if width > 0xffff or height > 0xffff:
+            raise ParameterError(f"atlas overflow: {width}x{height}")
+        for r, (x, y) in zip(rects, positions):
+            r.x, r.y = x, y
+
+        self.image = self._build(width, height)
+        return self.image
+
+    def _build_quantized(self, width: int, height: int) -> "LVGLImage":
+        sheet = np.zeros((height, width, 4), dtype=np.uint8)
+        for r in self.rects:
+            sheet[r.y:r.y + r.h, r.x:r.x + r.w] = r.rgba
+        palette, index = PaletteQuantizer(self.cf.ncolors).quantize(sheet)
+        img = LVGLImage()
+        img._set_indexed_data(self.cf, width, height, palette, index, "atlas")
+        img.adjust_stride(align=self.align)
+        return img
+
+    def _build(self, width: int, height: int) -> "LVGLImage":
+        if self.rects[0].rgba is not None:
+            return self._build_quantized(width, height)
+
+        cf = self.cf
+        header = LVGLImageHeader(cf, width, height, align=self.align)
+        stride = header.stride
+        palette_len = cf.ncolors * 4 if cf.is_indexed else 0
+        planes = image_planes(cf, height, stride)
+
+        data = bytearray(planes[-1][0] + planes[-1][1] * height)
+        if palette_len:
+            data[:palette_len] = self.rects[0].img.data[:palette_len]
+
+        for r in self.rects:
+            src_planes = image_planes(cf, r.h, r.img.stride)
+            for (dst, dst_stride, bpp), (src, src_stride, _) in zip(
+                    planes, src_planes):
+                line = (r.w * bpp + 7) // 8
+                dst += r.y * dst_stride + r.x * bpp // 8
+                for _ in range(r.h):
+                    data[dst:dst + line] = r.img.data[src:src + line]
+                    dst += dst_stride
+                    src += src_stride
+
+        img = LVGLImage().set_data(cf, width, height, data, stride)
+        img.premultiplied = all(r.img.premultiplied for r in self.rects)
+        return img
+
+    def _check_packed(self):
+        if self.image is None:
+            self.pack()
+
+    def _sorted_rects(self) -> List[AtlasRect]:
+        # sorted by name, so the device can do binary search
+        return sorted(self.rects, key=lambda r: r.name.encode())
+
+    def index_size(self) -> int:
+        """
+        Size of index table on a 32bit device, including name strings
+        """
+        return sum(12 + len(r.name.encode()) + 1 for r in self.rects)
+
+    def write_header(self, filename: str, varname: str):
+        """
+        Write C header with the index table type and declarations
+        """
+        guard = c_varname(filename).upper() + "_H"
+        with open(filename, "w") as f:
+            f.write(f'''#ifndef {guard}
+#define {guard}
+
+#include <stdint.h>
+
+#ifndef XZ_IMAGE_ATLAS_RECT_DEFINED
+#define XZ_IMAGE_ATLAS_RECT_DEFINED
+typedef struct {{
+  const char * name;
+  uint16_t x;
+  uint16_t y;
+  uint16_t w;
+  uint16_t h;
+}} {self.RECT_TYPE};
+#endif
+
+/* sorted by name */
+extern const {self.RECT_TYPE} {varname}_rects[];
+extern const uint32_t {varname}_rect_count;
+
+#endif /* {guard} */
+''')
+
+    def write_index(self, f, varname: str, header: str):
+        """
+        Write index table of sub-rectangles as C code to file object f, the
+        type is in header written by write_header
+        """
+        self._check_packed()
+        rects = self._sorted_rects()
+        f.write(f'''
+#include "{path.basename(header)}"
+
+const {self.RECT_TYPE} {varname}_rects[] = {{
+''')
+        for r in rects:
+            name = r.name.replace("\\", "\\\\").replace('"', '\\"')
+            f.write(f'  {{"{name}", {r.x}, {r.y}, {r.w}, {r.h}}},\n')
+        f.write(f'''}};
+
+const uint32_t {varname}_rect_count = {len(rects)};
+''')
+
+    def to_c_array(self, filename: str, **kwargs):
+        """
+        Write atlas image and its index table to C file, and the index table
+        declarations to a header of the same name, other arguments are
+        passed to LVGLImage.to_c_array
+        """
+        self._check_packed()
+        self.image.to_c_array(filename, **kwargs)
+        varname = c_varname(filename)
+        header = filename[:-len(".c")] + ".h"
+        self.write_header(header, varname)
+        with open(filename, "a") as f:
+            self.write_index(f, varname, header)
+        return self
+
+    def to_index(self, filename: str):
+        """
+        Write only the index table to C file and its header, e.g. for atlas
+        in bin format
+        """
+        self._check_packed()
+        check_ext(filename, ".c")
+        check_dir(filename)
+        varname = c_varname(filename)
+        if varname.endswith("_rects"):
+            varname = varname[:-len("_rects")]
+        header = filename[:-len(".c")] + ".h"
+        self.write_header(header, varname)
+        with open(filename, "w") as f:
+            self.write_index(f, varname, header)
+        return self
+
+    def size_report(self,
+                    compress: CompressMethod = CompressMethod.NONE,
+                    band_rows: int = LZ4_BAND_ROWS,
+                    policy: CompressPolicy = None):
+        """
+        Return (individual, atlas) size in bytes, individual is the total of
+        each image stored as a separate bin file, atlas includes its
+        header and the index table.
+        """
+        self._check_packed()
+
+        def size(img):
+            data = LVGLCompressData(img.cf, compress, img.data,
+                                    bands=img.band_bounds(band_rows),
+                                    policy=policy)
+            return len(img.header.binary) + len(data.compressed)
+
+        def image(r):
+            if r.img is not None:
+                return r.img
+            # a separate file would be quantized on its own
+            img = LVGLImage().from_array(r.rgba, self.cf)
+            img.adjust_stride(align=self.align)
+            return img
+
+        individual = sum(size(image(r)) for r in self.rects)
+        atlas = size(self.image) + self.index_size()
+        return individual, atlas
+
+
+def make_atlas(files: List,
+               cf: ColorFormat,
+               ofmt: OutputFormat,
+               odir: str,
+               name: str,
+               padding: int = 0,
+               max_width: int = 0,
+               background: int = 0x00,
+               align: int = 1,
+               premultiply: bool = False,
+               compress: CompressMethod = CompressMethod.NONE,
+               rgb565_dither=False,
+               band_rows: int = LZ4_BAND_ROWS,
+               compress_policy: CompressPolicy = None,
+               size=None,
+               resize_filter: ResizeFilter = ResizeFilter.BILINEAR,
+               fit: bool = True) -> LVGLAtlas:
+    """
+    Convert files and pack them into atlas `name` in odir. For C output the
+    index table is in the same file, otherwise in `<name>_rects.c`, its
+    declarations in the header of the same name.
+    """
+    atlas = LVGLAtlas(cf, padding=padding, max_width=max_width, align=align)
+    if cf.is_indexed and np is None:
+        raise ImportError("Indexed atlas needs numpy package, "
+                          "do `pip3 install numpy`")
+    for f in files:
+        rect_name = path.splitext(path.basename(f))[0]
+        if cf.is_indexed:
+            # quantized after packing, so that all images share a palette
+            rgba = read_png_rgba(f)
+            if size is not None:
+                w, h = size
+                if fit:
+                    w, h = Resampler.fit(rgba.shape[1], rgba.shape[0], w, h)
+                rgba = Resampler(resize_filter).resize(rgba, w, h)
+            atlas.add_rgba(rect_name, rgba)
+            continue
+
+        img = LVGLImage().from_png(str(f), cf, background=background,
+                                   rgb565_dither=rgb565_dither, size=size,
+                                   resize_filter=resize_filter, fit=fit)
+        img.adjust_stride(align=align)
+        atlas.add(rect_name, img)
+
+    img = atlas.pack()
+    if premultiply:
+        img.premultiply()
+
+    output = path.join(odir, name)
+    if ofmt == OutputFormat.C_ARRAY:
+        atlas.to_c_array(output + ".c", compress=compress,
+                         band_rows=band_rows, policy=compress_policy)
+    else:
+        if ofmt == OutputFormat.BIN_FILE:
+            img.to_bin(output + ".bin", compress=compress,
+                       band_rows=band_rows, policy=compress_policy)
+        else:
+            img.to_png(output + ".png")
+        atlas.to_index(output + "_rects.c")
+
+    individual, packed = atlas.size_report(compress, band_rows,
+                                           compress_policy)
+    print(f"atlas {name}: {len(files)} images in {img.w}x{img.h}, "
+          f"{individual} -> {packed} bytes, "
+          f"saved {individual - packed} bytes")
+    return atlas
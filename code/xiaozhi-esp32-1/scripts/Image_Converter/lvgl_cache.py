@@ -0,0 +1,333 @@
+"""
+On-disk conversion cache and duplicate image detection of LVGLImage.py.
+"""
+import os
+import sys
+import shutil
+import hashlib
+import logging
+import tempfile
+import concurrent.futures
+from os import path
+from typing import List
+
+try:
+    import png
+except ImportError:
+    raise ImportError("Need pypng package, do `pip3 install pypng`")
+
+try:
+    import numpy as np
+except ImportError:
+    # numpy is optional, pure python code paths are used without it
+    np = None
+
+from LVGLImage import (LVGLImage, LVGLImageHeader, _init_worker, rows_to_array,
+                       uint16_t)
+
+
+class ConversionCache:
+    """
+    Content addressed on-disk cache of converted files.
+    The key is the hash of input file content, all conversion options and the
+    converter source, an entry stores the output file, and optionally the
+    uncompressed LVGL image so the image object can be restored without
+    converting again.
+    """
+    VERSION = 2  # bump to invalidate entries created by older converter
+    _source_digest = None
+
+    def __init__(self, cache_dir: str = None, max_size: int = 256 << 20):
+        self.cache_dir = cache_dir or ConversionCache.default_dir()
+        self.max_size = max_size
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    @staticmethod
+    def default_dir() -> str:
+        base = os.environ.get("XDG_CACHE_HOME") or path.join(
+            path.expanduser("~"), ".cache")
+        return path.join(base, "lvgl_image")
+
+    @staticmethod
+    def source_digest() -> str:
+        """
+        Hash of the converter and this module's source, so that any edit
+        of them invalidates entries even if VERSION is not bumped
+        """
+        if ConversionCache._source_digest is None:
+            h = hashlib.sha256()
+            for module in (LVGLImage.__module__, __name__):
+                with open(sys.modules[module].__file__, "rb") as f:
+                    h.update(f.read())
+            ConversionCache._source_digest = h.hexdigest()
+        return ConversionCache._source_digest
+
+    def key(self, data: bytes, **options) -> str:
+        """
+        Return cache key of input data converted with options
+        """
+        h = hashlib.sha256()
+        h.update(f"{ConversionCache.VERSION}".encode())
+        h.update(ConversionCache.source_digest().encode())
+        h.update(repr(sorted(options.items())).encode())
+        h.update(data)
+        return h.hexdigest()
+
+    def _entry(self, key: str, ext: str) -> str:
+        return path.join(self.cache_dir, key[:2], key + ext)
+
+    def _store(self, entry: str, data: bytes):
+        # write to temp file first, entry may be read by other processes
+        os.makedirs(path.dirname(entry), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=path.dirname(entry))
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, entry)
+        except BaseException:
+            os.remove(tmp)
+            raise
+
+    def get(self, key: str, filename: str) -> bool:
+        """
+        Copy cached output to filename, return False if not cached
+        """
+        entry = self._entry(key, ".out")
+        try:
+            shutil.copyfile(entry, filename)
+            os.utime(entry)  # mark as recently used
+        except FileNotFoundError:
+            return False
+
+        logging.info(f"cache hit: {filename}")
+        return True
+
+    def get_image(self, key: str):
+        """
+        Return cached LVGLImage, or None if not cached
+        """
+        entry = self._entry(key, ".img")
+        try:
+            with open(entry, "rb") as f:
+                data = f.read()
+            os.utime(entry)
+        except FileNotFoundError:
+            return None
+        return LVGLImage().from_data(data)
+
+    def put(self, key: str, filename: str, img: "LVGLImage" = None):
+        """
+        Add output file, and the image it's converted from, to cache
+        """
+        with open(filename, "rb") as f:
+            self._store(self._entry(key, ".out"), f.read())
+
+        if img is not None:
+            header = LVGLImageHeader(img.cf, img.w, img.h, img.stride,
+                                     flags=0x01 if img.premultiplied else 0)
+            self._store(self._entry(key, ".img"), header.binary + img.data)
+
+    def get_digest(self, key: str):
+        """
+        Return cached ImageDigest text, or None if not cached
+        """
+        entry = self._entry(key, ".dig")
+        try:
+            with open(entry, "r") as f:
+                text = f.read()
+            os.utime(entry)
+        except FileNotFoundError:
+            return None
+        return text
+
+    def put_digest(self, key: str, text: str):
+        self._store(self._entry(key, ".dig"), text.encode())
+
+    def evict(self):
+        """
+        Remove least recently used entries until cache size is within limit
+        """
+        entries = []
+        total = 0
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                try:
+                    st = os.stat(path.join(root, name))
+                except FileNotFoundError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, path.join(root, name)))
+                total += st.st_size
+
+        entries.sort()
+        for _, size, name in entries:
+            if total <= self.max_size:
+                break
+            try:
+                os.remove(name)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+
+class ImageDigest:
+    """
+    Hash of decoded pixels of a PNG file, so the same image stored as
+    different files or with different PNG encodings is found. Perceptual
+    hash is a 64bit difference hash of the luma, for similar images.
+    Input of RAW formats is not decoded, the hash is of the file content.
+    """
+
+    def __init__(self, filename: str, perceptual: bool = False,
+                 raw: bool = False) -> None:
+        self.filename = filename
+        self.phash = None
+        if raw:
+            with open(filename, "rb") as f:
+                self.digest = hashlib.sha256(f.read()).hexdigest()
+            self.w = self.h = 0
+            return
+
+        reader = png.Reader(filename=filename)
+        w, h, rows, _ = reader.asRGBA8()
+        self.w = w
+        self.h = h
+
+        sha = hashlib.sha256(uint16_t(w) + uint16_t(h))
+        if np is not None:
+            rgba = rows_to_array(rows, w, h)
+            sha.update(rgba.tobytes())
+        else:
+            rgba = None
+            for row in rows:
+                sha.update(bytes(row))
+        self.digest = sha.hexdigest()
+
+        if perceptual and rgba is not None:
+            self.phash = self.dhash(rgba)
+
+    def __repr__(self) -> str:
+        return f"'{self.filename}: {self.w}x{self.h}, {self.digest[:16]}'"
+
+    def to_text(self) -> str:
+        phash = "-" if self.phash is None else str(self.phash)
+        return f"{self.w} {self.h} {self.digest} {phash}"
+
+    @staticmethod
+    def from_text(filename: str, text: str) -> "ImageDigest":
+        """
+        Restore digest saved by to_text
+        """
+        w, h, digest, phash = text.split()
+        d = ImageDigest.__new__(ImageDigest)
+        d.filename = filename
+        d.w = int(w)
+        d.h = int(h)
+        d.digest = digest
+        d.phash = None if phash == "-" else int(phash)
+        return d
+
+    @staticmethod
+    def dhash(rgba: "np.ndarray") -> int:
+        h, w = rgba.shape[:2]
+        pixels = rgba.astype(np.float32)
+        luma = (pixels[..., 0] * 0.299 + pixels[..., 1] * 0.587 +
+                pixels[..., 2] * 0.114) * pixels[..., 3] / 255
+
+        # box filter down to 9x8
+        ys = np.arange(8) * h // 8
+        xs = np.arange(9) * w // 9
+        sums = np.add.reduceat(np.add.reduceat(luma, ys, axis=0), xs, axis=1)
+        ny = np.diff(np.append(ys, h))
+        nx = np.diff(np.append(xs, w))
+        small = sums / np.maximum(np.outer(ny, nx), 1)
+
+        bits = (small[:, 1:] > small[:, :-1]).reshape(-1)
+        return int(np.packbits(bits).view(">u8")[0])
+
+
+def _image_digest(filename, perceptual, raw):
+    return ImageDigest(filename, perceptual, raw)
+
+
+class DuplicateFinder:
+    """
+    Find images with the same decoded pixels, and optionally images which
+    look nearly the same by perceptual hash, within threshold bits.
+    RAW files are compared by content only. With a cache, digests are kept
+    by file content so unchanged files are not decoded again.
+    """
+
+    def __init__(self, perceptual: bool = False, threshold: int = 4,
+                 raw: bool = False, cache: ConversionCache = None) -> None:
+        if perceptual and np is None:
+            logging.warning("numpy is not available, "
+                            "near duplicate detection is disabled")
+            perceptual = False
+        self.perceptual = perceptual and not raw
+        self.threshold = threshold
+        self.raw = raw
+        self.cache = cache
+
+    def digests(self, files: List, jobs: int = 1) -> List[ImageDigest]:
+        files = [str(f) for f in files]
+        digests = [None] * len(files)
+        keys = [None] * len(files)
+        if self.cache:
+            for i, f in enumerate(files):
+                with open(f, "rb") as fp:
+                    keys[i] = self.cache.key(fp.read(), digest=True,
+                                             perceptual=self.perceptual,
+                                             raw=self.raw)
+                text = self.cache.get_digest(keys[i])
+                if text is not None:
+                    digests[i] = ImageDigest.from_text(f, text)
+
+        todo = [i for i, d in enumerate(digests) if d is None]
+        if jobs <= 1 or len(todo) <= 1:
+            computed = [ImageDigest(files[i], self.perceptual, self.raw)
+                        for i in todo]
+        else:
+            with concurrent.futures.ProcessPoolExecutor(
+                    max_workers=jobs,
+                    initializer=_init_worker,
+                    initargs=(logging.getLogger().level, )) as pool:
+                computed = list(pool.map(_image_digest,
+                                         [files[i] for i in todo],
+                                         [self.perceptual] * len(todo),
+                                         [self.raw] * len(todo)))
+
+        for i, d in zip(todo, computed):
+            digests[i] = d
+            if self.cache:
+                self.cache.put_digest(keys[i], d.to_text())
+        return digests
+
+    def find(self, files: List, jobs: int = 1):
+        """
+        Return (aliases, near), aliases maps each duplicated file to the
+        first file in files with the same pixels, near is a list of
+        (file, file, distance) of different images with similar hash.
+        """
+        digests = self.digests(files, jobs)
+
+        aliases = {}
+        first = {}
+        for d, f in zip(digests, files):
+            if d.digest in first:
+                aliases[f] = first[d.digest]
+            else:
+                first[d.digest] = f
+
+        near = []
+        if self.perceptual:
+            unique = [(d, f) for d, f in zip(digests, files) if f not in aliases]
+            hashes = np.array([d.phash for d, _ in unique], dtype=np.uint64)
+            for i, h in enumerate(hashes[:-1]):
+                xor = hashes[i + 1:] ^ h
+                distance = np.unpackbits(
+                    xor.view(np.uint8).reshape(-1, 8), axis=1).sum(axis=1)
+                for j in np.nonzero(distance <= self.threshold)[0]:
+                    near.append((unique[i][1], unique[i + 1 + j][1],
+                                 int(distance[j])))
+
+        return aliases, near
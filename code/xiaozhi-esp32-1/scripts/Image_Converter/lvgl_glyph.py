@@ -0,0 +1,307 @@
+"""
+Slice a sheet of glyphs into alpha-only glyph bitmaps, see GlyphSheet.
+"""
+import logging
+from os import path
+from typing import List
+
+try:
+    import png
+except ImportError:
+    raise ImportError("Need pypng package, do `pip3 install pypng`")
+
+try:
+    import numpy as np
+except ImportError:
+    # numpy is optional, pure python code paths are used without it
+    np = None
+
+from LVGLImage import (ColorFormat, FormatError, HEX_TABLE, LVGLImage,
+                       ParameterError, c_varname, check_dir, check_ext,
+                       pack_bits_np, rows_to_array, uint16_t, uint32_t,
+                       uint8_t)
+
+
+class Glyph:
+
+    def __init__(self, id: int, x: int, y: int, w: int, h: int,
+                 data: bytes) -> None:
+        self.id = id
+        self.x = x  # offset of trimmed bitmap in the cell
+        self.y = y
+        self.w = w
+        self.h = h
+        self.data = data
+
+    def __repr__(self) -> str:
+        return f"'glyph {self.id:#x}: ({self.x}, {self.y}, {self.w}x{self.h})'"
+
+
+class GlyphSheet:
+    """
+    Slice a sheet of glyphs in a grid of cells to alpha-only glyph bitmaps.
+    Empty borders of each cell are trimmed, empty cells are skipped. Glyph
+    coverage is alpha channel of the sheet, or luma if it has no alpha,
+    i.e. white glyphs on black.
+
+    Binary format, all little endian:
+        u32 magic, u8 cf, u8 reserved, u16 glyph count,
+        u16 cell w, u16 cell h,
+        glyph index sorted by id, 16 bytes each: u32 id, u32 offset of
+        bitmap from the end of index, u16 x, u16 y, u16 w, u16 h,
+        bitmaps, every row padded to whole bytes.
+    """
+
+    MAGIC = 0x53594c47  # "GLYS"
+
+    def __init__(self,
+                 cf: ColorFormat,
+                 cell_w: int,
+                 cell_h: int,
+                 spacing: int = 0,
+                 first_id: int = 0) -> None:
+        if np is None:
+            raise ImportError("Need numpy package, do `pip3 install numpy`")
+        if cf is None or not cf.is_alpha_only:
+            raise ParameterError(f"Glyph sheet needs A1/2/4/8: {cf}")
+        if cell_w <= 0 or cell_h <= 0 or spacing < 0:
+            raise ParameterError(f"Invalid cell: {cell_w}x{cell_h}, "
+                                 f"spacing: {spacing}")
+        self.cf = cf
+        self.cell_w = cell_w
+        self.cell_h = cell_h
+        self.spacing = spacing
+        self.first_id = first_id
+        self.glyphs: List[Glyph] = []
+
+    def from_png(self, filename: str, ids: List[int] = None):
+        """
+        Slice png file, see from_array
+        """
+        reader = png.Reader(filename=str(filename))
+        w, h, rows, _ = reader.asRGBA8()
+        rgba = rows_to_array(rows, w, h)
+        # info of asRGBA8 always has alpha, check the source format
+        if reader.alpha or reader.trns is not None:
+            return self.from_array(rgba[:, :, 3], ids)
+
+        luma = LVGLImage()
+        luma.background = 0
+        luma._rgba_to_luma_only(rgba)
+        return self.from_array(
+            np.frombuffer(luma.data, dtype=np.uint8).reshape(h, w), ids)
+
+    def from_array(self, alpha: "np.ndarray", ids: List[int] = None):
+        """
+        Slice (h, w) uint8 coverage array. Cells are numbered row by row,
+        glyph id is ids[n] if given, or first_id + n.
+        """
+        pitch_w = self.cell_w + self.spacing
+        pitch_h = self.cell_h + self.spacing
+        cols = (alpha.shape[1] + self.spacing) // pitch_w
+        rows = (alpha.shape[0] + self.spacing) // pitch_h
+        if cols == 0 or rows == 0:
+            raise ParameterError(f"sheet {alpha.shape[1]}x{alpha.shape[0]} "
+                                 f"smaller than cell")
+        if ids is not None and len(ids) < rows * cols:
+            raise ParameterError(f"{len(ids)} ids for {rows * cols} cells")
+
+        # (rows, cols, cell_h, cell_w) view of all cells, spacing dropped
+        padded = np.zeros((rows * pitch_h, cols * pitch_w), dtype=np.uint8)
+        used = alpha[:rows * pitch_h, :cols * pitch_w]
+        padded[:used.shape[0], :used.shape[1]] = used
+        cells = padded.reshape(rows, pitch_h, cols, pitch_w)
+        cells = cells[:, :self.cell_h, :, :self.cell_w].transpose(0, 2, 1, 3)
+        values = cells >> (8 - self.cf.bpp)
+
+        # bounding box of every cell at once
+        ink_y = values.any(axis=3)  # (rows, cols, cell_h)
+        ink_x = values.any(axis=2)  # (rows, cols, cell_w)
+        empty = ~ink_y.any(axis=2)
+        top = ink_y.argmax(axis=2)
+        bottom = self.cell_h - ink_y[:, :, ::-1].argmax(axis=2)
+        left = ink_x.argmax(axis=2)
+        right = self.cell_w - ink_x[:, :, ::-1].argmax(axis=2)
+
+        self.glyphs = []
+        for n, (r, c) in enumerate(np.ndindex(rows, cols)):
+            if empty[r, c]:
+                continue
+            y0, y1 = int(top[r, c]), int(bottom[r, c])
+            x0, x1 = int(left[r, c]), int(right[r, c])
+            bitmap = values[r, c, y0:y1, x0:x1]
+            if self.cf != ColorFormat.A8:
+                bitmap = pack_bits_np(bitmap, self.cf.bpp)
+            glyph_id = ids[n] if ids is not None else self.first_id + n
+            self.glyphs.append(
+                Glyph(glyph_id, x0, y0, x1 - x0, y1 - y0, bitmap.tobytes()))
+
+        self.glyphs.sort(key=lambda g: g.id)
+        if len({g.id for g in self.glyphs}) != len(self.glyphs):
+            raise ParameterError("duplicated glyph id")
+        logging.info(f"glyph sheet: {rows}x{cols} cells, "
+                     f"{len(self.glyphs)} glyphs")
+        return self
+
+    @property
+    def binary(self) -> bytearray:
+        if len(self.glyphs) > 0xffff:
+            raise ParameterError(f"too many glyphs: {len(self.glyphs)}")
+
+        binary = bytearray()
+        binary += uint32_t(self.MAGIC)
+        binary += uint8_t(self.cf.value)
+        binary += uint8_t(0)
+        binary += uint16_t(len(self.glyphs))
+        binary += uint16_t(self.cell_w)
+        binary += uint16_t(self.cell_h)
+
+        offset = 0
+        for g in self.glyphs:
+            binary += uint32_t(g.id)
+            binary += uint32_t(offset)
+            binary += uint16_t(g.x)
+            binary += uint16_t(g.y)
+            binary += uint16_t(g.w)
+            binary += uint16_t(g.h)
+            offset += len(g.data)
+
+        for g in self.glyphs:
+            binary += g.data
+        return binary
+
+    def from_binary(self, data: bytes):
+        """
+        Read glyphs back from binary
+        """
+        if len(data) < 12 or int.from_bytes(data[0:4], 'little') != self.MAGIC:
+            raise FormatError("invalid glyph sheet header")
+        try:
+            self.cf = ColorFormat(data[4])
+        except ValueError as exc:
+            raise FormatError(f"invalid color format: {data[4]}") from exc
+        count = int.from_bytes(data[6:8], 'little')
+        self.cell_w = int.from_bytes(data[8:10], 'little')
+        self.cell_h = int.from_bytes(data[10:12], 'little')
+        start = 12 + 16 * count
+        if len(data) < start:
+            raise FormatError("glyph index truncated")
+
+        self.glyphs = []
+        for i in range(count):
+            entry = data[12 + 16 * i:28 + 16 * i]
+            glyph_id, offset = (int.from_bytes(entry[k:k + 4], 'little')
+                                for k in (0, 4))
+            x, y, w, h = (int.from_bytes(entry[k:k + 2], 'little')
+                          for k in (8, 10, 12, 14))
+            size = (w * self.cf.bpp + 7) // 8 * h
+            bitmap = data[start + offset:start + offset + size]
+            if len(bitmap) < size:
+                raise FormatError(f"glyph {glyph_id:#x} data truncated")
+            self.glyphs.append(Glyph(glyph_id, x, y, w, h, bytes(bitmap)))
+        return self
+
+    def to_bin(self, filename: str):
+        check_ext(filename, ".bin")
+        check_dir(filename)
+        with open(filename, "wb") as f:
+            f.write(self.binary)
+        return self
+
+    def write_header(self, filename: str, varname: str):
+        """
+        Write C header with the sheet types and declaration
+        """
+        guard = c_varname(filename).upper() + "_H"
+        with open(filename, "w") as f:
+            f.write(f'''#ifndef {guard}
+#define {guard}
+
+#include <stdint.h>
+
+#ifndef XZ_GLYPH_SHEET_DEFINED
+#define XZ_GLYPH_SHEET_DEFINED
+typedef struct {{
+  uint32_t id;
+  uint32_t offset;
+  uint16_t x;
+  uint16_t y;
+  uint16_t w;
+  uint16_t h;
+}} xz_glyph_sheet_dsc_t;
+
+typedef struct {{
+  uint8_t cf;
+  uint16_t cell_w;
+  uint16_t cell_h;
+  uint32_t glyph_count;
+  const xz_glyph_sheet_dsc_t *glyphs; /* sorted by id */
+  const uint8_t *bitmap; /* glyph offset is from here */
+}} xz_glyph_sheet_t;
+#endif
+
+extern const xz_glyph_sheet_t {varname};
+
+#endif /* {guard} */
+''')
+
+    def to_c_array(self, filename: str):
+        """
+        Write bitmaps and glyph index as C arrays, referenced by the sheet
+        descriptor named after filename, which is declared in the header
+        of the same name
+        """
+        check_ext(filename, ".c")
+        check_dir(filename)
+        varname = c_varname(filename)
+        header = filename[:-len(".c")] + ".h"
+        self.write_header(header, varname)
+        with open(filename, "w") as f:
+            f.write(f'''
+#include "{path.basename(header)}"
+
+/* LV_COLOR_FORMAT_{self.cf.name}, cell {self.cell_w}x{self.cell_h} */
+static const uint8_t {varname}_bitmap[] = {{
+''')
+            offset = 0
+            for g in self.glyphs:
+                f.write(f"  /* {g.id:#x} */\n")
+                stride = (g.w * self.cf.bpp + 7) // 8
+                for y in range(g.h):
+                    row = g.data[y * stride:(y + 1) * stride]
+                    f.write("  " + "".join(HEX_TABLE[b] for b in row) + "\n")
+                offset += len(g.data)
+            if not offset:
+                f.write("  0x00\n")
+
+            f.write(f'''}};
+
+static const xz_glyph_sheet_dsc_t {varname}_glyphs[] = {{
+''')
+            offset = 0
+            for g in self.glyphs:
+                f.write(f"  {{{g.id:#x}, {offset}, {g.x}, {g.y}, "
+                        f"{g.w}, {g.h}}},\n")
+                offset += len(g.data)
+            if not self.glyphs:
+                f.write("  {0}\n")
+
+            f.write(f'''}};
+
+const xz_glyph_sheet_t {varname} = {{
+  .cf = {self.cf.value},
+  .cell_w = {self.cell_w},
+  .cell_h = {self.cell_h},
+  .glyph_count = {len(self.glyphs)},
+  .glyphs = {varname}_glyphs,
+  .bitmap = {varname}_bitmap,
+}};
+''')
+        return self
+
+    def glyph_image(self, glyph: Glyph) -> "LVGLImage":
+        """
+        Return glyph bitmap as LVGLImage, e.g. to check it with to_png
+        """
+        return LVGLImage().set_data(self.cf, glyph.w, glyph.h,
+                                    bytearray(glyph.data))
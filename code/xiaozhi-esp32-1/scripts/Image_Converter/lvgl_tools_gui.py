@@ -2,9 +2,16 @@ import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
 from PIL import Image
 import os
-import tempfile
 import sys
+import time
+import queue
+import threading
+import concurrent.futures
 from LVGLImage import LVGLImage, ColorFormat, CompressMethod
+from lvgl_cache import ConversionCache
+
+# 缓存键只包含 LVGLImage.py 的源码，修改 convert_image 的缩放或转换方式后需要加一
+CACHE_VERSION = 1
 
 HELP_TEXT = """LVGL图片转换工具使用说明：
 
@@ -25,6 +32,8 @@ HELP_TEXT = """LVGL图片转换工具使用说明：
    默认为程序所在目录下的output文件夹
 
 7. 转换：点击“转换全部”或“转换选中”开始转换
+   文件在后台的多个进程中并行转换，进程数可以在“转换设置”中修改
+   转换过程中可以点击“取消”，正在转换的文件会继续完成
 """
 
 class ImageConverterApp:
@@ -38,6 +47,15 @@ class ImageConverterApp:
         self.resolution = tk.StringVar(value="128x128")
         self.color_format = tk.StringVar(value="自动识别")
         self.compress_method = tk.StringVar(value="NONE")
+        self.use_cache = tk.BooleanVar(value=True)
+        self.save_preview = tk.BooleanVar(value=True)
+        self.workers = tk.IntVar(value=os.cpu_count() or 1)
+        self.status = tk.StringVar(value="")
+
+        # 后台转换状态
+        self.executor = None
+        self.futures = []
+        self.results = queue.Queue()
 
         # 创建UI组件
         self.create_widgets()
@@ -63,6 +81,19 @@ class ImageConverterApp:
         ttk.Combobox(settings_frame, textvariable=self.compress_method,
                     values=["NONE", "RLE"], width=8).grid(row=0, column=5, padx=2)
 
+        # 缓存
+        ttk.Checkbutton(settings_frame, text="启用缓存",
+                        variable=self.use_cache).grid(row=0, column=6, padx=2)
+
+        # 预览图
+        ttk.Checkbutton(settings_frame, text="保存预览图",
+                        variable=self.save_preview).grid(row=0, column=7, padx=2)
+
+        # 并行转换的进程数
+        ttk.Label(settings_frame, text="进程数:").grid(row=1, column=0, padx=2)
+        ttk.Spinbox(settings_frame, textvariable=self.workers,
+                    from_=1, to=64, width=6).grid(row=1, column=1, padx=2, sticky="w")
+
         # 文件操作框架
         file_frame = ttk.LabelFrame(self.root, text="选取文件")
         file_frame.grid(row=1, column=0, padx=10, pady=5, sticky="nsew")
@@ -95,11 +126,20 @@ class ImageConverterApp:
         convert_frame.grid(row=3, column=0, padx=10, pady=10)
         ttk.Button(convert_frame, text="转换全部文件", command=lambda: self.start_conversion(True)).pack(side=tk.LEFT, padx=5)
         ttk.Button(convert_frame, text="转换选中文件", command=lambda: self.start_conversion(False)).pack(side=tk.LEFT, padx=5)
+        self.cancel_button = ttk.Button(convert_frame, text="取消", command=self.cancel_conversion, state=tk.DISABLED)
+        self.cancel_button.pack(side=tk.LEFT, padx=5)
         ttk.Button(convert_frame, text="帮助", command=self.show_help).pack(side=tk.RIGHT, padx=5)
 
+        # 进度条
+        progress_frame = ttk.Frame(self.root)
+        progress_frame.grid(row=4, column=0, padx=10, pady=2, sticky="ew")
+        self.progress = ttk.Progressbar(progress_frame, mode="determinate")
+        self.progress.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5)
+        ttk.Label(progress_frame, textvariable=self.status, width=24).pack(side=tk.RIGHT, padx=5)
+
         # 日志区域（新增清空按钮部分）
         log_frame = ttk.LabelFrame(self.root, text="日志")
-        log_frame.grid(row=4, column=0, padx=10, pady=5, sticky="nsew")
+        log_frame.grid(row=5, column=0, padx=10, pady=5, sticky="nsew")
         
         # 添加按钮框架
         log_btn_frame = ttk.Frame(log_frame)
@@ -114,7 +154,7 @@ class ImageConverterApp:
         # 布局配置
         self.root.columnconfigure(0, weight=1)
         self.root.rowconfigure(1, weight=1)
-        self.root.rowconfigure(4, weight=1)
+        self.root.rowconfigure(5, weight=1)
 
     def clear_log(self):
         """清空日志内容"""
@@ -172,6 +212,10 @@ class ImageConverterApp:
             self.tree.delete(item)
 
     def start_conversion(self, convert_all):
+        if self.executor is not None:
+            messagebox.showwarning("警告", "正在转换中，请等待完成或取消")
+            return
+
         input_files = [
             self.tree.item(item, "tags")[0]
             for item in self.tree.get_children()
@@ -182,6 +226,15 @@ class ImageConverterApp:
             msg = "没有找到可转换的文件" if convert_all else "没有选中任何文件"
             messagebox.showwarning("警告", msg)
             return
+
+        # 进程数输入框可能为空或不是数字
+        try:
+            workers = self.workers.get()
+        except tk.TclError:
+            workers = 0
+        if workers < 1:
+            messagebox.showwarning("警告", "进程数必须是正整数")
+            return
         
         os.makedirs(self.output_dir.get(), exist_ok=True)
         
@@ -190,62 +243,151 @@ class ImageConverterApp:
         compress = CompressMethod.RLE if self.compress_method.get() == "RLE" else CompressMethod.NONE
 
         # 执行转换
-        self.convert_images(input_files, width, height, compress)
-
-    def convert_images(self, input_files, width, height, compress):
-        success_count = 0
-        total_files = len(input_files)
-        
-        for idx, file_path in enumerate(input_files):
+        self.convert_images(input_files, width, height, compress, workers)
+
+    def convert_images(self, input_files, width, height, compress, workers):
+        """在后台进程池中转换图片，结果通过队列交给界面线程显示"""
+        options = dict(width=width, height=height,
+                       color_format=self.color_format.get(),
+                       compress=compress,
+                       output_dir=self.output_dir.get(),
+                       use_cache=self.use_cache.get(),
+                       save_preview=self.save_preview.get())
+
+        self.total_files = len(input_files)
+        self.done_count = 0
+        self.processed_count = 0
+        self.success_count = 0
+        self.cancelled = False
+        self.start_time = time.perf_counter()
+        self.progress.configure(maximum=self.total_files, value=0)
+        self.status.set(f"0/{self.total_files}")
+        self.cancel_button.configure(state=tk.NORMAL)
+
+        workers = min(workers, self.total_files)
+        print(f"开始转换 {self.total_files} 个文件, 进程数: {workers}\n")
+        self.executor = concurrent.futures.ProcessPoolExecutor(max_workers=workers)
+        self.futures = []
+        for file_path in input_files:
+            future = self.executor.submit(convert_image, file_path, **options)
+            # 回调在后台线程中执行，只把结果放进队列
+            future.add_done_callback(
+                lambda f, file_path=file_path: self.results.put((file_path, f)))
+            self.futures.append(future)
+
+        self.root.after(100, self.poll_results)
+
+    def poll_results(self):
+        """定时从队列中取出转换结果，更新日志和进度"""
+        while True:
             try:
-                print(f"正在处理: {os.path.basename(file_path)}")
-                
-                with Image.open(file_path) as img:
-                    # 调整图片大小
-                    img = img.resize((width, height), Image.Resampling.LANCZOS)
-                    
-                    # 处理颜色格式
-                    color_format_str = self.color_format.get()
-                    if color_format_str == "自动识别":
-                        # 检测透明通道
-                        has_alpha = img.mode in ('RGBA', 'LA') or (img.mode == 'P' and 'transparency' in img.info)
-                        if has_alpha:
-                            img = img.convert('RGBA')
-                            cf = ColorFormat.RGB565A8
-                        else:
-                            img = img.convert('RGB')
-                            cf = ColorFormat.RGB565
-                    else:
-                        if color_format_str == "RGB565A8":
-                            img = img.convert('RGBA')
-                            cf = ColorFormat.RGB565A8
-                        else:
-                            img = img.convert('RGB')
-                            cf = ColorFormat.RGB565
-
-                    # 保存调整后的图片
-                    base_name = os.path.splitext(os.path.basename(file_path))[0]
-                    output_image_path = os.path.join(self.output_dir.get(), f"{base_name}_{width}x{height}.png")
-                    img.save(output_image_path, 'PNG')
-
-                    # 创建临时文件
-                    with tempfile.NamedTemporaryFile(suffix=".png", delete=False) as tmpfile:
-                        temp_path = tmpfile.name
-                        img.save(temp_path, 'PNG')
-
-                    # 转换为LVGL C数组
-                    lvgl_img = LVGLImage().from_png(temp_path, cf=cf)
-                    output_c_path = os.path.join(self.output_dir.get(), f"{base_name}.c")
-                    lvgl_img.to_c_array(output_c_path, compress=compress)
-
-                    success_count += 1
-                    os.unlink(temp_path)
-                    print(f"成功转换: {base_name}.c\n")
-
+                file_path, future = self.results.get_nowait()
+            except queue.Empty:
+                break
+
+            self.done_count += 1
+            if future.cancelled():
+                continue
+            self.processed_count += 1
+            try:
+                success, message, elapsed = future.result()
             except Exception as e:
-                print(f"转换失败: {str(e)}\n")
+                success, message, elapsed = False, f"转换失败: {os.path.basename(file_path)}: {e}", 0
+            self.success_count += success
+            print(f"{message} ({elapsed:.2f}s)\n")
+
+        total_time = time.perf_counter() - self.start_time
+        throughput = self.processed_count / total_time if total_time else 0
+        self.progress.configure(value=self.done_count)
+        self.status.set(f"{self.done_count}/{self.total_files}  {throughput:.1f} 个/秒")
 
-        print(f"转换完成! 成功 {success_count}/{total_files} 个文件\n")
+        if self.done_count < self.total_files:
+            self.root.after(100, self.poll_results)
+            return
+
+        self.executor.shutdown(wait=False)
+        self.executor = None
+        self.cancel_button.configure(state=tk.DISABLED)
+        if self.use_cache.get():
+            # 遍历整个缓存目录可能较慢，不在界面线程中执行
+            threading.Thread(target=lambda: ConversionCache().evict(), daemon=True).start()
+
+        state = "已取消" if self.cancelled else "转换完成"
+        print(f"{state}! 成功 {self.success_count}/{self.total_files} 个文件, "
+              f"用时 {total_time:.1f}s, {throughput:.1f} 个/秒\n")
+
+    def cancel_conversion(self):
+        """取消还没有开始的转换，正在转换的文件会继续完成"""
+        if self.executor is None:
+            return
+        self.cancelled = True
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        print("正在取消...\n")
+
+
+def convert_image(file_path, width, height, color_format, compress,
+                  output_dir, use_cache, save_preview):
+    """在子进程中转换单个文件，返回 (是否成功, 日志信息, 耗时)"""
+    start = time.perf_counter()
+    cache = ConversionCache() if use_cache else None
+    try:
+        base_name = os.path.splitext(os.path.basename(file_path))[0]
+        output_image_path = os.path.join(output_dir, f"{base_name}_{width}x{height}.png")
+        output_c_path = os.path.join(output_dir, f"{base_name}.c")
+
+        # 输入文件和参数都没有变化时直接使用缓存的结果
+        if cache:
+            with open(file_path, "rb") as f:
+                data = f.read()
+            png_key = cache.key(data, width=width, height=height, output="png",
+                                color_format=color_format, gui=CACHE_VERSION)
+            c_key = cache.key(data, width=width, height=height, output="c",
+                              gui=CACHE_VERSION,
+                              color_format=color_format,
+                              compress=compress, name=base_name)
+            if ((not save_preview or cache.get(png_key, output_image_path))
+                    and cache.get(c_key, output_c_path)):
+                return True, f"使用缓存: {base_name}.c", time.perf_counter() - start
+
+        with Image.open(file_path) as img:
+            # 调整图片大小
+            img = img.resize((width, height), Image.Resampling.LANCZOS)
+
+            # 处理颜色格式
+            if color_format == "自动识别":
+                # 检测透明通道
+                has_alpha = img.mode in ('RGBA', 'LA') or (img.mode == 'P' and 'transparency' in img.info)
+                if has_alpha:
+                    img = img.convert('RGBA')
+                    cf = ColorFormat.RGB565A8
+                else:
+                    img = img.convert('RGB')
+                    cf = ColorFormat.RGB565
+            else:
+                if color_format == "RGB565A8":
+                    img = img.convert('RGBA')
+                    cf = ColorFormat.RGB565A8
+                else:
+                    img = img.convert('RGB')
+                    cf = ColorFormat.RGB565
+
+            # 保存调整后的图片
+            if save_preview:
+                img.save(output_image_path, 'PNG')
+
+            # 直接从内存中的图片转换为LVGL C数组
+            lvgl_img = LVGLImage().from_pil(img, cf=cf)
+            lvgl_img.to_c_array(output_c_path, compress=compress)
+
+            if cache:
+                if save_preview:
+                    cache.put(png_key, output_image_path)
+                cache.put(c_key, output_c_path)
+
+        return True, f"成功转换: {base_name}.c", time.perf_counter() - start
+
+    except Exception as e:
+        return False, f"转换失败: {os.path.basename(file_path)}: {str(e)}", time.perf_counter() - start
 
 if __name__ == "__main__":
     root = tk.Tk()
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Round-trip and truncation checks of the compressed data written and read by
+LVGLImage.py. Run directly, or with pytest.
+"""
+import os
+import random
+import logging
+import tempfile
+
+from LVGLImage import (ColorFormat, CompressMethod, FormatError,
+                       LVGLCompressData, LVGLDecompressData, LVGLImage,
+                       LVGLImageHeader, uint32_t)
+
+METHODS = (CompressMethod.RLE, CompressMethod.LZ4, CompressMethod.LZ4_BANDED)
+FORMATS = (ColorFormat.L8, ColorFormat.I4, ColorFormat.RGB565,
+           ColorFormat.RGB565A8, ColorFormat.RGB888, ColorFormat.ARGB8888)
+
+
+def make_image(cf: ColorFormat, w: int = 37, h: int = 29,
+               seed: int = 0) -> LVGLImage:
+    """
+    Image of random runs, so RLE writes both repeated and literal packets
+    """
+    rnd = random.Random(seed)
+    stride = LVGLImageHeader(cf, w, h, align=1).stride
+    size = cf.ncolors * 4 + stride * h
+    if cf is ColorFormat.RGB565A8:
+        size += stride // 2 * h
+    data = bytearray()
+    while len(data) < size:
+        if rnd.random() < 0.5:
+            data += bytes([rnd.randrange(256)]) * rnd.randrange(1, 300)
+        else:
+            data += bytes(rnd.randrange(256) for _ in range(rnd.randrange(40)))
+    return LVGLImage(cf, w, h, bytes(data[:size]))
+
+
+def compress(img: LVGLImage, method: CompressMethod,
+             band_rows: int = 4) -> bytes:
+    bands = img.band_bounds(band_rows) \
+        if method == CompressMethod.LZ4_BANDED else None
+    return bytes(LVGLCompressData(img.cf, method, img.data, bands).compressed)
+
+
+def test_round_trip():
+    for cf in FORMATS:
+        img = make_image(cf)
+        for method in METHODS:
+            compressed = compress(img, method)
+            raw = LVGLDecompressData(cf, compressed).decompress()
+            assert raw[:img.data_len] == img.data, (cf.name, method.name)
+
+
+def test_decompress_range():
+    rnd = random.Random(1)
+    for cf in FORMATS:
+        img = make_image(cf)
+        size = img.data_len
+        ranges = [(0, size), (0, 1), (size - 1, size), (-5, 3),
+                  (size - 3, size + 5), (7, 7)]
+        # ranges within and across bands and planes
+        bounds = img.band_bounds(4)
+        ranges += [(b - 1, b + 1) for b in bounds[1:-1]]
+        ranges += [tuple(sorted(rnd.sample(range(size), 2)))
+                   for _ in range(20)]
+        for method in METHODS:
+            compressed = compress(img, method)
+            for start, end in ranges:
+                # a new decoder each time, so the range is not cut from
+                # the whole decompressed data
+                got = LVGLDecompressData(cf, compressed).decompress_range(
+                    start, end)
+                expect = img.data[max(0, start):end]
+                assert got == expect, (cf.name, method.name, start, end)
+
+
+def expect_format_error(func, *args):
+    try:
+        func(*args)
+    except FormatError:
+        return
+    raise AssertionError(f"no FormatError from {func.__name__}{args}")
+
+
+def test_truncated():
+    img = make_image(ColorFormat.RGB565)
+    for method in METHODS:
+        compressed = compress(img, method)
+
+        # compressed data shorter than the header says
+        for cut in (1, 12, len(compressed) // 2, len(compressed) - 1):
+            expect_format_error(LVGLDecompressData, img.cf,
+                                compressed[:cut])
+
+        # header claims more raw data than compressed data holds
+        header = compressed[:8] + uint32_t(img.data_len + 64)
+        decoder = LVGLDecompressData(img.cf, header + compressed[12:])
+        expect_format_error(decoder.decompress)
+
+    # unknown compress method
+    compressed = compress(img, CompressMethod.LZ4)
+    expect_format_error(LVGLDecompressData, img.cf,
+                        uint32_t(7) + compressed[4:])
+
+
+def test_bin_file():
+    with tempfile.TemporaryDirectory() as tmp:
+        for cf in FORMATS:
+            img = make_image(cf)
+            for method in METHODS:
+                filename = os.path.join(tmp, f"{cf.name}.{method.name}.bin")
+                img.to_bin(filename, compress=method, band_rows=4)
+                got = LVGLImage().from_bin(filename)
+                assert (got.cf, got.w, got.h) == (img.cf, img.w, img.h)
+                assert got.data == img.data, (cf.name, method.name)
+
+                with open(filename, "rb") as f:
+                    data = f.read()
+                with open(filename, "wb") as f:
+                    f.write(data[:-1])
+                expect_format_error(LVGLImage().from_bin, filename)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+    test_round_trip()
+    test_decompress_range()
+    test_truncated()
+    test_bin_file()
+    print("all tests passed")
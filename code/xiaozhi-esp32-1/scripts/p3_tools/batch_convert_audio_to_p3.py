@@ -0,0 +1,199 @@
+# convert many audio files to p3 in parallel
+import os
+import sys
+import glob
+import time
+import argparse
+import tqdm
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from convert_audio_to_p3 import encode_audio_to_opus, FRAME_DURATION
+
+AUDIO_EXTENSIONS = ('.wav', '.mp3', '.ogg', '.flac', '.m4a', '.aac', '.opus')
+
+
+def glob_root(pattern):
+    """
+    Leading part of a glob pattern without wildcards
+    """
+    root = pattern
+    while glob.has_magic(root):
+        root = os.path.dirname(root)
+    return root or "."
+
+
+def collect_files(inputs, output_dir):
+    """
+    Expand files, directories and glob patterns to (input, output) pairs.
+    Files found in a directory, or matched by a pattern, keep their path
+    relative to it (or to the part of the pattern before any wildcard)
+    under output_dir. Raise ValueError if different inputs would be
+    written to the same output.
+    """
+    pairs = []
+    for item in inputs:
+        if os.path.isdir(item):
+            for root, _, files in os.walk(item):
+                for name in sorted(files):
+                    if not name.lower().endswith(AUDIO_EXTENSIONS):
+                        continue
+                    input_path = os.path.join(root, name)
+                    pairs.append((input_path, os.path.relpath(input_path, item)))
+            continue
+
+        if not glob.has_magic(item):
+            if os.path.isfile(item):
+                pairs.append((item, os.path.basename(item)))
+            continue
+
+        matches = sorted(glob.glob(item, recursive=True))
+        if not matches:
+            print(f"No match for {item}", file=sys.stderr)
+        root = glob_root(item)
+        for input_path in matches:
+            if os.path.isfile(input_path):
+                pairs.append((input_path, os.path.relpath(input_path, root)))
+
+    tasks = {}
+    collisions = []
+    for input_path, relative in pairs:
+        output_path = os.path.join(output_dir, os.path.splitext(relative)[0] + ".p3")
+        first = tasks.setdefault(output_path, input_path)
+        if os.path.abspath(first) != os.path.abspath(input_path):
+            collisions.append(f"{input_path} and {first} both convert to {output_path}")
+    if collisions:
+        raise ValueError("\n".join(collisions))
+
+    return [(input_path, output_path) for output_path, input_path in tasks.items()]
+
+
+def is_up_to_date(input_path, output_path):
+    """
+    Only modification times are compared, changed encoding options are not
+    noticed, see --force
+    """
+    try:
+        output = os.stat(output_path)
+    except FileNotFoundError:
+        return False
+    return output.st_size > 0 and output.st_mtime >= os.stat(input_path).st_mtime
+
+
+def encode_file(input_path, output_path, target_lufs, trim_silence, silence_threshold,
+                p3_version):
+    """
+    Worker, return (input, output bytes, audio seconds, cpu seconds, error)
+    """
+    start = time.process_time()
+    temp_path = output_path + ".part"
+    try:
+        os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+        packets = encode_audio_to_opus(input_path, temp_path, target_lufs, verbose=False,
+                                       trim_silence=trim_silence,
+                                       silence_threshold=silence_threshold,
+                                       p3_version=p3_version)
+        # an interrupted run never leaves an output that looks up to date
+        os.replace(temp_path, output_path)
+    except Exception as e:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        return input_path, 0, 0.0, time.process_time() - start, str(e)
+    return (input_path, os.path.getsize(output_path), packets * FRAME_DURATION / 1000,
+            time.process_time() - start, None)
+
+
+def batch_encode(tasks, target_lufs=None, jobs=None, force=False,
+                 trim_silence=False, silence_threshold=-50.0, p3_version=1):
+    """
+    Encode (input, output) pairs with a pool of jobs processes, skipping
+    outputs newer than their input unless force is set. Return a summary dict.
+    """
+    todo = [t for t in tasks if force or not is_up_to_date(*t)]
+    summary = {
+        "files": len(todo),
+        "skipped": len(tasks) - len(todo),
+        "failed": [],
+        "audio_seconds": 0.0,
+        "output_bytes": 0,
+        "cpu_seconds": 0.0,
+        "wall_seconds": 0.0,
+    }
+    if not todo:
+        return summary
+
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = [pool.submit(encode_file, input_path, output_path, target_lufs,
+                               trim_silence, silence_threshold, p3_version)
+                   for input_path, output_path in todo]
+        for future in tqdm.tqdm(as_completed(futures), total=len(futures), unit="file"):
+            input_path, size, seconds, cpu, error = future.result()
+            summary["cpu_seconds"] += cpu
+            if error:
+                summary["failed"].append((input_path, error))
+                continue
+            summary["audio_seconds"] += seconds
+            summary["output_bytes"] += size
+    summary["wall_seconds"] = time.perf_counter() - start
+    return summary
+
+
+def print_summary(summary, jobs):
+    wall = summary["wall_seconds"]
+    done = summary["files"] - len(summary["failed"])
+    print(f"Encoded {done} files, skipped {summary['skipped']} up to date, "
+          f"{len(summary['failed'])} failed")
+    if not wall:
+        return
+    audio = summary["audio_seconds"]
+    print(f"Wall time {wall:.1f}s with {jobs} workers, cpu time {summary['cpu_seconds']:.1f}s")
+    print(f"Throughput {done / wall:.2f} files/s, {audio / wall:.1f}x realtime "
+          f"({audio:.1f}s audio), {summary['output_bytes'] / 1024 / wall:.1f} KiB/s output")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Convert many audio files to p3 in parallel')
+    parser.add_argument('inputs', nargs='+',
+                        help='Input audio files, directories or glob patterns like "audio/**/*.wav"')
+    parser.add_argument('-o', '--output-dir', default='output',
+                        help='Output directory (default: output)')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(),
+                        help='Number of worker processes (default: number of CPUs)')
+    parser.add_argument('-f', '--force', action='store_true',
+                        help='Encode even if the output is newer than the input, needed '
+                        'after changing -l, -d, -t, --silence-threshold or --v2, as only '
+                        'modification times are compared')
+    parser.add_argument('-l', '--lufs', type=float, default=-16.0,
+                       help='Target loudness in LUFS (default: -16)')
+    parser.add_argument('-d', '--disable-loudnorm', action='store_true',
+                       help='Disable loudness normalization')
+    parser.add_argument('-t', '--trim-silence', action='store_true',
+                       help='Trim leading and trailing silence')
+    parser.add_argument('--silence-threshold', type=float, default=-50.0,
+                       help='Level below which audio counts as silence, in dBFS (default: -50)')
+    parser.add_argument('--v2', dest='p3_version', action='store_const', const=2, default=1,
+                       help='Write the p3 v2 container with header and seek index')
+    args = parser.parse_args()
+    if args.jobs is not None and args.jobs < 1:
+        parser.error(f"--jobs must be at least 1: {args.jobs}")
+
+    try:
+        tasks = collect_files(args.inputs, args.output_dir)
+    except ValueError as e:
+        print(f"Output name collision:\n{e}", file=sys.stderr)
+        sys.exit(1)
+    if not tasks:
+        print("No input files found", file=sys.stderr)
+        sys.exit(1)
+
+    target_lufs = None if args.disable_loudnorm else args.lufs
+    if target_lufs is not None:
+        print("Note: Automatic loudness adjustment is enabled, use `-d` to disable it", file=sys.stderr)
+        print("      for audio already loudness-adjusted or from TTS.", file=sys.stderr)
+
+    summary = batch_encode(tasks, target_lufs, args.jobs, args.force,
+                           args.trim_silence, args.silence_threshold, args.p3_version)
+    for input_path, error in summary["failed"]:
+        print(f"Failed: {input_path}: {error}", file=sys.stderr)
+    print_summary(summary, args.jobs)
+    if summary["failed"]:
+        sys.exit(1)
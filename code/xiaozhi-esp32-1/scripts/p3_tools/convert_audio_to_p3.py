@@ -1,52 +1,368 @@
 # convert audio files to protocol v3 stream
 import librosa
 import opuslib
-import struct
 import sys
+import math
 import tqdm
 import numpy as np
 import argparse
-import pyloudnorm as pyln
-
-def encode_audio_to_opus(input_file, output_file, target_lufs=None):
-    # Load audio file using librosa
-    audio, sample_rate = librosa.load(input_file, sr=None, mono=False, dtype=np.float32)
-    
-    # Convert to mono if stereo
-    if audio.ndim == 2:
-        audio = librosa.to_mono(audio)
-    
-    if target_lufs is not None:
-        print("Note: Automatic loudness adjustment is enabled, which may cause", file=sys.stderr) 
+import warnings
+import soundfile as sf
+from scipy import signal
+from p3_file import P3Writer
+
+TARGET_SAMPLE_RATE = 16000
+FRAME_DURATION = 60  # ms per opus packet
+BLOCK_SIZE = 65536  # source samples read at a time
+
+
+class StreamingResampler:
+    """
+    Polyphase resampler that keeps its filter history between blocks, so a
+    long file can be resampled block by block. Uses the same filter and
+    output alignment as scipy.signal.resample_poly.
+    """
+
+    def __init__(self, orig_sr, target_sr):
+        g = math.gcd(orig_sr, target_sr)
+        self.up = target_sr // g
+        self.down = orig_sr // g
+        self.n_in = 0
+        self.n_out = 0
+        if self.up == self.down == 1:
+            return
+
+        max_rate = max(self.up, self.down)
+        self.half_len = 10 * max_rate
+        h = signal.firwin(2 * self.half_len + 1, 1. / max_rate,
+                          window=('kaiser', 5.0)) * self.up
+
+        # phase p of the filter is h[p], h[p + up], h[p + 2 * up] ...
+        self.taps = -(-len(h) // self.up)
+        padded = np.zeros(self.taps * self.up)
+        padded[:len(h)] = h
+        self.phases = padded.reshape(self.taps, self.up).T.astype(np.float32)
+
+        # input samples kept from previous blocks, starting at sample start,
+        # the signal is zero before sample 0
+        self.start = -self.taps
+        self.buffer = np.zeros(self.taps, dtype=np.float32)
+
+    def _output(self, count):
+        n = np.arange(self.n_out, self.n_out + count)
+        pos = n * self.down + self.half_len
+        newest = pos // self.up - self.start
+        index = newest[:, None] - np.arange(self.taps)[None, :]
+        out = (self.buffer[index] * self.phases[pos % self.up]).sum(axis=1)
+        self.n_out += count
+
+        # drop input no longer needed by the next output
+        first = (self.n_out * self.down + self.half_len) // self.up
+        drop = max(0, first - self.taps + 1 - self.start)
+        self.buffer = self.buffer[drop:]
+        self.start += drop
+        return out
+
+    def _ready(self, end):
+        # outputs whose newest input sample is before end
+        last = (end * self.up - 1 - self.half_len) // self.down
+        return max(0, last + 1 - self.n_out)
+
+    def process(self, block):
+        """
+        Resample next block of mono float samples
+        """
+        self.n_in += len(block)
+        if self.up == self.down == 1:
+            return block
+        self.buffer = np.concatenate((self.buffer, block.astype(np.float32)))
+        return self._output(self._ready(self.start + len(self.buffer)))
+
+    def flush(self):
+        """
+        Return the rest of the output after the last block
+        """
+        if self.up == self.down == 1:
+            return np.zeros(0, dtype=np.float32)
+        total = -(-self.n_in * self.up // self.down)
+        # the signal is zero after the end as well
+        zeros = self.half_len // self.up + self.taps
+        self.buffer = np.concatenate((self.buffer,
+                                      np.zeros(zeros, dtype=np.float32)))
+        return self._output(max(0, total - self.n_out))
+
+
+def k_weighting(rate):
+    """
+    (b, a) of the two K-weighting biquads of BS.1770 at the given rate: a
+    high shelf for the head, and a high pass. Same coefficients as pyloudnorm.
+    """
+    def biquad(kind, gain, q, fc):
+        A = 10 ** (gain / 40.0)
+        w0 = 2.0 * np.pi * fc / rate
+        alpha = np.sin(w0) / (2.0 * q)
+        cos = np.cos(w0)
+        if kind == 'high_shelf':
+            b = [A * ((A + 1) + (A - 1) * cos + 2 * np.sqrt(A) * alpha),
+                 -2 * A * ((A - 1) + (A + 1) * cos),
+                 A * ((A + 1) + (A - 1) * cos - 2 * np.sqrt(A) * alpha)]
+            a = [(A + 1) - (A - 1) * cos + 2 * np.sqrt(A) * alpha,
+                 2 * ((A - 1) - (A + 1) * cos),
+                 (A + 1) - (A - 1) * cos - 2 * np.sqrt(A) * alpha]
+        else:
+            b = [(1 + cos) / 2, -(1 + cos), (1 + cos) / 2]
+            a = [1 + alpha, -2 * cos, 1 - alpha]
+        return np.array(b) / a[0], np.array(a) / a[0]
+
+    return [biquad('high_shelf', 4.0, 1 / np.sqrt(2), 1500.0),
+            biquad('high_pass', 0.0, 0.5, 38.0)]
+
+
+class StreamingLoudness:
+    """
+    Integrated loudness of ITU-R BS.1770-4, measured block by block. Gives
+    the same result as pyloudnorm Meter.integrated_loudness for mono audio,
+    but keeps only the energy of every 100 ms instead of the whole signal.
+    """
+
+    def __init__(self, rate, block_size=0.400, overlap=0.75):
+        self.rate = rate
+        self.block_size = block_size
+        self.step = 1.0 - overlap
+        # K-weighting, state is carried between blocks
+        self.filters = [(b, a, np.zeros(2)) for b, a in k_weighting(rate)]
+        self.energy = []  # sum of squares of each 100 ms
+        self.partial = 0.0
+        self.n = 0
+
+    def _boundary(self, k):
+        return int(self.block_size * (k * self.step) * self.rate)
+
+    def process(self, block):
+        data = block.astype(np.float64)
+        for i, (b, a, zi) in enumerate(self.filters):
+            data, zi = signal.lfilter(b, a, data, zi=zi)
+            self.filters[i] = (b, a, zi)
+
+        square = np.square(data)
+        start = self.n
+        end = self.n + len(square)
+        boundary = self._boundary(len(self.energy) + 1)
+        while boundary <= end:
+            self.partial += square[start - self.n:boundary - self.n].sum()
+            self.energy.append(self.partial)
+            self.partial = 0.0
+            start = boundary
+            boundary = self._boundary(len(self.energy) + 1)
+        self.partial += square[start - self.n:].sum()
+        self.n = end
+
+    def integrated_loudness(self):
+        if self.n < self.block_size * self.rate:
+            raise ValueError("Audio must have length greater than the block size.")
+
+        T = self.n / self.rate
+        num_blocks = int(np.round((T - self.block_size) /
+                                  (self.block_size * self.step))) + 1
+        per_block = int(round(1 / self.step))
+        energy = np.array(self.energy + [self.partial])
+        energy = np.append(energy, np.zeros(max(0, num_blocks + per_block -
+                                                len(energy))))
+        windows = np.lib.stride_tricks.sliding_window_view(energy, per_block)
+        z = windows[:num_blocks].sum(axis=1) / (self.block_size * self.rate)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            loudness = -0.691 + 10.0 * np.log10(z)
+            gated = z[loudness >= -70.0]
+            relative = -0.691 + 10.0 * np.log10(np.mean(gated)) - 10.0
+            gated = z[(loudness > relative) & (loudness > -70.0)]
+            return -0.691 + 10.0 * np.log10(np.mean(gated) if len(gated) else 0.0)
+
+
+class SilenceTrimmer:
+    """
+    Energy based trimming of leading and trailing silence. Audio is cut in
+    windows, a window is silent when its RMS is below threshold dBFS. Up to
+    margin_ms of silence is kept before the first and after the last loud
+    window, so soft onsets and endings are not cut off. Silence between loud
+    windows is kept as is.
+    """
+
+    def __init__(self, rate, threshold=-50.0, window_ms=20, margin_ms=100):
+        self.window = int(rate * window_ms / 1000)
+        self.margin = int(rate * margin_ms / 1000)
+        self.threshold = threshold
+        self.started = False
+        self.lead = np.zeros(0, dtype=np.float32)  # silence before the start
+        self.held = []  # silence after the last loud window
+        self.rest = np.zeros(0, dtype=np.float32)  # incomplete window
+
+    def _loud(self, windows):
+        power = np.mean(np.square(windows, dtype=np.float64), axis=-1)
+        return 10.0 * np.log10(power + 1e-20) > self.threshold
+
+    def _push(self, data, loud):
+        end = len(loud) * self.window if len(loud) else 0
+        if not loud.any():
+            if self.started:
+                self.held.append(data[:end])
+            else:
+                lead = np.concatenate((self.lead, data[:end]))
+                self.lead = lead[max(0, len(lead) - self.margin):]
+            return np.zeros(0, dtype=np.float32)
+
+        index = np.flatnonzero(loud)
+        first = index[0] * self.window
+        last = (index[-1] + 1) * self.window
+        if self.started:
+            out = self.held + [data[:last]]
+        else:
+            lead = np.concatenate((self.lead, data[:first]))
+            out = [lead[max(0, len(lead) - self.margin):], data[first:last]]
+            self.started = True
+        self.held = [data[last:end]]
+        return np.concatenate(out)
+
+    def process(self, block):
+        """
+        Return the part of the block that can be emitted so far
+        """
+        data = np.concatenate((self.rest, block.astype(np.float32)))
+        count = len(data) // self.window
+        self.rest = data[count * self.window:]
+        windows = data[:count * self.window].reshape(count, self.window)
+        return self._push(data, self._loud(windows))
+
+    def flush(self):
+        """
+        Return the rest of the audio after the last block, with the trailing
+        silence cut down to the margin
+        """
+        out = np.zeros(0, dtype=np.float32)
+        if len(self.rest):
+            rest, self.rest = self.rest, np.zeros(0, dtype=np.float32)
+            window, self.window = self.window, len(rest)
+            out = self._push(rest, self._loud(rest[None, :]))
+            self.window = window
+        if not self.started:
+            return out
+        tail = np.concatenate(self.held) if self.held else out[:0]
+        self.held = []
+        return np.concatenate((out, tail[:self.margin]))
+
+
+def read_blocks(input_file, block_size=BLOCK_SIZE):
+    """
+    Yield (sample_rate, total samples, mono float32 block). Files libsndfile
+    can't read (m4a/aac, or mp3 with libsndfile before 1.1) are loaded at
+    once by librosa, so their memory use grows with their length.
+    """
+    try:
+        f = sf.SoundFile(input_file)
+    except (RuntimeError, sf.LibsndfileError):
+        warnings.warn(f"libsndfile can't read {input_file}, loading it whole with "
+                      f"librosa, convert long files to wav or flac first", stacklevel=2)
+        audio, sample_rate = librosa.load(input_file, sr=None, mono=False, dtype=np.float32)
+        if audio.ndim == 2:
+            audio = librosa.to_mono(audio)
+        yield sample_rate, len(audio), audio
+        return
+
+    with f:
+        for block in f.blocks(blocksize=block_size, dtype='float32', always_2d=True):
+            yield f.samplerate, f.frames, block.mean(axis=1)
+
+
+def measure_loudness(input_file):
+    """
+    First pass over the file, return its integrated loudness in LUFS
+    """
+    meter = None
+    for sample_rate, _, block in read_blocks(input_file):
+        if meter is None:
+            meter = StreamingLoudness(sample_rate)
+        meter.process(block)
+    if meter is None:
+        raise ValueError("Audio must have length greater than the block size.")
+    return meter.integrated_loudness()
+
+
+def encode_audio_to_opus(input_file, output_file, target_lufs=None, verbose=True,
+                         trim_silence=False, silence_threshold=-50.0, p3_version=1):
+    """
+    Encode input_file to output_file, return the number of packets written.
+    The last frame is padded with zeros. When trim_silence is set, leading and
+    trailing audio quieter than silence_threshold dBFS is dropped. Input with
+    no audio left, e.g. all silent, is written as one silent frame, so the
+    output is never empty. p3_version 2 writes the indexed container, see
+    p3_file.py.
+    """
+    gain = 1.0
+    if target_lufs is not None and verbose:
+        print("Note: Automatic loudness adjustment is enabled, which may cause", file=sys.stderr)
         print("      audio distortion. If the input audio has already been ", file=sys.stderr)
         print("      loudness-adjusted or if the input audio is TTS audio, ", file=sys.stderr)
         print("      please use the `-d` parameter to disable loudness adjustment.", file=sys.stderr)
-        meter = pyln.Meter(sample_rate)
-        current_loudness = meter.integrated_loudness(audio)
-        audio = pyln.normalize.loudness(audio, current_loudness, target_lufs)
-        print(f"Adjusted loudness: {current_loudness:.1f} LUFS -> {target_lufs} LUFS")
-
-    # Convert sample rate to 16000Hz if necessary
-    target_sample_rate = 16000
-    if sample_rate != target_sample_rate:
-        audio = librosa.resample(audio, orig_sr=sample_rate, target_sr=target_sample_rate)
-        sample_rate = target_sample_rate
-    
-    # Convert audio data back to int16 after processing
-    audio = (audio * 32767).astype(np.int16)
-    
+    if target_lufs is not None:
+        current_loudness = measure_loudness(input_file)
+        gain = np.power(10.0, (target_lufs - current_loudness) / 20.0)
+        if verbose:
+            print(f"Adjusted loudness: {current_loudness:.1f} LUFS -> {target_lufs} LUFS")
+
     # Initialize Opus encoder
+    sample_rate = TARGET_SAMPLE_RATE
     encoder = opuslib.Encoder(sample_rate, 1, opuslib.APPLICATION_AUDIO)
+    frame_size = int(sample_rate * FRAME_DURATION / 1000)
+
+    resampler = None
+    trimmer = SilenceTrimmer(sample_rate, silence_threshold) if trim_silence else None
+    pending = np.zeros(0, dtype=np.int16)
+    clipped = False
+    packets = 0
 
-    # Encode and save
-    with open(output_file, 'wb') as f:
-        duration = 60  # 60ms per frame
-        frame_size = int(sample_rate * duration / 1000)
-        for i in tqdm.tqdm(range(0, len(audio) - frame_size, frame_size)):
-            frame = audio[i:i + frame_size]
+    def encode(audio, writer, last=False):
+        # Convert to int16 and emit every full frame, the last frame is
+        # padded with zeros
+        nonlocal pending, clipped, packets
+        if trimmer is not None:
+            audio = trimmer.process(audio)
+            if last:
+                audio = np.concatenate((audio, trimmer.flush()))
+        if np.max(np.abs(audio), initial=0.0) >= 1.0:
+            clipped = True
+        audio = (np.clip(audio, -1.0, 1.0) * 32767).astype(np.int16)
+        pending = np.concatenate((pending, audio))
+        if last and len(pending) % frame_size:
+            pending = np.pad(pending, (0, frame_size - len(pending) % frame_size))
+        if last and not packets and not len(pending):
+            warnings.warn(f"no audio left in {input_file}, writing one silent frame",
+                          stacklevel=3)
+            pending = np.zeros(frame_size, dtype=np.int16)
+        count = len(pending) // frame_size
+        for i in range(count):
+            frame = pending[i * frame_size:(i + 1) * frame_size]
             opus_data = encoder.encode(frame.tobytes(), frame_size=frame_size)
-            packet = struct.pack('>BBH', 0, 0, len(opus_data)) + opus_data
-            f.write(packet)
+            writer.write_packet(opus_data)
+        pending = pending[count * frame_size:]
+        packets += count
+
+    # Encode and save block by block
+    with open(output_file, 'wb') as f, P3Writer(f, p3_version) as writer, \
+            tqdm.tqdm(unit="sample", unit_scale=True, disable=not verbose) as pbar:
+        for source_rate, total, block in read_blocks(input_file):
+            if resampler is None:
+                # Convert sample rate to 16000Hz if necessary
+                resampler = StreamingResampler(source_rate, sample_rate)
+                pbar.total = total
+            encode(resampler.process(block * gain), writer)
+            pbar.update(len(block))
+
+        tail = resampler.flush() if resampler is not None else np.zeros(0, dtype=np.float32)
+        encode(tail, writer, last=True)
+
+    if clipped and verbose:
+        print("Warning: possible clipped samples in output.", file=sys.stderr)
+    return packets
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Convert audio to Opus with loudness normalization')
@@ -56,7 +372,16 @@ if __name__ == "__main__":
                        help='Target loudness in LUFS (default: -16)')
     parser.add_argument('-d', '--disable-loudnorm', action='store_true',
                        help='Disable loudness normalization')
+    parser.add_argument('-t', '--trim-silence', action='store_true',
+                       help='Trim leading and trailing silence')
+    parser.add_argument('--silence-threshold', type=float, default=-50.0,
+                       help='Level below which audio counts as silence, in dBFS (default: -50)')
+    parser.add_argument('--v2', dest='p3_version', action='store_const', const=2, default=1,
+                       help='Write the p3 v2 container with header and seek index')
     args = parser.parse_args()
 
     target_lufs = None if args.disable_loudnorm else args.lufs
-    encode_audio_to_opus(args.input_file, args.output_file, target_lufs)
\ No newline at end of file
+    encode_audio_to_opus(args.input_file, args.output_file, target_lufs,
+                         trim_silence=args.trim_silence,
+                         silence_threshold=args.silence_threshold,
+                         p3_version=args.p3_version)
@@ -1,44 +1,32 @@
-import struct
 import sys
 import opuslib
 import numpy as np
 from tqdm import tqdm
 import soundfile as sf
+from p3_file import P3File, PACKET_HEADER
 
 
 def decode_p3_to_audio(input_file, output_file):
-    sample_rate = 16000
-    channels = 1
-    decoder = opuslib.Decoder(sample_rate, channels)
-
     pcm_frames = []
-    frame_size = int(sample_rate * 60 / 1000)
-
-    with open(input_file, "rb") as f:
-        f.seek(0, 2)
-        total_size = f.tell()
-        f.seek(0)
-
-        with tqdm(total=total_size, unit="B", unit_scale=True) as pbar:
-            while True:
-                header = f.read(4)
-                if not header or len(header) < 4:
-                    break
 
-                pkt_type, reserved, opus_len = struct.unpack(">BBH", header)
-                opus_data = f.read(opus_len)
-                if len(opus_data) != opus_len:
-                    break
+    with P3File(input_file) as p3:
+        sample_rate = p3.sample_rate
+        channels = p3.channels
+        decoder = opuslib.Decoder(sample_rate, channels)
+        frame_size = p3.frame_size
 
-                pcm = decoder.decode(opus_data, frame_size)
+        with tqdm(total=p3.data_end - p3.data_offset, unit="B", unit_scale=True) as pbar:
+            for opus_data in p3.packets():
+                # packets are memoryviews into the mapped file, opuslib only takes bytes
+                pcm = decoder.decode(bytes(opus_data), frame_size)
                 pcm_frames.append(np.frombuffer(pcm, dtype=np.int16))
 
-                pbar.update(4 + opus_len)
+                pbar.update(PACKET_HEADER.size + len(opus_data))
 
     if not pcm_frames:
         raise ValueError("No valid audio data found")
 
-    pcm_data = np.concatenate(pcm_frames)
+    pcm_data = np.concatenate(pcm_frames).reshape(-1, channels)
 
     sf.write(output_file, pcm_data, sample_rate, subtype="PCM_16")
 
@@ -0,0 +1,281 @@
+# read and write p3 files
+#
+# p3 v1 (legacy) is a bare sequence of packets:
+#     [1 byte type, 1 byte reserved, 2 bytes length, Opus data] ...
+# 16000Hz mono, 60ms per packet.
+#
+# p3 v2 puts a header in front of the same packets, and an index after them:
+#     header: magic "P3V2", version (1 byte), channels (1 byte),
+#             frame duration in ms (2 bytes), sample rate (4 bytes),
+#             frame count (4 bytes), index offset (4 bytes)
+#     packets
+#     index:  file offset of every packet (4 bytes each)
+# All numbers are big endian. Duration and seeking only need the header and
+# the index, without going through the packets.
+import os
+import sys
+import mmap
+import struct
+import argparse
+import warnings
+
+PACKET_HEADER = struct.Struct('>BBH')
+V2_MAGIC = b'P3V2'
+V2_HEADER = struct.Struct('>4sBBHIII')
+INDEX_ENTRY = struct.Struct('>I')
+
+DEFAULT_SAMPLE_RATE = 16000
+DEFAULT_FRAME_DURATION = 60  # ms
+
+
+class P3Writer:
+    """
+    Write opus packets to an opened binary file as p3 v1 or v2. The v2
+    header is completed by close(), so the file must be seekable.
+    """
+
+    def __init__(self, f, version=1, sample_rate=DEFAULT_SAMPLE_RATE,
+                 frame_duration=DEFAULT_FRAME_DURATION, channels=1):
+        if version not in (1, 2):
+            raise ValueError(f"Unknown p3 version: {version}")
+        if version == 1 and (sample_rate != DEFAULT_SAMPLE_RATE or channels != 1
+                             or frame_duration != DEFAULT_FRAME_DURATION):
+            raise ValueError("p3 v1 only supports 16000Hz mono 60ms frames")
+        self.f = f
+        self.version = version
+        self.sample_rate = sample_rate
+        self.frame_duration = frame_duration
+        self.channels = channels
+        self.offsets = []
+        self.start = f.tell()
+        self.closed = False
+        if version == 2:
+            # index offset 0 marks a file whose writer was not closed
+            f.write(self._header(0, 0))
+
+    def _header(self, frame_count, index_offset):
+        return V2_HEADER.pack(V2_MAGIC, 2, self.channels, self.frame_duration,
+                              self.sample_rate, frame_count, index_offset)
+
+    def write_packet(self, opus_data, packet_type=0):
+        self.offsets.append(self.f.tell() - self.start)
+        self.f.write(PACKET_HEADER.pack(packet_type, 0, len(opus_data)))
+        self.f.write(opus_data)
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        if self.version == 1:
+            return
+        index_offset = self.f.tell() - self.start
+        self.f.write(b''.join(INDEX_ENTRY.pack(o) for o in self.offsets))
+        end = self.f.tell()
+        self.f.seek(self.start)
+        self.f.write(self._header(len(self.offsets), index_offset))
+        self.f.seek(end)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class P3FormatError(ValueError):
+    pass
+
+
+class P3File:
+    """
+    Read p3 v1 or v2 files. The file is memory mapped, packets are parsed in
+    place and yielded as memoryview slices of the map, so reading costs no
+    syscall or copy per packet. For v1 files the frame count and the packet
+    offsets need a scan of the packet headers, which is done on first use.
+    """
+
+    def __init__(self, input_file):
+        self.name = input_file
+        with open(input_file, 'rb') as f:
+            self.size = os.fstat(f.fileno()).st_size
+            # mmap keeps its own handle of the file
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if self.size else None
+        self._view = memoryview(self._map if self._map is not None else b'')
+
+        self.version = 1
+        self.sample_rate = DEFAULT_SAMPLE_RATE
+        self.frame_duration = DEFAULT_FRAME_DURATION
+        self.channels = 1
+        self.data_offset = 0
+        self.data_end = self.size
+        self.truncated = None  # offset of the incomplete packet, if any
+        self._index = None
+
+        if self._view[:len(V2_MAGIC)] != V2_MAGIC:
+            return
+        if self.size < V2_HEADER.size:
+            self.close()
+            raise P3FormatError(f"Truncated p3 v2 header in {input_file}")
+
+        (_, version, self.channels, self.frame_duration, self.sample_rate,
+         frame_count, index_offset) = V2_HEADER.unpack_from(self._view)
+        if version != 2 or not self.channels or not self.frame_duration or not self.sample_rate:
+            self.close()
+            raise P3FormatError(f"Invalid p3 v2 header in {input_file}")
+        self.version = 2
+        self.data_offset = V2_HEADER.size
+
+        if index_offset == 0:
+            # the writer was interrupted, the packets are scanned to the end
+            return
+        if index_offset < self.data_offset:
+            self.close()
+            raise P3FormatError(f"Invalid p3 v2 index offset in {input_file}")
+        self.data_end = min(index_offset, self.size)
+        index_end = index_offset + frame_count * INDEX_ENTRY.size
+        if index_end > self.size:
+            # index cut off, the packets before it are scanned
+            return
+        index = [o for o, in INDEX_ENTRY.iter_unpack(self._view[index_offset:index_end])]
+        if any(not self.data_offset <= o < self.data_end for o in index) or \
+                any(a >= b for a, b in zip(index, index[1:])):
+            self.close()
+            raise P3FormatError(f"Invalid p3 v2 index in {input_file}")
+        self._index = index
+
+    def _walk(self, offset):
+        """
+        Yield (packet offset, payload start, payload end) of the packets from
+        offset on, until the end of data or an incomplete packet
+        """
+        view = self._view
+        data_end = self.data_end
+        unpack = PACKET_HEADER.unpack_from
+        while offset + PACKET_HEADER.size <= data_end:
+            _, reserved, length = unpack(view, offset)
+            if reserved != 0 or length == 0:
+                raise P3FormatError(f"Invalid packet header at byte {offset} of {self.name}")
+            begin = offset + PACKET_HEADER.size
+            end = begin + length
+            if end > data_end:
+                break
+            yield offset, begin, end
+            offset = end
+        if offset < data_end:
+            self.truncated = offset
+
+    def _scan(self):
+        return [offset for offset, _, _ in self._walk(self.data_offset)]
+
+    @property
+    def index(self):
+        """
+        File offset of every packet
+        """
+        if self._index is None:
+            self._index = self._scan()
+        return self._index
+
+    @property
+    def frame_count(self):
+        return len(self.index)
+
+    @property
+    def frame_size(self):
+        """
+        Samples per channel in a frame
+        """
+        return self.sample_rate * self.frame_duration // 1000
+
+    @property
+    def duration(self):
+        return self.frame_count * self.frame_duration / 1000
+
+    def frame_at(self, seconds):
+        """
+        Index of the frame playing at the given time
+        """
+        return min(max(0, int(seconds * 1000 // self.frame_duration)), self.frame_count)
+
+    def packets(self, start=0, strict=False):
+        """
+        Yield opus data of every packet from frame start on, as memoryview
+        slices valid while the file is open. An incomplete last packet is
+        reported with a warning, or raises P3FormatError if strict is set.
+        """
+        if start:
+            if start >= self.frame_count:
+                return
+            offset = self.index[start]
+        else:
+            offset = self.data_offset
+        # same as _walk, inlined as this is the loop of every decode
+        view = self._view
+        data_end = self.data_end
+        unpack = PACKET_HEADER.unpack_from
+        while offset + PACKET_HEADER.size <= data_end:
+            _, reserved, length = unpack(view, offset)
+            if reserved != 0 or length == 0:
+                raise P3FormatError(f"Invalid packet header at byte {offset} of {self.name}")
+            begin = offset + PACKET_HEADER.size
+            offset = begin + length
+            if offset > data_end:
+                offset = begin - PACKET_HEADER.size
+                break
+            yield view[begin:offset]
+        if offset < data_end:
+            self.truncated = offset
+
+        if self.truncated is not None:
+            message = (f"{self.name} is truncated, packet at byte {self.truncated} "
+                       f"is incomplete")
+            if strict:
+                raise P3FormatError(message)
+            warnings.warn(message, stacklevel=2)
+
+    def close(self):
+        self._view.release()
+        if self._map is not None:
+            try:
+                self._map.close()
+            except BufferError:
+                # packets still referenced, unmapped once they are released
+                pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def convert_p3(input_file, output_file, version=2):
+    """
+    Rewrite input_file as the given p3 version without re-encoding
+    """
+    with P3File(input_file) as p3, open(output_file, 'wb') as f:
+        with P3Writer(f, version, p3.sample_rate, p3.frame_duration, p3.channels) as writer:
+            for opus_data in p3.packets():
+                writer.write_packet(opus_data)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Show information of p3 files, or convert them between versions')
+    parser.add_argument('files', nargs='+', help='p3 files')
+    parser.add_argument('-c', '--convert', metavar='OUTPUT',
+                        help='Convert the single input file to OUTPUT')
+    parser.add_argument('-v', '--version', type=int, choices=(1, 2), default=2,
+                        help='p3 version of the converted file (default: 2)')
+    args = parser.parse_args()
+
+    if args.convert:
+        if len(args.files) != 1:
+            print("--convert takes exactly one input file", file=sys.stderr)
+            sys.exit(1)
+        convert_p3(args.files[0], args.convert, args.version)
+        sys.exit(0)
+
+    for input_file in args.files:
+        with P3File(input_file) as p3:
+            print(f"{input_file}: p3 v{p3.version}, {p3.sample_rate}Hz, {p3.channels}ch, "
+                  f"{p3.frame_duration}ms x {p3.frame_count} frames, {p3.duration:.2f}s")
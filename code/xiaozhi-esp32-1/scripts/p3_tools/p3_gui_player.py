@@ -3,73 +3,61 @@ from tkinter import filedialog, messagebox
 import threading
 import time
 import opuslib
-import struct
 import numpy as np
 import sounddevice as sd
 import os
+from p3_file import P3File
 
 
 def play_p3_file(input_file, stop_event=None, pause_event=None):
     """
-    播放p3格式的音频文件
+    播放p3格式的音频文件，支持v1和v2格式
     p3格式: [1字节类型, 1字节保留, 2字节长度, Opus数据]
     """
-    # 初始化Opus解码器
-    sample_rate = 16000  # 采样率固定为16000Hz
-    channels = 1  # 单声道
-    decoder = opuslib.Decoder(sample_rate, channels)
-    
-    # 帧大小 (60ms)
-    frame_size = int(sample_rate * 60 / 1000)
-    
-    # 打开音频流
-    stream = sd.OutputStream(
-        samplerate=sample_rate,
-        channels=channels,
-        dtype='int16'
-    )
-    stream.start()
-    
-    try:
-        with open(input_file, 'rb') as f:
+    with P3File(input_file) as p3:
+        # 初始化Opus解码器，v1固定为16000Hz单声道
+        sample_rate = p3.sample_rate
+        channels = p3.channels
+        decoder = opuslib.Decoder(sample_rate, channels)
+        
+        # 帧大小 (v1为60ms)
+        frame_size = p3.frame_size
+        
+        # 打开音频流
+        stream = sd.OutputStream(
+            samplerate=sample_rate,
+            channels=channels,
+            dtype='int16'
+        )
+        stream.start()
+        
+        try:
             print(f"正在播放: {input_file}")
             
-            while True:
-                if stop_event and stop_event.is_set():
-                    break
-
-                if pause_event and pause_event.is_set():
+            for opus_data in p3.packets():
+                while pause_event and pause_event.is_set():
+                    if stop_event and stop_event.is_set():
+                        break
                     time.sleep(0.1)
-                    continue
 
-                # 读取头部 (4字节)
-                header = f.read(4)
-                if not header or len(header) < 4:
-                    break
-                
-                # 解析头部
-                packet_type, reserved, data_len = struct.unpack('>BBH', header)
-                
-                # 读取Opus数据
-                opus_data = f.read(data_len)
-                if not opus_data or len(opus_data) < data_len:
+                if stop_event and stop_event.is_set():
                     break
-                
-                # 解码Opus数据
-                pcm_data = decoder.decode(opus_data, frame_size)
+
+                # 解码Opus数据 (opus_data是映射文件的memoryview，opuslib只接受bytes)
+                pcm_data = decoder.decode(bytes(opus_data), frame_size)
                 
                 # 将字节转换为numpy数组
-                audio_array = np.frombuffer(pcm_data, dtype=np.int16)
+                audio_array = np.frombuffer(pcm_data, dtype=np.int16).reshape(-1, channels)
                 
                 # 播放音频
                 stream.write(audio_array)
                 
-    except KeyboardInterrupt:
-        print("\n播放已停止")
-    finally:
-        stream.stop()
-        stream.close()
-        print("播放完成")
+        except KeyboardInterrupt:
+            print("\n播放已停止")
+        finally:
+            stream.stop()
+            stream.close()
+            print("播放完成")
 
 
 class P3PlayerApp:
@@ -1,71 +1,61 @@
 # 播放p3格式的音频文件
 import opuslib
-import struct
 import numpy as np
 import sounddevice as sd
 import argparse
+from p3_file import P3File
 
-def play_p3_file(input_file):
+def play_p3_file(input_file, start=0):
     """
-    播放p3格式的音频文件
+    播放p3格式的音频文件，支持v1和v2格式，start为开始播放的秒数
     p3格式: [1字节类型, 1字节保留, 2字节长度, Opus数据]
     """
-    # 初始化Opus解码器
-    sample_rate = 16000  # 采样率固定为16000Hz
-    channels = 1  # 单声道
-    decoder = opuslib.Decoder(sample_rate, channels)
-    
-    # 帧大小 (60ms)
-    frame_size = int(sample_rate * 60 / 1000)
-    
-    # 打开音频流
-    stream = sd.OutputStream(
-        samplerate=sample_rate,
-        channels=channels,
-        dtype='int16'
-    )
-    stream.start()
-    
-    try:
-        with open(input_file, 'rb') as f:
-            print(f"正在播放: {input_file}")
+    with P3File(input_file) as p3:
+        # 初始化Opus解码器，v1固定为16000Hz单声道
+        sample_rate = p3.sample_rate
+        channels = p3.channels
+        decoder = opuslib.Decoder(sample_rate, channels)
+        
+        # 帧大小 (v1为60ms)
+        frame_size = p3.frame_size
+        
+        # 打开音频流
+        stream = sd.OutputStream(
+            samplerate=sample_rate,
+            channels=channels,
+            dtype='int16'
+        )
+        stream.start()
+        
+        try:
+            print(f"正在播放: {input_file} ({p3.duration:.2f}秒)")
             
-            while True:
-                # 读取头部 (4字节)
-                header = f.read(4)
-                if not header or len(header) < 4:
-                    break
-                
-                # 解析头部
-                packet_type, reserved, data_len = struct.unpack('>BBH', header)
-                
-                # 读取Opus数据
-                opus_data = f.read(data_len)
-                if not opus_data or len(opus_data) < data_len:
-                    break
-                
-                # 解码Opus数据
-                pcm_data = decoder.decode(opus_data, frame_size)
+            # 从指定位置开始读取Opus数据
+            for opus_data in p3.packets(p3.frame_at(start)):
+                # 解码Opus数据 (opus_data是映射文件的memoryview，opuslib只接受bytes)
+                pcm_data = decoder.decode(bytes(opus_data), frame_size)
                 
                 # 将字节转换为numpy数组
-                audio_array = np.frombuffer(pcm_data, dtype=np.int16)
+                audio_array = np.frombuffer(pcm_data, dtype=np.int16).reshape(-1, channels)
                 
                 # 播放音频
                 stream.write(audio_array)
                 
-    except KeyboardInterrupt:
-        print("\n播放已停止")
-    finally:
-        stream.stop()
-        stream.close()
-        print("播放完成")
+        except KeyboardInterrupt:
+            print("\n播放已停止")
+        finally:
+            stream.stop()
+            stream.close()
+            print("播放完成")
 
 def main():
     parser = argparse.ArgumentParser(description='播放p3格式的音频文件')
     parser.add_argument('input_file', help='输入的p3文件路径')
+    parser.add_argument('-s', '--start', type=float, default=0,
+                        help='开始播放的位置（秒）')
     args = parser.parse_args()
     
-    play_p3_file(args.input_file)
+    play_p3_file(args.input_file, args.start)
 
 if __name__ == "__main__":
     main() 
@@ -0,0 +1,158 @@
+# round-trip and truncation tests of p3_file.py, run directly or with pytest
+import os
+import random
+import tempfile
+import warnings
+
+from p3_file import P3File, P3FormatError, P3Writer, convert_p3, PACKET_HEADER, V2_HEADER
+
+
+def make_packets(count=20, seed=0):
+    rnd = random.Random(seed)
+    return [bytes(rnd.randrange(256) for _ in range(rnd.randrange(1, 200)))
+            for _ in range(count)]
+
+
+def write_p3(filename, packets, version, close=True, **options):
+    with open(filename, 'wb') as f:
+        writer = P3Writer(f, version, **options)
+        for opus_data in packets:
+            writer.write_packet(opus_data)
+        if close:
+            writer.close()
+
+
+def read_p3(filename, start=0, strict=False):
+    with P3File(filename) as p3:
+        return [bytes(p) for p in p3.packets(start, strict)]
+
+
+def test_round_trip():
+    packets = make_packets()
+    with tempfile.TemporaryDirectory() as tmp:
+        for version in (1, 2):
+            filename = os.path.join(tmp, f'v{version}.p3')
+            write_p3(filename, packets, version)
+            with P3File(filename) as p3:
+                assert p3.version == version
+                assert p3.frame_count == len(packets)
+                assert p3.duration == len(packets) * 0.06
+                assert p3.frame_at(0.13) == 2
+            assert read_p3(filename) == packets
+            assert read_p3(filename, start=5) == packets[5:]
+            assert read_p3(filename, start=len(packets)) == []
+
+        # v2 keeps other stream parameters
+        filename = os.path.join(tmp, 'v2_48k.p3')
+        write_p3(filename, packets, 2, sample_rate=48000, frame_duration=20, channels=2)
+        with P3File(filename) as p3:
+            assert (p3.sample_rate, p3.frame_duration, p3.channels) == (48000, 20, 2)
+            assert p3.frame_size == 960
+
+        # conversion between versions keeps the packets
+        convert_p3(os.path.join(tmp, 'v1.p3'), os.path.join(tmp, 'v1_v2.p3'), 2)
+        convert_p3(os.path.join(tmp, 'v1_v2.p3'), os.path.join(tmp, 'v2_v1.p3'), 1)
+        assert read_p3(os.path.join(tmp, 'v1_v2.p3')) == packets
+        with open(os.path.join(tmp, 'v1.p3'), 'rb') as a, open(os.path.join(tmp, 'v2_v1.p3'), 'rb') as b:
+            assert a.read() == b.read()
+
+
+def truncate(filename, size):
+    with open(filename, 'r+b') as f:
+        f.truncate(size)
+
+
+def test_truncated_packet():
+    packets = make_packets()
+    with tempfile.TemporaryDirectory() as tmp:
+        for version in (1, 2):
+            filename = os.path.join(tmp, f'v{version}.p3')
+            # v2 cut in the packets loses the index as well
+            write_p3(filename, packets, version)
+            with P3File(filename) as p3:
+                last = p3.index[-1]
+
+            # last packet cut in its opus data, then in its header
+            for size in (last + PACKET_HEADER.size + 1, last + 2):
+                truncate(filename, size)
+                with warnings.catch_warnings(record=True) as caught:
+                    warnings.simplefilter('always')
+                    assert read_p3(filename) == packets[:-1]
+                assert any('truncated' in str(w.message) for w in caught)
+                try:
+                    read_p3(filename, strict=True)
+                except P3FormatError:
+                    pass
+                else:
+                    raise AssertionError(f"no P3FormatError from v{version} cut at {size}")
+                with P3File(filename) as p3:
+                    assert p3.frame_count == len(packets) - 1
+                    assert p3.truncated == p3.index[-1] + PACKET_HEADER.size + len(packets[-2])
+
+
+def test_truncated_index():
+    packets = make_packets()
+    with tempfile.TemporaryDirectory() as tmp:
+        filename = os.path.join(tmp, 'v2.p3')
+        write_p3(filename, packets, 2)
+        size = os.path.getsize(filename)
+        # index cut in the middle, or lost entirely
+        for cut in (size - 2, size - 4 * len(packets)):
+            truncate(filename, cut)
+            with warnings.catch_warnings():
+                warnings.simplefilter('error')
+                assert read_p3(filename) == packets
+                assert read_p3(filename, start=3) == packets[3:]
+            with P3File(filename) as p3:
+                assert p3.frame_count == len(packets)
+
+
+def test_unclosed_writer():
+    packets = make_packets()
+    with tempfile.TemporaryDirectory() as tmp:
+        filename = os.path.join(tmp, 'v2.p3')
+        write_p3(filename, packets, 2, close=False)
+        with P3File(filename) as p3:
+            assert p3.version == 2
+            assert p3.frame_count == len(packets)
+        assert read_p3(filename) == packets
+
+
+def test_invalid():
+    with tempfile.TemporaryDirectory() as tmp:
+        filename = os.path.join(tmp, 'bad.p3')
+        write_p3(filename, make_packets(), 2)
+        with open(filename, 'rb') as f:
+            data = f.read()
+
+        cases = [
+            data[:V2_HEADER.size - 1],  # header cut
+            data[:4] + b'\x03' + data[5:],  # unknown version
+            data[:16] + b'\x00\x00\x00\x08' + data[20:],  # index inside header
+            data[:V2_HEADER.size + 1] + b'\x01' + data[V2_HEADER.size + 2:],  # reserved byte set
+        ]
+        for i, case in enumerate(cases):
+            with open(filename, 'wb') as f:
+                f.write(case)
+            try:
+                read_p3(filename)
+            except P3FormatError:
+                pass
+            else:
+                raise AssertionError(f"no P3FormatError from invalid case {i}")
+
+        try:
+            P3Writer(None, 3)
+        except ValueError:
+            pass
+        else:
+            raise AssertionError("no ValueError from p3 version 3")
+
+
+if __name__ == "__main__":
+    test_round_trip()
+    test_truncated_packet()
+    test_truncated_index()
+    test_unclosed_writer()
+    test_invalid()
+    print("all tests passed")